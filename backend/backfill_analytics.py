@@ -0,0 +1,27 @@
+from .database import SessionLocal, engine, Base
+from . import migrations
+from .services import analytics
+
+
+def backfill_analytics():
+    """Пересобирает сводные таблицы аналитики (result_type_counts, result_axis_bins).
+
+    Сводка ведется вместе с ответами и отчетами; пересборка нужна, если результаты
+    меняли в обход приложения (ручные правки в базе). Запуск безопасен в любой момент.
+    """
+    Base.metadata.create_all(bind=engine)
+    migrations.run_migrations(engine)
+    db = SessionLocal()
+    try:
+        analytics.rebuild(db)
+        db.commit()
+        print("🚀 Готово: сводка аналитики пересобрана")
+    except Exception as e:
+        print(f"💥 Ошибка при пересборке сводки аналитики: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    backfill_analytics()
@@ -0,0 +1,68 @@
+from datetime import datetime
+
+from sqlalchemy import func
+
+from .database import SessionLocal, engine, Base
+from . import models, migrations
+from .services import analytics, answers
+from .services.dashboard import STATIC_TEST_STEPS
+
+
+def _completed_at(db, row: models.UserAnswerVector) -> datetime:
+    """Когда тест пройден, если это не записано: как в миграции 0004 — время изменения вектора.
+
+    У нового вектора его нет — берется первая реплика чата (чат идет после теста),
+    и только без нее — текущий момент.
+    """
+    if row.updated_at is not None:
+        return row.updated_at
+    first_message = db.query(func.min(models.ChatMessage.timestamp)).filter(
+        models.ChatMessage.user_id == row.user_id
+    ).scalar()
+    return first_message or datetime.utcnow()
+
+
+def backfill_answer_vectors():
+    """Собирает user_answer_vectors из накопленных строк user_answers.
+
+    Нужен один раз для ответов, сохраненных до появления векторов.
+    Повторный запуск безопасен: вектор каждого пользователя пересобирается целиком.
+    """
+    Base.metadata.create_all(bind=engine)
+    migrations.run_migrations(engine)
+    db = SessionLocal()
+    built = 0
+    try:
+        user_ids = db.query(models.UserAnswer.user_id).distinct().all()
+        existing = {row.user_id: row for row in db.query(models.UserAnswerVector).all()}
+        for (user_id,) in user_ids:
+            vector = answers.build_vector(db, user_id)
+            row = existing.get(user_id)
+            if row is None:
+                db.add(vector)
+                row = vector
+            else:
+                for column in models.UserAnswerVector.__table__.columns.keys():
+                    if column not in ("user_id", "updated_at", "completed_at"):
+                        setattr(row, column, getattr(vector, column))
+            if row.completed_at is None and row.answered >= STATIC_TEST_STEPS:
+                row.completed_at = _completed_at(db, row)
+            # Шаг теста — число разных отвеченных вопросов, как и при новых ответах
+            user = db.get(models.User, user_id)
+            if user is not None:
+                user.current_static_step = row.answered
+            built += 1
+        # Векторы собраны в обход save_answers — сводку аналитики пересчитываем целиком
+        db.flush()
+        analytics.rebuild(db)
+        db.commit()
+        print(f"🚀 Готово: собрано {built} векторов ответов")
+    except Exception as e:
+        print(f"💥 Ошибка при заполнении user_answer_vectors: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    backfill_answer_vectors()
@@ -0,0 +1,28 @@
+from .database import SessionLocal, engine, Base
+from . import migrations
+from .services import reports
+
+
+def backfill_reports():
+    """Разбирает уже сохраненные реплики и заполняет ai_reports.
+
+    Миграция 0005 делает это сама для отчетов, которых еще нет в ai_reports;
+    скрипт перезаписывает отчет каждого источника последним найденным в репликах.
+    Повторный запуск безопасен.
+    """
+    Base.metadata.create_all(bind=engine)
+    migrations.run_migrations(engine)
+    db = SessionLocal()
+    try:
+        found = reports.backfill_from_messages(db)
+        db.commit()
+        print(f"🚀 Готово: в ai_reports записано {found} отчетов")
+    except Exception as e:
+        print(f"💥 Ошибка при заполнении ai_reports: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    backfill_reports()
@@ -1,28 +1,166 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import Select, TextClause, create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql.dml import UpdateBase
 
-# 1. Проверяем, передал ли нам Docker адрес базы данных. 
+# 1. Проверяем, передал ли нам Docker адрес базы данных.
 # Если нет (запуск локально) — используем ваш привычный sqlite
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
 
+# Пул соединений (для каждого движка — синхронного и асинхронного — свой)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Соединения старше RECYCLE секунд пересоздаются (Postgres/прокси рвут долгие простои)
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Проверка соединения перед выдачей из пула
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() not in ("0", "false", "no")
+
+
+def _async_url(url: str) -> str:
+    """Тот же адрес базы, но с асинхронным драйвером: aiosqlite / asyncpg."""
+    scheme, sep, rest = url.partition("://")
+    if scheme.startswith("sqlite"):
+        return f"sqlite+aiosqlite{sep}{rest}"
+    if scheme.startswith("postgres"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(SQLALCHEMY_DATABASE_URL))
+
+
+def _pool_options(url: str) -> dict:
+    # База SQLite в памяти живет в одном соединении — пул для нее не настраиваем
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":")):
+        return {}
+    return {
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_recycle": POOL_RECYCLE,
+        "pool_pre_ping": POOL_PRE_PING,
+    }
+
+
+# Профиль SQLite для одиночного сервера (SQLITE_TUNED=1): WAL, прагмы и один пишущий коннект
+SQLITE_TUNED = os.getenv("SQLITE_TUNED", "0").lower() in ("1", "true", "yes")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL: читатели не ждут писателя, писатель не ждет читателей
+    cursor.execute("PRAGMA journal_mode=WAL")
+    # В WAL режим NORMAL не теряет целостность, только последние транзакции при сбое питания
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def _is_write(clause) -> bool:
+    if isinstance(clause, (UpdateBase, TextClause)):
+        return True
+    # SELECT ... FOR UPDATE — чтение перед записью, оно идет через пишущий коннект
+    return isinstance(clause, Select) and clause._for_update_arg is not None
+
+
+class RoutingSession(Session):
+    """Сессия, которая пишет через единственный пишущий коннект, а читает из общего пула.
+
+    После первой записи транзакция целиком остается на пишущем коннекте,
+    чтобы видеть собственные незакоммиченные изменения. Пишущий пул
+    из одного соединения сам выстраивает писателей в очередь — вместо
+    "database is locked" они ждут свободный коннект.
+    """
+    reader = None
+    writer = None
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.info.get("writing") or self._flushing or _is_write(clause):
+            self.info["writing"] = True
+            return self.writer
+        return self.reader
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _release_writer(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("writing", None)
+
+
+def _routing_session(reader, writer):
+    return type("RoutingSession", (RoutingSession,), {"reader": reader, "writer": writer})
+
+
+def _create_engines(url: str, create, **extra):
+    """(читающий, пишущий) движки; без профиля SQLite это один и тот же движок."""
+    if not url.startswith("sqlite"):
+        engine = create(url, **_pool_options(url))
+        return engine, engine
+    engine = create(url, **extra, **_pool_options(url))
+    if not SQLITE_TUNED or not _pool_options(url):
+        return engine, engine
+    # Локальный файл не рвет соединение — pre-ping на пишущем коннекте только удлиняет очередь
+    writer = create(url, **extra, **{**_pool_options(url), "pool_size": 1, "max_overflow": 0, "pool_pre_ping": False})
+    for target in (engine, writer):
+        sync_target = getattr(target, "sync_engine", target)
+        event.listen(sync_target, "connect", _sqlite_pragmas)
+    return engine, writer
+
+
 # 2. Настройка движка
 # Для SQLite нужен параметр check_same_thread, а для PostgreSQL он не нужен
-if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+engine, writer_engine = _create_engines(
+    SQLALCHEMY_DATABASE_URL, create_engine, connect_args={"check_same_thread": False}
+)
+
+# 3. Асинхронный движок для async-обработчиков: запросы не занимают потоки threadpool
+async_engine, async_writer_engine = _create_engines(ASYNC_DATABASE_URL, create_async_engine)
+
+if writer_engine is engine:
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine, autoflush=False, expire_on_commit=False
     )
 else:
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    SessionLocal = sessionmaker(
+        class_=_routing_session(engine, writer_engine), autocommit=False, autoflush=False
+    )
+    AsyncSessionLocal = async_sessionmaker(
+        sync_session_class=_routing_session(async_engine.sync_engine, async_writer_engine.sync_engine),
+        autoflush=False, expire_on_commit=False
+    )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async def dispose_async_engines():
+    await async_engine.dispose()
+    if async_writer_engine is not async_engine:
+        await async_writer_engine.dispose()
 
 Base = declarative_base()
 
+def dialect_insert(db, model):
+    """INSERT с поддержкой ON CONFLICT (upsert) для диалекта текущей сессии."""
+    dialect = sqlite if db.get_bind().dialect.name == "sqlite" else postgresql
+    return dialect.insert(model)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """Аналог get_db для async-обработчиков (Depends(get_async_db))."""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,22 +1,44 @@
 import os
 import json
+import time
 import logging  
 import sys
-import re
 import asyncio
-import websockets
-from typing import List
-from dotenv import load_dotenv
-from openai import OpenAI
-from fastapi import FastAPI, Depends, HTTPException, WebSocket, WebSocketDisconnect, Body, Query
+import anyio
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import List, Optional
+from urllib.parse import quote
+from fastapi import FastAPI, Depends, HTTPException, WebSocket, Body, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 # Локальные импорты проекта
-from . import models, schemas, database
+from . import models, schemas, database, migrations
 from .prompts import SYSTEM_PROMPT
-from backend.services.report_generator import create_pdf_report
+from backend.services import pdf_service
+from backend.services import bulk_export
+from backend.services import dashboard
+from backend.services.openai_client import REALTIME_MODEL, REALTIME_URL, get_async_client, close_async_client
+from backend.services.chat_stream import ClosingStreamingResponse, sse_event
+from backend.services import report_parser
+from backend.services import chat_context
+from backend.services.conversation_cache import ConversationState, conversation_cache
+from backend.services.write_behind import voice_writer, usage_writer
+from backend.services import voice_relay
+from backend.services import reports
+from backend.services import metrics
+from backend.services import usage_ledger
+from backend.services import analytics
+from backend.services.upstream import UpstreamBusy, estimate_tokens, openai_scheduler, status_of
+from backend.services import results_export
+from backend.services.answers import LETTERS, get_scores, mbti_type, save_answers, unknown_question_ids
+from backend.services.question_catalog import question_catalog
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,21 +47,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger("HR_SYSTEM")
 
-# 1. Загружаем переменные из .env (локально)
-load_dotenv(override=False)
+# Импорт модуля ничего не подключает: .env, схема базы и прогрев — в lifespan ниже.
+# Клиент OpenAI — общий асинхронный, создается лениво (см. services/openai_client.py)
 
-# 2. Получаем ключ из системы (и для локальной работы, и для Render)
-api_key = os.getenv("OPENAI_API_KEY")
+# create_all + миграции на старте. Если миграции прогоняются отдельно
+# (python -m backend.migrations перед запуском воркеров) — SCHEMA_CHECK=0
+SCHEMA_CHECK = os.getenv("SCHEMA_CHECK", "1").lower() not in ("0", "false", "no")
+# Что прогреть до приема запросов: catalog, db, openai, pdf (через запятую).
+# openai по умолчанию: иначе импорт SDK (~1 с) остановит event loop на первой реплике
+PREWARM_TARGETS = ("catalog", "db", "openai", "pdf")
+STARTUP_PREWARM = {t.strip() for t in os.getenv("STARTUP_PREWARM", "catalog,openai").lower().split(",") if t.strip()}
 
-if not api_key:
-    logger.error("❌ КРИТИЧЕСКАЯ ОШИБКА: Ключ OpenAI не найден! Приложение не сможет работать.")
-else:
-    # Мы выводим только первые 4 символа для проверки, остальное скрываем
-    masked_key = api_key[:4] + "****" + api_key[-4:] if len(api_key) > 8 else "****"
-    logger.info(f"✅ Ключ OpenAI успешно загружен (маска: {masked_key})")
-
-# 3. Инициализируем клиент OpenAI
-client = OpenAI(api_key=api_key)
+# Модель текстового чата (Алекс); цены ниже — для нее
+CHAT_MODEL = "gpt-4.1"
 
 PRICES = {
     "input": 2.00 / 1_000_000,
@@ -47,7 +67,87 @@ PRICES = {
     "output": 8.00 / 1_000_000
 }
 
-app = FastAPI()
+def _check_api_key():
+    # Ключ берем из системы (и для локальной работы, и для Render)
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        logger.error("❌ КРИТИЧЕСКАЯ ОШИБКА: Ключ OpenAI не найден! Приложение не сможет работать.")
+    else:
+        # Мы выводим только первые 4 символа для проверки, остальное скрываем
+        masked_key = api_key[:4] + "****" + api_key[-4:] if len(api_key) > 8 else "****"
+        logger.info(f"✅ Ключ OpenAI успешно загружен (маска: {masked_key})")
+
+
+def _check_schema():
+    models.Base.metadata.create_all(bind=database.engine)
+    migrations.run_migrations(database.engine)
+
+
+def _ping_sync_engine():
+    with database.engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+def _prewarm_openai():
+    # Ресурсы SDK (chat.completions) тоже импортируются лениво — при первом обращении
+    get_async_client().chat.completions
+    # Клиент Realtime для голосового чата
+    import websockets  # noqa: F401
+
+
+async def _ping_async_engine():
+    async with database.async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def _prewarm(targets):
+    """Соединения, клиенты и кеши поднимаются до первого запроса, а не на нем."""
+    unknown = set(targets) - set(PREWARM_TARGETS)
+    if unknown:
+        logger.warning(f"⚠️ STARTUP_PREWARM: неизвестные цели {sorted(unknown)}, доступны {PREWARM_TARGETS}")
+    jobs = []
+    if "catalog" in targets:
+        # Каталог собирается сразу, чтобы первый кандидат не ждал сериализацию
+        jobs.append(run_in_threadpool(question_catalog.get))
+    if "db" in targets:
+        jobs.append(run_in_threadpool(_ping_sync_engine))
+        jobs.append(_ping_async_engine())
+    if "openai" in targets:
+        jobs.append(run_in_threadpool(_prewarm_openai))
+    results = await asyncio.gather(*jobs, return_exceptions=True)
+    if "pdf" in targets:
+        # Процессы PDF поднимаются и разбирают шрифты заранее. Пул форкается после
+        # остальных задач: fork посреди чужого импорта в потоке наследует его блокировку
+        results += await asyncio.gather(run_in_threadpool(pdf_service.prewarm), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning(f"⚠️ Прогрев не удался: {result!r}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    # Переменные из .env (локально); уже заданные в окружении не перезаписываются
+    from dotenv import load_dotenv
+    load_dotenv(override=False)
+    _check_api_key()
+    if SCHEMA_CHECK:
+        await run_in_threadpool(_check_schema)
+    await _prewarm(STARTUP_PREWARM)
+    metrics.start_loop_monitor()
+    logger.info(f"🚀 Старт за {(time.perf_counter() - started) * 1000:.0f} мс "
+                f"(схема: {'проверена' if SCHEMA_CHECK else 'пропущена'}, прогрев: {','.join(sorted(STARTUP_PREWARM)) or 'нет'})")
+    yield
+    # Сначала дописываем очереди в базу, потом закрываем соединения
+    await voice_writer.close()
+    await usage_writer.close()
+    await metrics.stop_loop_monitor()
+    await close_async_client()
+    pdf_service.shutdown_executor()
+    await database.dispose_async_engines()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -63,7 +163,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-models.Base.metadata.create_all(bind=database.engine)
+# Гистограммы HTTP и счетчики SQL по маршрутам (см. /metrics)
+app.add_middleware(metrics.MetricsMiddleware)
 
 def get_db():
     db = database.SessionLocal()
@@ -72,215 +173,499 @@ def get_db():
     finally:
         db.close()
 
+get_async_db = database.get_async_db
+
+@app.get("/health")
+async def health():
+    # Отвечает только после завершения lifespan: uvicorn не принимает запросы раньше
+    return {"status": "ok"}
+
 # --- 1. ПОЛЬЗОВАТЕЛИ И ТЕСТЫ ---
 
 @app.get("/users")
-def get_users(db: Session = Depends(get_db)):
-    users = db.query(models.User).all()
-    output = []
-    
-    for user in users:
-        # Получаем сообщения ассистента для этого пользователя
-        bot_messages = db.query(models.ChatMessage).filter(
-            models.ChatMessage.user_id == str(user.id),
-            models.ChatMessage.role == "assistant"
-        ).all()
-
-        # 1. Психометрия: шаг 56 и выше
-        is_test_done = user.current_static_step >= 56
-
-        # 2. Нейро-текст: есть сообщения в базе
-        has_chat = len(bot_messages) > 0
-
-        # 3. Профайлинг: 
-        # Считаем выполненным, если в сообщениях бота ЕСТЬ <REPORT>
-        # (так как отчет появляется в самом конце всей диагностики)
-        is_profile_done = any("<REPORT>" in msg.content for msg in bot_messages)
-
-        output.append({
-            "id": user.id,
-            "name": user.name,
-            "gender": user.gender,
-            "current_static_step": user.current_static_step,
-            "has_chat": has_chat,
-            "has_voice": is_profile_done # Теперь это финальный флаг готовности всего AI-анализа
-        })
-        
-    return output
+async def get_users(db: AsyncSession = Depends(get_async_db)):
+    # Полный список для старой админки — тот же единый запрос, без пагинации
+    rows = (await db.execute(dashboard.users_statement())).all()
+    users, _ = dashboard.users_page(rows)
+    return users
+
+
+@app.get("/api/v1/users", response_model=schemas.UserPageResponse)
+async def get_users_page(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Постраничный дашборд HR: keyset-пагинация, фильтры выполняются в базе."""
+    if status and status not in dashboard.STATUSES:
+        raise HTTPException(status_code=422, detail=f"status должен быть одним из: {', '.join(dashboard.STATUSES)}")
+    try:
+        stmt = dashboard.users_statement(limit=limit, cursor=cursor, status=status, name_prefix=name_prefix)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    items, next_cursor = dashboard.users_page((await db.execute(stmt)).all(), limit)
+    return {"items": items, "next_cursor": next_cursor}
 
 
 @app.post("/users", response_model=schemas.UserResponse)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
     db_user = models.User(name=user.name, gender=user.gender)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 @app.get("/users/{user_id}", response_model=schemas.UserResponse)
-def get_user(user_id: str, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+async def get_user(user_id: str, db: AsyncSession = Depends(get_async_db)):
+    db_user = await db.get(models.User, user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
+def _etag_matches(if_none_match: Optional[str], *etags: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/").strip('"') for tag in if_none_match.split(",")}
+    return "*" in tags or any(etag in tags for etag in etags)
+
+
 @app.get("/questions", response_model=List[schemas.QuestionResponse])
-def get_questions(db: Session = Depends(get_db)):
-    return db.query(models.StaticQuestion).all()
+def get_questions(request: Request):
+    """Каталог вопросов из памяти: готовый JSON (и gzip), ETag и 304 для клиентского кеша."""
+    catalog = question_catalog.get()
+    use_gzip = "gzip" in request.headers.get("accept-encoding", "").lower()
+    etag = catalog.gzip_etag if use_gzip else catalog.etag
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), catalog.etag, catalog.gzip_etag):
+        return Response(status_code=304, headers=headers)
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=catalog.gzip_body, media_type="application/json", headers=headers)
+    return Response(content=catalog.body, media_type="application/json", headers=headers)
 
 @app.post("/answers")
-def submit_answer(answer: schemas.AnswerCreate, db: Session = Depends(get_db)):
-    db_answer = db.query(models.UserAnswer).filter(
-        models.UserAnswer.user_id == answer.user_id,
-        models.UserAnswer.question_id == answer.question_id
-    ).first()
-    if db_answer:
-        db_answer.selected_key = answer.selected_key
-    else:
-        db_answer = models.UserAnswer(**answer.dict())
-        db.add(db_answer)
-    
-    user = db.query(models.User).filter(models.User.id == answer.user_id).first()
-    if user:
-        user.current_static_step += 1
-    db.commit()
+async def submit_answer(answer: schemas.AnswerCreate, db: AsyncSession = Depends(get_async_db)):
+    if await db.get(models.User, answer.user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if await db.run_sync(unknown_question_ids, [answer.question_id]):
+        raise HTTPException(status_code=422, detail=f"Неизвестный question_id: {answer.question_id}")
+    # Шаг пересчитывается по числу разных отвеченных вопросов: повторный ответ его не сдвигает
+    await db.run_sync(save_answers, answer.user_id, {answer.question_id: answer.selected_key})
+    await db.commit()
     return {"status": "ok"}
 
+@app.post("/answers/batch", response_model=schemas.AnswerBatchResponse)
+async def submit_answers_batch(batch: schemas.AnswerBatchCreate, db: AsyncSession = Depends(get_async_db)):
+    """Весь лист ответов (или его часть) одной транзакцией; повторная отправка безопасна."""
+    if await db.get(models.User, batch.user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # Если вопрос пришел дважды, побеждает последний ответ
+    sheet = {item.question_id: item.selected_key for item in batch.answers}
+    unknown = await db.run_sync(unknown_question_ids, sheet)
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Неизвестные question_id: {sorted(unknown)}")
+
+    step = await db.run_sync(save_answers, batch.user_id, sheet)
+    await db.commit()
+    return {"status": "ok", "saved": len(sheet), "current_static_step": step}
+
 @app.get("/users/{user_id}/result", response_model=schemas.MBTIResult)
-def get_result(user_id: str, db: Session = Depends(get_db)):
-    answers = db.query(models.UserAnswer).filter(models.UserAnswer.user_id == user_id).all()
-    scores = {"E": 0, "I": 0, "S": 0, "N": 0, "T": 0, "F": 0, "J": 0, "P": 0}
-    for ans in answers:
-        if ans.selected_key in scores:
-            scores[ans.selected_key] += 1
-    mbti_type = "".join([
-        "E" if scores["E"] >= scores["I"] else "I",
-        "S" if scores["S"] >= scores["N"] else "N",
-        "T" if scores["T"] >= scores["F"] else "F",
-        "J" if scores["J"] >= scores["P"] else "P"
-    ])
-    return {**scores, "type": mbti_type}
+async def get_result(user_id: str, db: AsyncSession = Depends(get_async_db)):
+    # Баллы уже посчитаны при сохранении ответов — одна строка user_answer_vectors
+    scores = await db.run_sync(get_scores, user_id) or {letter: 0 for letter in LETTERS}
+    return {**scores, "type": mbti_type(scores)}
 
 # --- 2. ТЕКСТОВЫЙ ЧАТ (С ИСТОРИЕЙ И ОТЧЕТАМИ) ---
 
 @app.get("/chat/history/{user_id}")
-def get_chat_history(user_id: str, db: Session = Depends(get_db)):
-    history = db.query(models.ChatMessage).filter(models.ChatMessage.user_id == user_id).order_by(models.ChatMessage.timestamp).all()
+async def get_chat_history(user_id: str, db: AsyncSession = Depends(get_async_db)):
+    history = await db.execute(
+        select(models.ChatMessage.role, models.ChatMessage.content)
+        .where(models.ChatMessage.user_id == user_id)
+        .order_by(models.ChatMessage.timestamp)
+    )
     return [{"role": msg.role, "content": msg.content} for msg in history]
 
 # --- 2. ТЕКСТОВЫЙ ЧАТ (МОДЕЛЬ GPT-4.1) ---
 
+def _load_conversation(db: Session, user_id: str):
+    """Состояние текстового диалога из базы (при промахе кеша)."""
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if not user:
+        return None
+
+    # Загружаем историю только текстового чата (голосовые стенограммы — отдельно)
+    db_history = db.query(models.ChatMessage).filter(
+        models.ChatMessage.user_id == user_id,
+        models.ChatMessage.chat_type == "text"
+    ).order_by(models.ChatMessage.timestamp, models.ChatMessage.id).all()
+
+    summary = db.query(models.ChatSummary).filter(
+        models.ChatSummary.user_id == user_id,
+        models.ChatSummary.chat_type == "text"
+    ).first()
+
+    gender_label = "Мужской" if user.gender == "male" else "Женский"
+    return ConversationState(
+        user_id=user_id,
+        name=user.name,
+        gender=user.gender,
+        system_prompt=SYSTEM_PROMPT.replace("{name}", user.name).replace("{gender}", gender_label),
+        history={"text": [{"id": m.id, "role": m.role, "content": m.content} for m in db_history]},
+        summary=summary.summary if summary else "",
+        summary_upto_id=summary.last_message_id if summary else 0,
+    )
+
+
+def _history_is_current(db: Session, state: ConversationState) -> bool:
+    """Кешированная история совпадает с базой: то же число текстовых реплик и тот же последний id."""
+    count, last_id = db.execute(
+        select(func.count(), func.max(models.ChatMessage.id))
+        .where(models.ChatMessage.user_id == state.user_id, models.ChatMessage.chat_type == "text")
+    ).one()
+    history = state.history.get("text", [])
+    return count == len(history) and (last_id or 0) == (history[-1]["id"] if history else 0)
+
+
+def _save_summary(db: Session, user_id: str, summary_text: str, upto_id: int):
+    summary = db.query(models.ChatSummary).filter(
+        models.ChatSummary.user_id == user_id,
+        models.ChatSummary.chat_type == "text"
+    ).first()
+    if not summary:
+        summary = models.ChatSummary(user_id=user_id, chat_type="text")
+        db.add(summary)
+    summary.summary, summary.last_message_id = summary_text, upto_id
+    try:
+        db.commit()
+        conversation_cache.set_summary(user_id, summary_text, upto_id)
+        logger.info(f"🗜️ Контекст {user_id}: сводка обновлена до сообщения #{upto_id}")
+    except IntegrityError:
+        # Параллельная реплика уже создала сводку — обновим на следующем ходу
+        db.rollback()
+
+
+def _prepare_chat_turn(db: Session, user_id: str, message_text: str):
+    """Синхронная часть реплики: сохранить сообщение и собрать контекст для GPT.
+
+    Вызывается через AsyncSession.run_sync: код синхронный, но запросы идут
+    через асинхронный драйвер и не занимают потоки threadpool. Состояние
+    диалога берется из кеша, поэтому в установившемся режиме к базе уходит
+    только INSERT реплики (и сверка кеша с базой, если воркеров несколько —
+    см. CONV_CACHE_VERIFY). Возвращает None, если пользователя нет.
+    """
+    state = conversation_cache.get(user_id)
+    if state is not None and conversation_cache.verify and not _history_is_current(db, state):
+        conversation_cache.mark_stale(user_id)
+        state = None
+    if state is None:
+        state = _load_conversation(db, user_id)
+        if state is None:
+            return None
+        conversation_cache.put(state)
+
+    # Логика сохранения сообщения (если не техническая команда)
+    if "Начни диалог" not in message_text:
+        msg = _insert_chat_message(db, user_id, "user", message_text, "text")
+        # Кеш выключен или состояние уже вытеснено — дописываем сами
+        if not state.history["text"] or state.history["text"][-1]["id"] != msg["id"]:
+            state.history["text"].append(msg)
+
+    history = state.history["text"]
+
+    # Контекст в пределах бюджета токенов: старые реплики сжимаются в сводку
+    openai_messages, updated = chat_context.build_context(
+        state.system_prompt,
+        history,
+        summary=state.summary,
+        summary_upto_id=state.summary_upto_id,
+    )
+    if updated:
+        _save_summary(db, user_id, *updated)
+
+    if not history:
+        openai_messages.append({"role": "user", "content": f"Привет! Я {state.name}. Начни интервью."})
+    return openai_messages
+
+
+def _insert_chat_message(db: Session, user_id: str, role: str, content: str, chat_type: str) -> dict:
+    """INSERT реплики и запись сквозь кеш диалогов."""
+    new_msg = models.ChatMessage(user_id=user_id, role=role, content=content, chat_type=chat_type)
+    db.add(new_msg)
+    db.flush()
+    msg = {"id": new_msg.id, "role": role, "content": content}
+    db.commit()
+    conversation_cache.append_message(user_id, chat_type, msg)
+    return msg
+
+
+def _save_chat_message(db: Session, user_id: str, role: str, content: str, chat_type: str, report: dict = None):
+    """Сохраняет реплику; найденный в ней отчет пишется в ai_reports той же транзакцией."""
+    if report:
+        reports.upsert_report(db, user_id, chat_type, report)
+    _insert_chat_message(db, user_id, role, content, chat_type)
+
+
+async def _run_db(fn, *args):
+    """Синхронная функция с сессией первым аргументом — на асинхронной сессии."""
+    async with database.AsyncSessionLocal() as db:
+        return await db.run_sync(fn, *args)
+
+
+def _chat_usage_and_cost(usage):
+    """Токены (с учетом кеша промпта) и стоимость одной реплики GPT-4.1."""
+    p_details = getattr(usage, 'prompt_tokens_details', None)
+    cached_t = (getattr(p_details, 'cached_tokens', 0) or 0) if p_details else 0
+
+    cost = ((usage.prompt_tokens - cached_t) * PRICES["input"]) + \
+           (cached_t * PRICES["cached"]) + \
+           (usage.completion_tokens * PRICES["output"])
+
+    usage_data = {
+        "input": usage.prompt_tokens,
+        "output": usage.completion_tokens,
+        "cached": cached_t
+    }
+    return usage_data, cost
+
+
+async def _close_stream(stream):
+    try:
+        await stream.close()
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось закрыть поток OpenAI: {e}")
+
+
+async def _finish_lease(lease):
+    lease.release()
+    await _close_stream(lease.result)
+
+
+async def _save_partial_reply(user_id: str, openai_messages: list, raw_text: str, usage, latency_ms: float):
+    """Оборванная реплика потока: текст — в историю, токены — в журнал (без usage — по оценке)."""
+    logger.warning(f"✂️ Поток прерван, сохраняем часть ответа ({len(raw_text)} симв.) для {user_id}")
+    try:
+        await _run_db(_save_chat_message, user_id, "assistant", raw_text, "text", report_parser.parse(raw_text).report)
+    except Exception as e:
+        logger.error(f"💥 Не удалось сохранить часть ответа: {e}")
+    if usage:
+        usage_data, cost = _chat_usage_and_cost(usage)
+    else:
+        usage_data = {"input": estimate_tokens(openai_messages, completion=0), "output": len(raw_text) // 3, "cached": 0}
+        cost = usage_data["input"] * PRICES["input"] + usage_data["output"] * PRICES["output"]
+    usage_ledger.record(user_id, reports.TEXT, CHAT_MODEL, usage_data, cost, latency_ms)
+
+
+def _upstream_error(e: Exception) -> HTTPException:
+    """Ошибка вызова OpenAI -> ответ клиенту: статус по причине, без текста исключения."""
+    if isinstance(e, UpstreamBusy):
+        return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    status = status_of(e)
+    if status == 429:
+        # Повторы исчерпаны, а лимит OpenAI еще действует
+        return HTTPException(status_code=503, detail="OpenAI перегружен, повторите позже",
+                             headers={"Retry-After": str(int(openai_scheduler.backoff_max))})
+    if status is not None:
+        return HTTPException(status_code=502, detail="OpenAI временно недоступен")
+    return HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
+
+
+def _open_chat_completion(api: str, user_id: str, openai_messages: list, **params):
+    """Вызов chat.completions через общий планировщик: очередь, лимиты, повторы."""
+    return openai_scheduler.open(
+        api, user_id,
+        lambda: get_async_client().chat.completions.create(
+            model=CHAT_MODEL, messages=openai_messages, temperature=0.2, **params
+        ),
+        estimate_tokens(openai_messages),
+    )
+
+
 @app.post("/chat")
 async def chat_with_akmeolog(
     user_id: str,                 # Берется из ?user_id=...
     request_data: dict = Body(...), # Берем любой JSON объект
-    db: Session = Depends(get_db)
 ):
     # Достаем сообщение из словаря безопасно
     message_text = request_data.get("message", "")
-    
-    # 1. Сначала находим пользователя
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    # 2. Логика сохранения сообщения (если не техническая команда)
-    if "Начни диалог" not in message_text:
-        #db.add(models.ChatMessage(user_id=user_id, role="user", content=message_text))
-        db.add(models.ChatMessage(user_id=user_id, role="user", content=message_text, chat_type="text"))
-        db.commit()
-
-    # 3. Загружаем историю из базы
-    db_history = db.query(models.ChatMessage).filter(models.ChatMessage.user_id == user_id).order_by(models.ChatMessage.timestamp).all()
-    
-    gender_label = "Мужской" if user.gender == "male" else "Женский"
-    safe_prompt = SYSTEM_PROMPT.replace("{name}", user.name).replace("{gender}", gender_label)
-    
-    openai_messages = [{"role": "system", "content": safe_prompt}]
-    for msg in db_history:
-        openai_messages.append({"role": msg.role, "content": msg.content})
 
-    if not db_history:
-        openai_messages.append({"role": "user", "content": f"Привет! Я {user.name}. Начни интервью."})
+    # 1-3. Пользователь, сохранение реплики и история — в пуле потоков
+    openai_messages = await _run_db(_prepare_chat_turn, user_id, message_text)
+    if openai_messages is None:
+        raise HTTPException(status_code=404, detail="User not found")
 
     try:
-        # 4. Запрос к OpenAI
-        response = client.chat.completions.create(
-            model="gpt-4.1", 
-            messages=openai_messages, 
-            temperature=0.2
-        )
-        
+        # 4. Запрос к OpenAI (асинхронно, через общий пул соединений и планировщик)
+        with metrics.track_openai("chat") as call:
+            async with await _open_chat_completion("chat", user_id, openai_messages) as lease:
+                response = lease.result
+                lease.settle(response.usage.total_tokens if response.usage else None)
+
         raw_text = response.choices[0].message.content
         usage = response.usage
 
-        db.add(models.ChatMessage(user_id=user_id, role="assistant", content=raw_text, chat_type="text"))
-        db.commit()
-
-        # 5. Считаем кеш и стоимость
-        p_details = getattr(usage, 'prompt_tokens_details', None)
-        cached_t = getattr(p_details, 'cached_tokens', 0) if p_details else 0
-        
-        cost = ((usage.prompt_tokens - cached_t) * (2.00 / 1_000_000)) + \
-               (cached_t * (0.50 / 1_000_000)) + \
-               (usage.completion_tokens * (8.00 / 1_000_000))
+        # 5-6. Разбор отчета (сохраняется вместе с репликой) и стоимость
+        parsed = report_parser.parse(raw_text)
+        report_data = parsed.report
+        is_final = report_data is not None
+        await _run_db(_save_chat_message, user_id, "assistant", raw_text, "text", report_data)
 
-        # 6. ФИНАЛЬНЫЙ БРОНИРОВАННЫЙ ПАРСИНГ
-        report_data = None
-        is_final = False
-        
-        report_match = re.search(r'<REPORT>(.*?)</REPORT>', raw_text, re.DOTALL)
-        if report_match:
-            content = report_match.group(1).strip()
-            
-            # САМОЕ ВАЖНОЕ: Убираем двойные скобки, если бот их прислал
-            content = content.replace("{{", "{").replace("}}", "}")
-            # Убираем Markdown
-            content = content.replace("```json", "").replace("```", "").strip()
-            
-            try:
-                # План А: Чистый JSON
-                report_data = json.loads(content)
-                is_final = True
-                logger.info("🎉 УСПЕХ: Отчет распарсен!")
-            except Exception:
-                try:
-                    # План Б: Если всё еще капризничает
-                    import ast
-                    report_data = ast.literal_eval(content)
-                    is_final = True
-                    logger.info("🚀 Сработал План Б")
-                except Exception as e:
-                    logger.error(f"💀 Ошибка парсинга: {e}")
-                    logger.error(f"Текст отчета был: {content}")
+        usage_data, cost = _chat_usage_and_cost(usage)
+        usage_ledger.record(user_id, reports.TEXT, CHAT_MODEL, usage_data, cost, call.elapsed_ms)
 
         # 7. ВОЗВРАТ ДАННЫХ
         return {
             # Отдаем в чат только текст ДО отчета, чтобы не пугать Олю кодом
-            "text": raw_text.split("<REPORT>")[0].strip(),
+            "text": parsed.prefix,
             "report": report_data,
             "is_final": is_final,
-            "usage": {
-                "input": usage.prompt_tokens, 
-                "output": usage.completion_tokens, 
-                "cached": cached_t
-            },
+            "usage": usage_data,
             "cost": cost
         }
 
     except Exception as e:
         logger.error(f"💥 Ошибка OpenAI: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _upstream_error(e)
+
+@app.post("/chat/stream")
+async def chat_with_akmeolog_stream(
+    user_id: str,
+    request_data: dict = Body(...),
+):
+    """Потоковый вариант /chat (Server-Sent Events).
+
+    События: token — видимый текст по мере генерации; log — содержимое
+    [[LOG: ...]]; done — полный видимый текст, отчет, usage и стоимость;
+    error — ошибка OpenAI после начала потока. Если OpenAI перегружен,
+    ответ до начала потока — 503 с Retry-After, как у /chat.
+    """
+    message_text = request_data.get("message", "")
+
+    openai_messages = await _run_db(_prepare_chat_turn, user_id, message_text)
+    if openai_messages is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    requested = time.perf_counter()
+    try:
+        # Слот и повторы — до ответа клиенту: отказ уходит обычным HTTP-статусом, а не событием
+        lease = await _open_chat_completion("chat_stream", user_id, openai_messages,
+                                            stream=True, stream_options={"include_usage": True})
+    except Exception as e:
+        metrics.openai_errors.inc(api="chat_stream", error=type(e).__name__)
+        logger.error(f"💥 Ошибка OpenAI (stream): {e}")
+        raise _upstream_error(e)
+
+    async def event_stream():
+        raw_parts = []
+        usage = None
+        saved = False
+        parser = report_parser.StreamParser()
+        call = metrics.track_openai("chat_stream")
+        try:
+            async with lease:
+                with call:
+                    # Время вызова — от отправки запроса, включая очередь, а не от начала чтения
+                    call.started = requested
+                    async for chunk in lease.result:
+                        if chunk.usage:
+                            usage = chunk.usage
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if not delta:
+                            continue
+                        call.first_token()
+                        raw_parts.append(delta)
+                        part = parser.feed(delta)
+                        for log in part.logs:
+                            yield sse_event("log", {"log": log.raw})
+                        if part.visible:
+                            yield sse_event("token", {"text": part.visible})
+                lease.settle(usage.total_tokens if usage else None)
+
+            tail = parser.finish()
+            if tail.visible:
+                yield sse_event("token", {"text": tail.visible})
+
+            raw_text = "".join(raw_parts)
+            parsed = parser.result()
+            report_data = parsed.report
+            is_final = report_data is not None
+            # Отмена из Starlette не должна оборвать запись; флаг — только после нее,
+            # иначе прерванное сохранение не подхватит и finally
+            with anyio.CancelScope(shield=True):
+                await _run_db(_save_chat_message, user_id, "assistant", raw_text, "text", report_data)
+            saved = True
+
+            usage_data, cost = _chat_usage_and_cost(usage) if usage else ({"input": 0, "output": 0, "cached": 0}, 0.0)
+            if usage:
+                usage_ledger.record(user_id, reports.TEXT, CHAT_MODEL, usage_data, cost, call.elapsed_ms)
+
+            yield sse_event("done", {
+                "text": parsed.prefix,
+                "report": report_data,
+                "is_final": is_final,
+                "usage": usage_data,
+                "cost": cost
+            })
+        except Exception as e:
+            logger.error(f"💥 Ошибка OpenAI (stream): {e}")
+            yield sse_event("error", {"detail": _upstream_error(e).detail})
+        finally:
+            # Клиент ушел или поток оборвался: ответ закрываем, а уже сгенерированную часть
+            # реплики и расход токенов сохраняем. Starlette отменяет поток через cancel scope anyio,
+            # который прерывает каждый await в finally, поэтому нужен щит anyio, а не asyncio.shield
+            with anyio.CancelScope(shield=True):
+                await _close_stream(lease.result)
+                if not saved and raw_parts:
+                    await _save_partial_reply(user_id, openai_messages, "".join(raw_parts), usage, call.elapsed_ms)
+
+    return ClosingStreamingResponse(
+        event_stream(),
+        # Если клиент ушел до первого чанка, генератор не стартует — слот и поток закрываем на уровне ответа
+        on_close=lambda: _finish_lease(lease),
+        media_type="text/event-stream",
+        # Запрещаем буферизацию на прокси, иначе токены придут одной пачкой
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # --- 3. ГОЛОСОВОЙ ЧАТ (MARIN) С КЕШИРОВАНИЕМ И ЗАЩИТОЙ ---
 
+async def _get_user_by_id(user_id: str):
+    async with database.AsyncSessionLocal() as db:
+        return await db.get(models.User, user_id)
+
+def _capture_voice_report(user_id: str, text: str) -> Optional[str]:
+    """Отчет Марины из стенограммы или текстового блока ответа.
+
+    Сохраняет техническую реплику <MARIN_REPORT> и, если JSON разобран, строку
+    ai_reports. Возвращает JSON отчета для фронта или None, если блока нет.
+    Марина иногда оборачивает отчет в <REPORT> — он тоже засчитывается.
+    """
+    parsed = report_parser.parse(text, hide_after_report=False)
+    if not parsed.reports:
+        return None
+    data = parsed.report
+    clean_report = json.dumps(data, ensure_ascii=False) if data else parsed.reports[0].raw
+    voice_writer.enqueue(user_id, "assistant", f"<MARIN_REPORT>{clean_report}</MARIN_REPORT>", "voice")
+    if data:
+        voice_writer.enqueue_report(user_id, reports.VOICE, data)
+        logger.info("🎯 MARIN: Отчет перехвачен из голосового потока!")
+    return clean_report
+
 @app.websocket("/ws/chat/{user_id}")
 async def voice_chat(websocket: WebSocket, user_id: str):
     await websocket.accept()
+    metrics.voice_sessions.inc()
     
-    db_session = database.SessionLocal()
-    user = db_session.query(models.User).filter(models.User.id == user_id).first()
-    db_session.close()
+    user = await _get_user_by_id(user_id)
 
     user_name = user.name if user else "Собеседник"
     gender_label = "мужчина" if user and user.gender == "male" else "женщина"
@@ -288,9 +673,12 @@ async def voice_chat(websocket: WebSocket, user_id: str):
     start_time = asyncio.get_event_loop().time()
     MAX_SESSION_TIME = 420 
 
-    openai_url = "wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview"
+    # Клиент Realtime нужен только голосовому чату — не тянем его при старте
+    import websockets
+
+    openai_url = REALTIME_URL
     headers = {
-        "Authorization": f"Bearer {api_key}",
+        "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}",
         "OpenAI-Beta": "realtime=v1"
     }
 
@@ -351,60 +739,33 @@ async def voice_chat(websocket: WebSocket, user_id: str):
             async def listen_to_openai():
                 try:
                     async for message in openai_ws:
+                        metrics.voice_frames.inc(direction=metrics.UPSTREAM_IN)
                         event = json.loads(message)
                         
                         # 1. Голос Marin (аудио-поток на фронт)
                         if event.get("type") == "response.audio.delta":
+                            metrics.voice_frames.inc(direction=metrics.CLIENT_OUT)
                             await websocket.send_json({"type": "audio_delta", "audio": event["delta"]})
                         
                         # 2. ВАШИ СЛОВА (OpenAI распознал ваш голос)
                         elif event.get("type") == "conversation.item.input_audio_transcription.completed":
                             user_text = event.get("transcript", "").strip()
                             if user_text:
-                                db = database.SessionLocal()
-                                try:
-                                    new_msg = models.ChatMessage(user_id=user_id, role="user", content=user_text, chat_type="voice")
-                                    db.add(new_msg)
-                                    db.commit()
-                                finally:
-                                    db.close()
+                                voice_writer.enqueue(user_id, "user", user_text, "voice")
 
                         # 3. СЛОВА MARIN (Стенограмма её ответа)
                         elif event.get("type") == "response.audio_transcript.done":
                             ai_text = event.get("transcript", "").strip()
                             if ai_text:
                                 # 1. Отправляем на фронт
+                                metrics.voice_frames.inc(direction=metrics.CLIENT_OUT)
                                 await websocket.send_json({"type": "transcript", "text": ai_text})
         
                                 # 2. ПРОВЕРЯЕМ: нет ли в её речи отчета?
-                                if "<MARIN_REPORT>" in ai_text:
-                                    try:
-                                        report_part = ai_text.split("<MARIN_REPORT>")[1].split("</MARIN_REPORT>")[0]
-                                        # Убираем двойные скобки, если они пришли из промпта
-                                        clean_report = report_part.replace("{{", "{").replace("}}", "}").strip()
-                
-                                        db_rep = database.SessionLocal()
-                                        # Сохраняем технический отчет как отдельное системное сообщение
-                                        db_rep.add(models.ChatMessage(
-                                            user_id=user_id, 
-                                            role="assistant", 
-                                            content=f"<MARIN_REPORT>{clean_report}</MARIN_REPORT>", 
-                                            chat_type="voice"
-                                        ))
-                                        db_rep.commit()
-                                        db_rep.close()
-                                        logger.info("🎯 MARIN: Отчет перехвачен из голосового потока!")
-                                    except Exception as e:
-                                        logger.error(f"❌ Ошибка парсинга голосового отчета: {e}")
+                                _capture_voice_report(user_id, ai_text)
 
                                 # 3. Сохраняем саму реплику в базу (для протокола)
-                                db = database.SessionLocal()
-                                try:
-                                    new_msg = models.ChatMessage(user_id=user_id, role="assistant", content=ai_text, chat_type="voice")
-                                    db.add(new_msg)
-                                    db.commit()
-                                finally:
-                                    db.close()
+                                voice_writer.enqueue(user_id, "assistant", ai_text, "voice")
                                 
                         # 4. ФИНАЛЬНЫЙ ОТЧЕТ И РАСЧЕТ СТОИМОСТИ
                         elif event.get("type") == "response.done":
@@ -417,19 +778,9 @@ async def voice_chat(websocket: WebSocket, user_id: str):
                                 content_list = item.get("content", [])
                                 for content in content_list:
                                     if content.get("type") == "text":
-                                        full_text = content.get("text", "")
-                                        if "<MARIN_REPORT>" in full_text:
-                                            # Очистка и сохранение
-                                            report_part = full_text.split("<MARIN_REPORT>")[1].split("</MARIN_REPORT>")[0]
-                                            clean_report = report_part.replace("{{", "{").replace("}}", "}").strip()
-                                            
-                                            db = database.SessionLocal()
-                                            try:
-                                                db.add(models.ChatMessage(user_id=user_id, role="assistant", content=f"<MARIN_REPORT>{clean_report}</MARIN_REPORT>", chat_type="voice"))
-                                                db.commit()
-                                                print("🎯 MARIN: Отчет успешно перехвачен и сохранен!")
-                                            finally:
-                                                db.close()                                                                                
+                                        clean_report = _capture_voice_report(user_id, content.get("text", ""))
+                                        if clean_report is not None:
+                                            metrics.voice_frames.inc(direction=metrics.CLIENT_OUT)
                                             await websocket.send_json({"type": "final_report", "text": clean_report})
 
 
@@ -448,39 +799,146 @@ async def voice_chat(websocket: WebSocket, user_id: str):
                                 cost = (audio_in * 0.00001) + (audio_out * 0.00002) + (cached_t * 0.0000003) + \
                                        ((in_t - audio_in - cached_t) * 0.0000006) + (out_t * 0.0000024)
 
+                                metrics.voice_frames.inc(direction=metrics.CLIENT_OUT)
                                 await websocket.send_json({
                                     "type": "usage",
                                     "usage": {"input": in_t, "output": out_t, "cached": cached_t},
                                     "cost": cost
                                 })
+                                usage_ledger.record(user_id, reports.VOICE, REALTIME_MODEL, {
+                                    "input": in_t, "output": out_t, "cached": cached_t,
+                                    "audio_input": audio_in, "audio_output": audio_out,
+                                }, cost, uplink_stats.response_latency_ms())
                                 logger.info(f"💰 Сессия: {cost:.4f}$")
 
                 except Exception as e:
                     logger.error(f"Ошибка в listen_to_openai: {e}")
 
-            listen_task = asyncio.create_task(listen_to_openai())
-
-            try:
-                while True:
-                    if asyncio.get_event_loop().time() - start_time > MAX_SESSION_TIME:
-                        break
-                    try:
-                        data = await asyncio.wait_for(websocket.receive_json(), timeout=1.0)
-                    except asyncio.TimeoutError:
-                        continue
-
-                    if data.get("type") == "audio_data":
-                        await openai_ws.send(json.dumps({"type": "input_audio_buffer.append", "audio": data["audio"]}))
-                    elif data.get("type") == "commit":
-                        await openai_ws.send(json.dumps({"type": "input_audio_buffer.commit"}))
-                        await openai_ws.send(json.dumps({"type": "response.create"}))
-            except WebSocketDisconnect:
-                pass
-            finally:
-                listen_task.cancel()
+            # Два независимых направления: клиент -> OpenAI (через ограниченную очередь
+            # со склейкой аудио) и OpenAI -> клиент; лимит сессии — общий таймер
+            uplink_queue = asyncio.Queue(maxsize=voice_relay.UPLINK_QUEUE_SIZE)
+            uplink_stats = voice_relay.UplinkStats()
+            remaining = MAX_SESSION_TIME - (asyncio.get_event_loop().time() - start_time)
+            await voice_relay.run_session([
+                asyncio.create_task(listen_to_openai()),
+                asyncio.create_task(voice_relay.read_client(websocket, uplink_queue, uplink_stats)),
+                asyncio.create_task(voice_relay.write_upstream(openai_ws, uplink_queue, uplink_stats)),
+            ], remaining)
+            logger.info(
+                f"🎙️ Voice {user_id}: кадров от клиента {uplink_stats.frames_in}, "
+                f"отправлено в OpenAI {uplink_stats.frames_out}"
+            )
 
     except Exception as e:
+        metrics.openai_errors.inc(api="realtime", error=type(e).__name__)
         logger.error(f"💥 Критическая ошибка Voice Chat: {e}")
+    finally:
+        metrics.voice_sessions.dec()
+        # Дописываем в базу всё, что накопилось в очереди за сессию
+        await voice_writer.flush()
+
+
+# --- РАСХОД ТОКЕНОВ (журнал usage_ledger) ---
+
+def _usage_channel(channel: Optional[str]):
+    if channel and channel not in (reports.TEXT, reports.VOICE):
+        raise HTTPException(status_code=422, detail=f"channel должен быть одним из: {reports.TEXT}, {reports.VOICE}")
+
+
+@app.get("/api/v1/usage/summary", response_model=schemas.UsageSummaryResponse)
+async def get_usage_summary(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    channel: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Итоги за окно [since, until): доля кеша промпта, токены на реплику, цена завершенного профиля."""
+    _usage_channel(channel)
+    return await db.run_sync(usage_ledger.summary, since, until, channel)
+
+
+@app.get("/api/v1/usage/timeseries", response_model=List[schemas.UsageBucket])
+async def get_usage_timeseries(
+    bucket: str = "day",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    channel: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    _usage_channel(channel)
+    if bucket not in usage_ledger.BUCKETS:
+        raise HTTPException(status_code=422, detail=f"bucket должен быть одним из: {', '.join(usage_ledger.BUCKETS)}")
+    return await db.run_sync(usage_ledger.timeseries, bucket, since, until, channel)
+
+
+@app.get("/api/v1/usage/users", response_model=List[schemas.UsageUserTotals])
+async def get_usage_top_users(
+    limit: int = Query(20, ge=1, le=500),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    channel: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Самые дорогие кандидаты за окно."""
+    _usage_channel(channel)
+    return await db.run_sync(usage_ledger.top_users, limit, since, until, channel)
+
+
+# --- АНАЛИТИКА ПО ВСЕМ КАНДИДАТАМ (сводка services/analytics.py) ---
+
+@app.get("/api/v1/analytics/population", response_model=schemas.PopulationResponse)
+async def get_population(
+    source: str = analytics.STATIC,
+    period: Optional[str] = None,
+    by_gender: bool = False,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Распределение типов MBTI и статистика осей E_I/S_N/T_F/J_P по когортам.
+
+    source — static (тест), text (Алекс) или voice (Марина); когорты — период
+    (day/month, день прохождения теста или получения отчета, UTC) и пол.
+    Окно [since, until) по дням; гистограммы осей — интервалами по 10.
+    Считается по сводным таблицам, а не по кандидатам.
+    """
+    if source not in analytics.SOURCES:
+        raise HTTPException(status_code=422, detail=f"source должен быть одним из: {', '.join(analytics.SOURCES)}")
+    if period and period not in analytics.PERIODS:
+        raise HTTPException(status_code=422, detail=f"period должен быть одним из: {', '.join(analytics.PERIODS)}")
+    return await db.run_sync(analytics.population, source, period, by_gender, since, until)
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Метрики процесса в текстовом формате Prometheus."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/debug/cache-stats")
+def debug_cache_stats():
+    return {"conversation_cache": conversation_cache.stats()}
+
+
+@app.get("/debug/question-catalog")
+def debug_question_catalog():
+    catalog = question_catalog.get()
+    return {"count": catalog.count, "etag": catalog.etag, "version": catalog.version,
+            "bytes": len(catalog.body), "gzip_bytes": len(catalog.gzip_body), "builds": question_catalog.builds}
+
+@app.get("/debug/pdf-cache")
+def debug_pdf_cache():
+    return {"pdf_cache": pdf_service.pdf_cache.stats()}
+
+
+@app.get("/debug/upstream")
+def debug_upstream():
+    return {"openai_scheduler": openai_scheduler.stats()}
+
+
+@app.get("/debug/voice-queue")
+def debug_voice_queue():
+    return {"voice_write_behind": voice_writer.stats(), "usage_write_behind": usage_writer.stats()}
 
 
 @app.get("/debug/full-check/{user_id}")
@@ -503,72 +961,29 @@ def debug_full_check(user_id: str, db: Session = Depends(get_db)):
         "reports_content": reports
     }        
 
-@app.get("/api/v1/user-report/{user_uuid}")
-def get_universal_report(user_uuid: str, db: Session = Depends(get_db)):
+def _universal_report(db: Session, user_uuid: str):
     # 1. Загружаем основные данные пользователя
     user_record = db.query(models.User).filter(models.User.id == user_uuid).first()
     
     if not user_record:
         return {"error": "Пользователь не найден"}
 
-    # 2. ПРЯМОЙ ЗАПРОС (Stage 1) - Собираем баллы из ответов, раз в таблицах пусто
+    # 2. Stage 1 — баллы психометрического теста
     static_results = None
     try:
-        # 1. Получаем все ответы пользователя
-        answers = db.query(models.UserAnswer).filter(models.UserAnswer.user_id == user_uuid).all()
-        
-        if answers:
-            # Считаем баллы по буквам
-            counts = {"E": 0, "I": 0, "S": 0, "N": 0, "T": 0, "F": 0, "J": 0, "P": 0}
-            for ans in answers:
-                if ans.selected_key in counts:
-                    counts[ans.selected_key] += 1
-            
-            # Определяем тип (упрощенно, как в твоем тесте)
-            mbti_type = (
-                ("E" if counts["E"] >= counts["I"] else "I") +
-                ("S" if counts["S"] >= counts["N"] else "N") +
-                ("T" if counts["T"] >= counts["F"] else "F") +
-                ("J" if counts["J"] >= counts["P"] else "P")
-            )
-            
-            static_results = {**counts, "type": mbti_type}
-            logger.info(f"DEBUG: Баллы успешно собраны из user_answers для {user_uuid}")
+        # Счетчики букв поддерживаются при каждом ответе — читаем готовые
+        counts = get_scores(db, user_uuid)
+        if counts:
+            static_results = {**counts, "type": mbti_type(counts)}
+            logger.info(f"DEBUG: Баллы успешно собраны из user_answer_vectors для {user_uuid}")
     except Exception as e:
         logger.error(f"DEBUG: Ошибка при сборке баллов: {e}")
 
 
-   # 3. Собираем отчеты раздельно по уникальным тегам
-
-    ordered_messages = db.query(models.ChatMessage).filter(
-        models.ChatMessage.user_id == user_uuid,
-        models.ChatMessage.role == "assistant"
-    ).order_by(models.ChatMessage.timestamp.asc()).all()
-    
-    alex_report = None
-    marin_report = None
-
-    for msg in ordered_messages:
-        # Ищем Алекса (Stage 2)
-        if "<REPORT>" in msg.content:
-            m = re.search(r'<REPORT>(.*?)</REPORT>', msg.content, re.DOTALL)
-            if m:
-                try: alex_report = json.loads(m.group(1).strip())
-                except: continue
-        
-        # Ищем Марину (Stage 3) - обрабатываем даже "грязный" ответ Юли
-        if "MARIN_REPORT" in msg.content:
-            # Ищем текст между словами MARIN_REPORT, игнорируя наличие скобок < >
-            m = re.search(r'MARIN_REPORT(.*?)(?:MARIN_REPORT|$)', msg.content, re.DOTALL)
-            if m:
-                report_str = m.group(1).strip().strip('"').strip()
-                # "Доводчик" скобок: если Марина их забыла, добавляем
-                if not report_str.startswith("{"): report_str = "{" + report_str
-                if not report_str.endswith("}"): report_str = report_str + "}"
-                try: 
-                    marin_report = json.loads(report_str)
-                except: 
-                    continue
+    # 3. Отчеты уже разобраны и сохранены при получении — читаем по индексу
+    saved_reports = reports.get_reports(db, user_uuid)
+    alex_report = saved_reports.get(reports.TEXT)
+    marin_report = saved_reports.get(reports.VOICE)
 
     # 4. Формируем финальный пакет данных
     return {
@@ -584,12 +999,17 @@ def get_universal_report(user_uuid: str, db: Session = Depends(get_db)):
             "total_reports_found": (1 if alex_report else 0) + (1 if marin_report else 0)
         }
     }
-@app.get("/api/v1/user-report/{user_uuid}/pdf")
-def get_pdf_report(user_uuid: str, db: Session = Depends(get_db)):
+@app.get("/api/v1/user-report/{user_uuid}")
+async def get_universal_report(user_uuid: str, db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(_universal_report, user_uuid)
+
+
+def _collect_pdf_data(db: Session, user_uuid: str):
+    """Все входные данные PDF-отчета. None — если пользователя нет."""
     # 1. Получаем базовые данные
-    data = get_universal_report(user_uuid, db)
+    data = _universal_report(db, user_uuid)
     if not data or (isinstance(data, dict) and "error" in data):
-        raise HTTPException(status_code=404, detail="User not found")
+        return None
 
     # --- ЗАЩИТНЫЙ БЛОК: Инициализируем словари, если они None ---
     if data.get('stage_2_chat') is None:
@@ -601,38 +1021,114 @@ def get_pdf_report(user_uuid: str, db: Session = Depends(get_db)):
     # 2. ДОСТАЕМ ИСТОРИЮ ЧАТА
     history = db.query(models.ChatMessage).filter(
         models.ChatMessage.user_id == user_uuid
-    ).order_by(models.ChatMessage.timestamp).all()
+    ).order_by(models.ChatMessage.timestamp, models.ChatMessage.id).all()
     
     chat_log = [{"role": msg.role, "content": msg.content} for msg in history]
     
     # Теперь это безопасно, так как stage_2_chat уже точно словарь
-    data['stage_2_chat']['chat_history'] = chat_log
+    # (копия, чтобы не менять сохраненный в ai_reports отчет)
+    data['stage_2_chat'] = {**data['stage_2_chat'], 'chat_history': chat_log}
+    return data
 
-    # Получаем абсолютный путь к директории, где лежит main.py
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    # Соединяем путь к папке с именем файла
-    file_path = os.path.join(current_dir, f"temp_report_{user_uuid}.pdf")
-    
+
+async def _load_pdf_data(user_uuid: str):
+    return await _run_db(_collect_pdf_data, user_uuid)
+
+
+def _pdf_response(pdf: bytes, filename: str, etag: str = None):
+    # Кириллица в имени файла — через filename* (RFC 5987), как это делает FileResponse
+    quoted = quote(filename)
+    if quoted != filename:
+        disposition = f"attachment; filename*=utf-8''{quoted}"
+    else:
+        disposition = f'attachment; filename="{filename}"'
+    headers = {"Content-Disposition": disposition}
+    if etag:
+        headers["ETag"] = f'"{etag}"'
+    return Response(content=pdf, media_type='application/pdf', headers=headers)
+
+
+@app.get("/api/v1/user-report/{user_uuid}/pdf")
+async def get_pdf_report(user_uuid: str):
+    data = await _load_pdf_data(user_uuid)
+    if data is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # 3. Рендер в памяти, в пуле процессов; одинаковые данные берутся из кеша
+    key = pdf_service.report_key(data)
     try:
-        # Теперь передаем полный путь в генератор
-        create_pdf_report(data, file_path)
-        
-        # Проверка на всякий случай: создался ли файл физически?
-        if not os.path.exists(file_path):
-            raise Exception("Файл PDF не был обнаружен на диске после генерации")
-            
+        pdf = await pdf_service.render_pdf(data, key)
     except Exception as e:
         logger.error(f"❌ Ошибка при создании PDF для {user_uuid}: {str(e)}")
-        # Печатаем путь, чтобы в логах Docker видеть, куда он пытался сохраниться
-        logger.info(f"Попытка записи по пути: {file_path}")
         raise HTTPException(
             status_code=500, 
             detail="Ошибка формирования PDF. Возможно, данных недостаточно."
         )
 
-    # 4. Отдаем файл
-    return FileResponse(
-        path=file_path,  # FileResponse очень любит полные пути
-        filename=f"Report_{data.get('name', 'Candidate')}.pdf",
-        media_type='application/pdf'
+    # 4. Отдаем файл из памяти
+    return _pdf_response(pdf, f"Report_{data.get('name', 'Candidate')}.pdf", etag=key)
+
+
+@app.get("/api/v1/results/export")
+async def export_results(format: str = "ndjson", updated_since: Optional[datetime] = None):
+    """Результаты всех кандидатов потоком (NDJSON или CSV) для BI.
+
+    Баллы теста, отчеты Алекса и Марины (тип, метрики, зоны роста) — одна строка
+    на кандидата. X-Export-Watermark — updated_since для следующей инкрементальной выгрузки.
+    """
+    if format not in results_export.FORMATS:
+        raise HTTPException(status_code=422, detail=f"format должен быть одним из: {', '.join(results_export.FORMATS)}")
+    watermark = await results_export.watermark()
+    filename = f"results_{datetime.utcnow():%Y%m%d_%H%M%S}.{format}"
+    return StreamingResponse(
+        results_export.stream_results(format, updated_since),
+        media_type=results_export.MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Export-Watermark": watermark,
+        }
+    )
+
+
+async def _export_candidates(request: schemas.BulkExportRequest):
+    """Список кандидатов для выгрузки: явные id (в заданном порядке) или фильтр дашборда."""
+    if request.user_ids is not None:
+        ids = list(dict.fromkeys(request.user_ids))
+        return [{"id": user_id} for user_id in ids]
+    stmt = dashboard.users_statement(
+        limit=bulk_export.EXPORT_MAX_USERS + 1,
+        status=request.status, name_prefix=request.name_prefix
+    )
+    async with database.AsyncSessionLocal() as db:
+        rows = (await db.execute(stmt)).all()
+    users, _ = dashboard.users_page(rows)
+    return users
+
+
+@app.post("/api/v1/user-report/export")
+async def export_pdf_reports(request: schemas.BulkExportRequest):
+    """ZIP с PDF-отчетами многих кандидатов, отдается потоком по мере рендера."""
+    if request.status and request.status not in dashboard.STATUSES:
+        raise HTTPException(status_code=422, detail=f"status должен быть одним из: {', '.join(dashboard.STATUSES)}")
+    if request.user_ids == []:
+        # Пустой выбор в интерфейсе — это ошибка клиента, а не "выгрузить всех"
+        raise HTTPException(status_code=422, detail="user_ids не может быть пустым")
+    users = await _export_candidates(request)
+    if not users:
+        raise HTTPException(status_code=404, detail="Нет кандидатов для выгрузки")
+    if len(users) > bulk_export.EXPORT_MAX_USERS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Слишком много кандидатов: максимум {bulk_export.EXPORT_MAX_USERS} за один архив"
+        )
+
+    logger.info(f"📦 Экспорт: старт выгрузки {len(users)} отчетов")
+    filename = f"Reports_{len(users)}.zip"
+    return StreamingResponse(
+        bulk_export.stream_zip(users, _load_pdf_data),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Export-Total": str(len(users)),
+        }
     )
@@ -0,0 +1,161 @@
+import logging
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from . import models
+from .services import analytics, reports
+from .services.dashboard import STATIC_TEST_STEPS
+
+logger = logging.getLogger("HR_SYSTEM")
+
+# Таблица учета примененных миграций
+VERSION_TABLE = "schema_migrations"
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[Connection], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, name: str):
+    """Регистрирует шаг схемы. Шаги идут строго по возрастанию version.
+
+    Каждый шаг выполняется в своей транзакции вместе с записью в schema_migrations
+    и должен быть безопасен для базы, уже созданной через create_all
+    (CREATE INDEX IF NOT EXISTS и т.п.): новые базы получают индексы из models.py.
+    """
+    def decorator(fn):
+        MIGRATIONS.append(Migration(version, name, fn))
+        return fn
+    return decorator
+
+
+@migration(1, "ai_reports_by_source")
+def _ai_reports_by_source(conn: Connection):
+    """Старая ai_reports (UNIQUE по user_id, без source) -> отчет на каждый источник.
+
+    Раньше в таблицу ничего не писалось, поэтому пустая таблица пересоздается.
+    Если в ней уже есть строки, нужна ручная миграция.
+    """
+    columns = {c["name"] for c in inspect(conn).get_columns("ai_reports")}
+    if "source" in columns:
+        return
+    if conn.exec_driver_sql("SELECT COUNT(*) FROM ai_reports").scalar():
+        raise RuntimeError("ai_reports: старая схема с данными — нужна ручная миграция")
+    table = models.AIReport.__table__
+    table.drop(conn)
+    table.create(conn)
+
+
+@migration(2, "hot_path_indexes")
+def _hot_path_indexes(conn: Connection):
+    # Дубли (user_id, question_id) остались от старого POST /answers: оставляем последний ответ
+    conn.execute(text(
+        "DELETE FROM user_answers WHERE id NOT IN ("
+        " SELECT max_id FROM (SELECT MAX(id) AS max_id FROM user_answers GROUP BY user_id, question_id) AS latest"
+        ")"
+    ))
+    for statement in (
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_user_answers_user_question ON user_answers (user_id, question_id)",
+        "CREATE INDEX IF NOT EXISTS ix_chat_messages_user_role_ts ON chat_messages (user_id, role, timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_chat_messages_user_type_ts ON chat_messages (user_id, chat_type, timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_chat_messages_user_ts ON chat_messages (user_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_users_sort_name ON users (coalesce(name, ''), id)",
+    ):
+        conn.execute(text(statement))
+
+
+@migration(3, "export_updated_at_indexes")
+def _export_updated_at_indexes(conn: Connection):
+    # GET /api/v1/results/export?updated_since=... ищет измененных кандидатов по этим индексам
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_ai_reports_updated ON ai_reports (updated_at)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_user_answer_vectors_updated ON user_answer_vectors (updated_at)"))
+
+
+@migration(4, "result_summary_tables")
+def _result_summary_tables(conn: Connection):
+    """Сводка для GET /api/v1/analytics/population и момент прохождения теста.
+
+    Для уже пройденных тестов completed_at неизвестен — берется время последнего ответа.
+    """
+    columns = {c["name"] for c in inspect(conn).get_columns("user_answer_vectors")}
+    if "completed_at" not in columns:
+        conn.execute(text("ALTER TABLE user_answer_vectors ADD COLUMN completed_at TIMESTAMP"))
+    conn.execute(
+        text("UPDATE user_answer_vectors SET completed_at = updated_at "
+             "WHERE completed_at IS NULL AND answered >= :steps"),
+        {"steps": STATIC_TEST_STEPS}
+    )
+    models.ResultTypeCount.__table__.create(conn, checkfirst=True)
+    models.ResultAxisBin.__table__.create(conn, checkfirst=True)
+    analytics.rebuild(Session(bind=conn))
+
+
+@migration(5, "backfill_ai_reports")
+def _backfill_ai_reports(conn: Connection):
+    """Отчеты из реплик, сохраненных до записи ai_reports в момент получения.
+
+    Без них has_voice/profile_done, аналитика и расход на профиль пусты для старых
+    кандидатов. Уже записанные отчеты не трогаются; дата отчета — время реплики.
+    """
+    count = reports.backfill_from_messages(Session(bind=conn), only_missing=True)
+    if count:
+        logger.info(f"🗂️ ai_reports: перенесено {count} отчетов из истории чатов")
+
+
+def _ensure_version_table(engine: Engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ("
+            " version INTEGER PRIMARY KEY,"
+            " name VARCHAR NOT NULL,"
+            " applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
+            ")"
+        ))
+
+
+def applied_versions(engine: Engine) -> set:
+    _ensure_version_table(engine)
+    with engine.connect() as conn:
+        return set(conn.execute(text(f"SELECT version FROM {VERSION_TABLE}")).scalars())
+
+
+def run_migrations(engine: Engine) -> int:
+    """Применяет недостающие миграции по порядку. Возвращает число примененных.
+
+    Упавший шаг откатывается целиком, следующие не запускаются до исправления;
+    приложение при этом продолжает работать на текущей схеме.
+    """
+    done = applied_versions(engine)
+    applied = 0
+    for step in sorted(MIGRATIONS, key=lambda m: m.version):
+        if step.version in done:
+            continue
+        try:
+            with engine.begin() as conn:
+                step.apply(conn)
+                conn.execute(
+                    text(f"INSERT INTO {VERSION_TABLE} (version, name) VALUES (:version, :name)"),
+                    {"version": step.version, "name": step.name}
+                )
+        except Exception as e:
+            logger.error(f"❌ Миграция {step.version:04d}_{step.name} не применена: {e}")
+            break
+        applied += 1
+        logger.info(f"🛠️ Миграция {step.version:04d}_{step.name} применена")
+    return applied
+
+
+if __name__ == "__main__":
+    from .database import engine, Base
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    Base.metadata.create_all(bind=engine)
+    count = run_migrations(engine)
+    print(f"🚀 Готово: применено миграций — {count}")
@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, Integer, ForeignKey, Text, JSON, DateTime
+from sqlalchemy import Column, String, Integer, Float, ForeignKey, Text, JSON, DateTime, UniqueConstraint, Index, literal_column
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -16,8 +16,11 @@ class User(Base):
     answers = relationship("UserAnswer", back_populates="user")
     # Добавляем связь с историей чата
     chat_messages = relationship("ChatMessage", back_populates="user")
-    # Добавляем связь с финальным отчетом (uselist=False делает связь 1-к-1)
-    ai_report = relationship("AIReport", back_populates="user", uselist=False)
+    # Финальные отчеты: по одному на источник ("text" — Алекс, "voice" — Марина)
+    ai_reports = relationship("AIReport", back_populates="user")
+
+# Сортировка дашборда HR: (coalesce(name, ''), id) — то же выражение, что в services/dashboard.py
+Index("ix_users_sort_name", func.coalesce(User.name, literal_column("''")), User.id)
 
 class StaticQuestion(Base):
     __tablename__ = "static_questions"
@@ -35,6 +38,8 @@ class StaticQuestion(Base):
 
 class UserAnswer(Base):
     __tablename__ = "user_answers"
+    # Один ответ на вопрос: по этому ключу идет upsert ответов
+    __table_args__ = (Index("uq_user_answers_user_question", "user_id", "question_id", unique=True),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String, ForeignKey("users.id"))
@@ -49,6 +54,11 @@ class UserAnswer(Base):
 class ChatMessage(Base):
     """Таблица для хранения истории диалога (защита от обрывов связи)"""
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        Index("ix_chat_messages_user_role_ts", "user_id", "role", "timestamp"),      # статус "есть чат" в дашборде
+        Index("ix_chat_messages_user_type_ts", "user_id", "chat_type", "timestamp"), # история одного чата
+        Index("ix_chat_messages_user_ts", "user_id", "timestamp"),                   # вся история (PDF, /chat/history)
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String, ForeignKey("users.id"))
@@ -60,12 +70,30 @@ class ChatMessage(Base):
 
     user = relationship("User", back_populates="chat_messages")
 
+class ChatSummary(Base):
+    """Сжатая сводка ранних реплик диалога (LOG-доказательства по осям)"""
+    __tablename__ = "chat_summaries"
+    __table_args__ = (UniqueConstraint("user_id", "chat_type", name="uq_chat_summaries_user_type"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, ForeignKey("users.id"), index=True)
+    chat_type = Column(String, default="text")
+    summary = Column(Text, default="")
+    # id последнего сообщения, уже вошедшего в сводку
+    last_message_id = Column(Integer, default=0)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
 class AIReport(Base):
     """Таблица для финального психологического профиля и рекомендаций"""
     __tablename__ = "ai_reports"
+    __table_args__ = (
+        UniqueConstraint("user_id", "source", name="uq_ai_reports_user_source"),
+        Index("ix_ai_reports_updated", "updated_at"),  # инкрементальная выгрузка результатов
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(String, ForeignKey("users.id"), unique=True)
+    user_id = Column(String, ForeignKey("users.id"), index=True)
+    source = Column(String, default="text")  # "text" — отчет Алекса (<REPORT>), "voice" — Марины (MARIN_REPORT)
     
     mbti_type = Column(String)
     # Метрики (0-100)
@@ -76,5 +104,97 @@ class AIReport(Base):
     
     skill_gaps = Column(JSON)  # Список рекомендаций по обучению
     summary = Column(Text)     # Общий вывод Акмеолога
-
-    user = relationship("User", back_populates="ai_report")
\ No newline at end of file
+    raw = Column(JSON)         # Отчет целиком, как его прислала модель
+
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    user = relationship("User", back_populates="ai_reports")
+
+class AppMeta(Base):
+    """Служебные ключ-значение: версии справочников, контрольные суммы сидов"""
+    __tablename__ = "app_meta"
+
+    key = Column(String, primary_key=True)
+    value = Column(String)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+class UserAnswerVector(Base):
+    """Компактные ответы теста: одна строка на пользователя вместо строки на ответ.
+
+    answers — буква ответа на позиции (question_id - 1), "." — вопрос без ответа.
+    Счетчики восьми букв обновляются вместе с вектором при каждом ответе.
+    """
+    __tablename__ = "user_answer_vectors"
+    __table_args__ = (Index("ix_user_answer_vectors_updated", "updated_at"),)  # инкрементальная выгрузка
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    answers = Column(String, default="")
+    answered = Column(Integer, default=0)
+    e = Column(Integer, default=0)
+    i = Column(Integer, default=0)
+    s = Column(Integer, default=0)
+    n = Column(Integer, default=0)
+    t = Column(Integer, default=0)
+    f = Column(Integer, default=0)
+    j = Column(Integer, default=0)
+    p = Column(Integer, default=0)
+    # Момент, когда тест впервые пройден целиком (services/analytics.py: день в сводке)
+    completed_at = Column(DateTime)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+class UsageRecord(Base):
+    """Журнал расхода токенов: одна строка на вызов OpenAI (реплика чата или ответ Марины).
+
+    Журнал только дописывается; внешнего ключа на users нет, чтобы запись
+    расхода не терялась вместе с пачкой из-за удаленного кандидата.
+    """
+    __tablename__ = "usage_ledger"
+    __table_args__ = (
+        Index("ix_usage_ledger_created", "created_at"),
+        Index("ix_usage_ledger_user_created", "user_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String)
+    channel = Column(String)  # "text" — Алекс, "voice" — Марина
+    model = Column(String)
+    input_tokens = Column(Integer, default=0)   # включая cached и аудио
+    cached_tokens = Column(Integer, default=0)
+    output_tokens = Column(Integer, default=0)  # включая аудио
+    audio_input_tokens = Column(Integer, default=0)
+    audio_output_tokens = Column(Integer, default=0)
+    cost = Column(Float, default=0.0)
+    latency_ms = Column(Integer)  # None, если начало ответа неизвестно (server VAD)
+    created_at = Column(DateTime, server_default=func.now())
+
+class ResultTypeCount(Base):
+    """Сводка для аналитики: число кандидатов по (источник, день, пол, тип MBTI).
+
+    Ведется инкрементально вместе с результатами (services/analytics.py),
+    пересобирается через backfill_analytics. "" в gender / mbti_type — нет значения.
+    """
+    __tablename__ = "result_type_counts"
+
+    source = Column(String, primary_key=True)  # "static" — тест, "text" — Алекс, "voice" — Марина
+    day = Column(String, primary_key=True)     # "YYYY-MM-DD", UTC: тест пройден / отчет получен
+    gender = Column(String, primary_key=True)
+    mbti_type = Column(String, primary_key=True)
+    candidates = Column(Integer, default=0)
+
+class ResultAxisBin(Base):
+    """Сводка для аналитики: оси E_I/S_N/T_F/J_P интервалами по 10 (0-9, ..., 90-100).
+
+    Кроме числа кандидатов в интервале хранятся сумма и сумма квадратов значений:
+    среднее и разброс точные, а размер таблицы не зависит от числа кандидатов.
+    """
+    __tablename__ = "result_axis_bins"
+
+    source = Column(String, primary_key=True)
+    day = Column(String, primary_key=True)
+    gender = Column(String, primary_key=True)
+    axis = Column(String, primary_key=True)    # "E_I", "S_N", "T_F", "J_P"
+    bin = Column(Integer, primary_key=True)    # 0..9: значение // 10, 100 — в последнем
+    candidates = Column(Integer, default=0)
+    total = Column(Integer, default=0)
+    squares = Column(Integer, default=0)
@@ -1,6 +1,7 @@
 from pydantic import BaseModel
 from typing import List, Optional
 from typing import Dict
+from datetime import date, datetime
 
 class UserCreate(BaseModel):
     name: str
@@ -80,4 +81,97 @@ class ChatResponse(BaseModel):
     text: str
     usage: Dict[str, int]
     cost: float
-    report: Optional[AIReportResponse] = None # Отчет появится только в конце    
\ No newline at end of file
+    report: Optional[AIReportResponse] = None # Отчет появится только в конце    
+
+# Схемы для дашборда HR (GET /api/v1/users)
+class UserStatusResponse(BaseModel):
+    id: str
+    name: Optional[str] = None
+    gender: Optional[str] = None
+    current_static_step: Optional[int] = None
+    is_test_done: bool
+    has_chat: bool
+    has_voice: bool
+
+class UserPageResponse(BaseModel):
+    items: List[UserStatusResponse]
+    next_cursor: Optional[str] = None
+
+# Массовая выгрузка PDF (POST /api/v1/user-report/export): либо список id, либо фильтр дашборда
+class BulkExportRequest(BaseModel):
+    user_ids: Optional[List[str]] = None
+    status: Optional[str] = None
+    name_prefix: Optional[str] = None
+
+# Пакетная отправка ответов теста (POST /answers/batch)
+class AnswerItem(BaseModel):
+    question_id: int
+    selected_key: str
+
+class AnswerBatchCreate(BaseModel):
+    user_id: str
+    answers: List[AnswerItem]
+
+class AnswerBatchResponse(BaseModel):
+    status: str
+    saved: int
+    current_static_step: int
+
+# Журнал расхода токенов (GET /api/v1/usage/...)
+class UsageTotals(BaseModel):
+    turns: int
+    input_tokens: int
+    cached_tokens: int
+    output_tokens: int
+    audio_input_tokens: int
+    audio_output_tokens: int
+    cost: float
+    cache_hit_ratio: float
+    tokens_per_turn: float
+    avg_latency_ms: Optional[float] = None
+
+class UsageChannelTotals(UsageTotals):
+    channel: str
+
+class UsageProfileTotals(UsageTotals):
+    completed_profiles: int
+    cost_per_completed_profile: Optional[float] = None
+
+class UsageSummaryResponse(BaseModel):
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    total: UsageProfileTotals
+    channels: List[UsageChannelTotals]
+
+class UsageBucket(UsageProfileTotals):
+    bucket: str
+
+class UsageUserTotals(UsageTotals):
+    user_id: Optional[str] = None
+    name: Optional[str] = None
+
+# Аналитика по всем кандидатам (GET /api/v1/analytics/population)
+class AxisBin(BaseModel):
+    lo: int
+    hi: int
+    candidates: int
+
+class AxisStats(BaseModel):
+    axis: str
+    candidates: int
+    mean: float
+    std: float
+    histogram: List[AxisBin]
+
+class PopulationGroup(BaseModel):
+    period: Optional[str] = None
+    gender: Optional[str] = None
+    candidates: int
+    types: Dict[str, int]
+    axes: List[AxisStats]
+
+class PopulationResponse(BaseModel):
+    source: str
+    since: Optional[date] = None
+    until: Optional[date] = None
+    groups: List[PopulationGroup]
@@ -1,35 +1,138 @@
+import os
+import sys
 import json
+import hashlib
+import logging
+from typing import List, Optional
+
+from sqlalchemy import func, select, text
 from sqlalchemy.orm import Session
-from .database import SessionLocal, engine, Base
-from .models import StaticQuestion
 
-def seed_db():
+from .database import SessionLocal, engine, Base, dialect_insert
+from .models import AppMeta, StaticQuestion, UserAnswer
+from .services.question_catalog import invalidate_catalog
+
+logger = logging.getLogger("HR_SYSTEM")
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "questions.json")
+# Ключ в app_meta: sha256 файла вопросов, загруженного последним
+CHECKSUM_KEY = "questions_sha256"
+_COLUMNS = ("situation", "text", "option_a", "key_a", "option_b", "key_b", "axis")
+
+
+def question_rows(data) -> List[dict]:
+    """Строки static_questions из questions.json.
+
+    id — сквозной номер вопроса в файле (1, 2, ...), если у вопроса нет явного "id".
+    На этот номер завязаны ответы (user_answers.question_id и позиция в векторе
+    ответов), поэтому новые вопросы добавляются только в конец файла.
+    """
+    rows = []
+    for group in data:
+        for q in group["questions"]:
+            rows.append({
+                "id": int(q.get("id", len(rows) + 1)),
+                "situation": group["situation"],
+                "text": q["q"],
+                "option_a": q["a"],
+                "key_a": q["ka"],
+                "option_b": q["b"],
+                "key_b": q["kb"],
+                "axis": q["axis"],
+            })
+    ids = [row["id"] for row in rows]
+    if len(set(ids)) != len(ids):
+        raise ValueError("questions.json: повторяющиеся id вопросов")
+    return rows
+
+
+def _check_ids(db: Session, rows: List[dict]):
+    """Отказ, если вопросы файла лежат в базе под другими id.
+
+    Старый fix_db.py удалял вопросы и вставлял заново, и на Postgres счетчик serial
+    выдавал новые id (57, 58, ...). Upsert по номерам из файла тогда задвоил бы каталог,
+    а ответы кандидатов остались бы на старых id — такую базу нужно править руками.
+    """
+    by_id = {row["id"]: row for row in rows}
+    by_text = {(row["situation"], row["text"]): row["id"] for row in rows}
+    moved = []
+    for question_id, situation, question_text in db.execute(
+            select(StaticQuestion.id, StaticQuestion.situation, StaticQuestion.text)):
+        file_id = by_text.get((situation, question_text))
+        if file_id is not None and file_id != question_id:
+            current = by_id.get(question_id)
+            if current is None or (current["situation"], current["text"]) != (situation, question_text):
+                moved.append((file_id, question_id))
+    if moved:
+        sample = ", ".join(f"{file_id} -> id {db_id}" for file_id, db_id in sorted(moved)[:5])
+        raise RuntimeError(
+            f"static_questions: {len(moved)} вопросов хранятся под другими id, чем в questions.json ({sample}). "
+            "Каталог перезаливался с новыми id; перед загрузкой перенумеруйте вопросы и user_answers.question_id"
+        )
+
+
+def seed_questions(db: Session, path: str = QUESTIONS_PATH, force: bool = False) -> Optional[int]:
+    """Загружает вопросы одним upsert'ом по id; None — файл уже загружен.
+
+    Повторный запуск с тем же файлом ничего не пишет (сверяется sha256 в app_meta).
+    Upsert, удаление лишних вопросов, контрольная сумма и новая версия каталога —
+    одна транзакция: API видит либо старый набор вопросов, либо новый целиком.
+    Вопросы, на которые уже есть ответы, не удаляются, даже если их нет в файле.
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    checksum = hashlib.sha256(raw).hexdigest()
+    rows = question_rows(json.loads(raw))
+
+    stored = db.get(AppMeta, CHECKSUM_KEY)
+    if not force and stored is not None and stored.value == checksum \
+            and db.scalar(select(func.count()).select_from(StaticQuestion)) == len(rows):
+        return None
+
+    try:
+        _check_ids(db, rows)
+        stmt = dialect_insert(db, StaticQuestion).values(rows)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[StaticQuestion.id],
+            set_={name: stmt.excluded[name] for name in _COLUMNS},
+        ))
+
+        ids = [row["id"] for row in rows]
+        extra = select(StaticQuestion.id).where(StaticQuestion.id.not_in(ids))
+        answered = set(db.scalars(select(UserAnswer.question_id).where(UserAnswer.question_id.in_(extra)).distinct()))
+        if answered:
+            logger.warning(f"⚠️ Вопросы {sorted(answered)} нет в файле, но на них есть ответы — оставлены")
+        db.execute(StaticQuestion.__table__.delete().where(StaticQuestion.id.not_in(ids + sorted(answered))))
+
+        if db.get_bind().dialect.name == "postgresql":
+            # id заданы явно — счетчик serial нужно догнать до максимума
+            db.execute(text("SELECT setval(pg_get_serial_sequence('static_questions', 'id'), "
+                            "(SELECT MAX(id) FROM static_questions))"))
+
+        if stored is None:
+            stored = AppMeta(key=CHECKSUM_KEY)
+            db.add(stored)
+        stored.value = checksum
+        # Новая версия каталога в той же транзакции; invalidate_catalog коммитит
+        invalidate_catalog(db)
+    except Exception:
+        db.rollback()
+        raise
+    return len(rows)
+
+
+def seed_db(force: bool = False):
     Base.metadata.create_all(bind=engine)
     db = SessionLocal()
-
-    if db.query(StaticQuestion).first():
+    try:
+        count = seed_questions(db, force=force)
+    finally:
+        db.close()
+    if count is None:
         print("Database already seeded")
-        return
-
-    with open("backend/questions.json", "r", encoding="utf-8") as f:
-        data = json.load(f)
-        
-        for group in data:
-            situation = group["situation"]
-            for q in group["questions"]:
-                question = StaticQuestion(
-                    situation=situation,
-                    text=q["q"],
-                    option_a=q["a"],
-                    key_a=q["ka"],
-                    option_b=q["b"],
-                    key_b=q["kb"],
-                    axis=q["axis"]
-                )
-                db.add(question)
-        
-        db.commit()
-        print("Database seeded successfully!")
+    else:
+        print(f"Database seeded successfully! ({count} questions)")
+
 
 if __name__ == "__main__":
-    seed_db()
+    seed_db(force="--force" in sys.argv[1:])
@@ -0,0 +1,245 @@
+import math
+from datetime import date, datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, case, func, literal, select, type_coerce, String
+from sqlalchemy.orm import Session
+
+from .. import models, database
+
+STATIC = "static"  # тест из 56 вопросов; "text" и "voice" — отчеты Алекса и Марины (services/reports.py)
+SOURCES = (STATIC, "text", "voice")
+PERIODS = ("day", "month")
+AXES = ("E_I", "S_N", "T_F", "J_P")
+# Пары счетчиков user_answer_vectors по осям: метрика оси — доля второй буквы, как в отчетах
+_STATIC_PAIRS = (("e", "i"), ("s", "n"), ("t", "f"), ("j", "p"))
+
+T = models.ResultTypeCount
+A = models.ResultAxisBin
+BINS = 10  # интервалы осей по 10: 0-9, ..., 90-100
+
+
+class Contribution(NamedTuple):
+    """Вклад одного результата кандидата в сводные таблицы."""
+    source: str
+    day: str              # "YYYY-MM-DD", UTC
+    gender: str           # "" — не указан
+    mbti_type: str        # "" — тип не определен
+    axes: Tuple[Optional[int], ...]  # значения E_I, S_N, T_F, J_P (0-100) или None
+
+
+def axis_share(first: int, second: int) -> Optional[int]:
+    """Метрика оси 0-100 по счетчикам теста: 0 — только первая буква, 100 — только вторая.
+
+    Округление половины вверх целочисленно — то же выражение считает rebuild в SQL.
+    """
+    total = (first or 0) + (second or 0)
+    if not total:
+        return None
+    return (200 * (second or 0) + total) // (2 * total)
+
+
+def _day(value) -> str:
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%Y-%m-%d")
+    return str(value)[:10] if value else datetime.utcnow().strftime("%Y-%m-%d")
+
+
+def _bin(value: int) -> int:
+    return min(value // 10, BINS - 1)
+
+
+def _axis(value) -> Optional[int]:
+    return value if value is not None and 0 <= value <= 100 else None
+
+
+def contribution(source: str, day, gender: Optional[str], mbti_type: Optional[str], axes) -> Contribution:
+    return Contribution(source, _day(day), gender or "", mbti_type or "", tuple(_axis(v) for v in axes))
+
+
+def _bump(db: Session, item: Contribution, delta: int):
+    key = {"source": item.source, "day": item.day, "gender": item.gender}
+    stmt = database.dialect_insert(db, T).values(**key, mbti_type=item.mbti_type, candidates=delta)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[T.source, T.day, T.gender, T.mbti_type],
+        set_={"candidates": T.candidates + stmt.excluded.candidates},
+    ))
+    rows = [{**key, "axis": axis, "bin": _bin(value), "candidates": delta,
+             "total": delta * value, "squares": delta * value * value}
+            for axis, value in zip(AXES, item.axes) if value is not None]
+    if rows:
+        stmt = database.dialect_insert(db, A).values(rows)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[A.source, A.day, A.gender, A.axis, A.bin],
+            set_={name: getattr(A, name) + stmt.excluded[name] for name in ("candidates", "total", "squares")},
+        ))
+
+
+def apply_change(db: Session, before: Optional[Contribution], after: Optional[Contribution]):
+    """Переносит результат кандидата в сводке: -1 старому ключу, +1 новому.
+
+    Вызывается в транзакции, которая меняет сам результат (save_answers,
+    upsert_report), поэтому сводка не расходится с исходными таблицами.
+    Коммит за вызывающим.
+    """
+    if before == after:
+        return
+    if before is not None:
+        _bump(db, before, -1)
+    if after is not None:
+        _bump(db, after, 1)
+
+
+# --- Пересборка с нуля (миграция, backfill, ручная сверка) ---
+
+def _day_expr(db: Session, column):
+    if db.get_bind().dialect.name == "sqlite":
+        return func.strftime("%Y-%m-%d", column)
+    return func.to_char(column, "YYYY-MM-DD")
+
+
+def _static_type_expr(v):
+    letters = [case((getattr(v, a) >= getattr(v, b), a.upper()), else_=b.upper()) for a, b in _STATIC_PAIRS]
+    return type_coerce(letters[0], String) + letters[1] + letters[2] + letters[3]
+
+
+def _static_axis_expr(v, first: str, second: str):
+    a, b = func.coalesce(getattr(v, first), 0), func.coalesce(getattr(v, second), 0)
+    # Как axis_share: целочисленное деление, половина вверх
+    return case((a + b > 0, (200 * b + a + b) // (2 * (a + b))), else_=None)
+
+
+def _sources(db: Session):
+    """По каждому источнику: (столбцы source, day, gender, mbti_type; ключи GROUP BY; {ось: выражение}; FROM; WHERE).
+
+    source у теста — константа, в GROUP BY она не идет.
+    """
+    v, r, u = models.UserAnswerVector, models.AIReport, models.User
+    gender = func.coalesce(u.gender, "")
+
+    day, mbti = _day_expr(db, v.completed_at), _static_type_expr(v)
+    yield (
+        (literal(STATIC), day, gender, mbti), (day, gender, mbti),
+        {axis: _static_axis_expr(v, a, b) for axis, (a, b) in zip(AXES, _STATIC_PAIRS)},
+        v.__table__.outerjoin(u, u.id == v.user_id), v.completed_at.is_not(None),
+    )
+
+    day, mbti = _day_expr(db, r.created_at), func.coalesce(r.mbti_type, "")
+    yield (
+        (r.source, day, gender, mbti), (r.source, day, gender, mbti),
+        {axis: getattr(r, axis.lower()) for axis in AXES},
+        r.__table__.outerjoin(u, u.id == r.user_id), r.source.in_(SOURCES[1:]),
+    )
+
+
+def rebuild(db: Session):
+    """Пересчитывает сводные таблицы GROUP BY по user_answer_vectors и ai_reports.
+
+    Нужна один раз для уже накопленных результатов и для сверки, если сводку
+    правили руками. Коммит за вызывающим.
+    """
+    db.execute(T.__table__.delete())
+    db.execute(A.__table__.delete())
+    for columns, keys, axes, from_, where in _sources(db):
+        stmt = select(*columns, func.count()).select_from(from_).where(where).group_by(*keys)
+        db.execute(T.__table__.insert().from_select(["source", "day", "gender", "mbti_type", "candidates"], stmt))
+        for axis, value in axes.items():
+            # Как _bin: 100 попадает в последний интервал
+            bin_ = case((value >= 100, BINS - 1), else_=value // 10)
+            stmt = select(*columns[:3], literal(axis), bin_, func.count(), func.sum(value), func.sum(value * value)) \
+                .select_from(from_).where(and_(where, value.between(0, 100))).group_by(*keys[:-1], bin_)
+            db.execute(A.__table__.insert().from_select(
+                ["source", "day", "gender", "axis", "bin", "candidates", "total", "squares"], stmt))
+
+
+# --- Чтение сводки ---
+
+def _group_columns(table, period: Optional[str], by_gender: bool):
+    columns = []
+    if period == "day":
+        columns.append(table.day.label("period"))
+    elif period == "month":
+        columns.append(func.substr(table.day, 1, 7).label("period"))
+    if by_gender:
+        columns.append(table.gender.label("gender"))
+    return columns
+
+
+def _window(stmt, table, source: str, since: Optional[date], until: Optional[date]):
+    stmt = stmt.where(table.source == source)
+    if since is not None:
+        stmt = stmt.where(table.day >= _day(since))
+    if until is not None:
+        stmt = stmt.where(table.day < _day(until))
+    return stmt
+
+
+def _group_key(row, period, by_gender):
+    return (row.period if period else None, (row.gender or None) if by_gender else None)
+
+
+def _histogram(counts: Dict[int, int]) -> List[dict]:
+    return [{"lo": i * 10, "hi": 100 if i == BINS - 1 else i * 10 + 9, "candidates": counts.get(i, 0)}
+            for i in range(BINS)]
+
+
+def population(db: Session, source: str, period: Optional[str] = None, by_gender: bool = False,
+               since: Optional[date] = None, until: Optional[date] = None) -> dict:
+    """Распределение типов и статистика осей по когортам — только по сводным таблицам.
+
+    Два GROUP BY по result_type_counts и result_axis_bins: их размер зависит
+    от числа дней, типов и интервалов осей, а не от числа кандидатов.
+    """
+    type_cols = _group_columns(T, period, by_gender)
+    stmt = select(*type_cols, T.mbti_type, func.sum(T.candidates).label("candidates"))
+    stmt = _window(stmt, T, source, since, until).group_by(*type_cols, T.mbti_type) \
+        .having(func.sum(T.candidates) > 0)
+
+    groups = {}
+
+    def group(key):
+        if key not in groups:
+            groups[key] = {"period": key[0], "gender": key[1], "candidates": 0, "types": {}, "axes": {}}
+        return groups[key]
+
+    for row in db.execute(stmt):
+        item = group(_group_key(row, period, by_gender))
+        item["candidates"] += int(row.candidates)
+        if row.mbti_type:
+            item["types"][row.mbti_type] = int(row.candidates)
+
+    axis_cols = _group_columns(A, period, by_gender)
+    stmt = select(
+        *axis_cols, A.axis, A.bin,
+        func.sum(A.candidates).label("candidates"),
+        func.sum(A.total).label("total"),
+        func.sum(A.squares).label("squares"),
+    )
+    stmt = _window(stmt, A, source, since, until).group_by(*axis_cols, A.axis, A.bin)
+    for row in db.execute(stmt):
+        axes = group(_group_key(row, period, by_gender))["axes"]
+        stats = axes.setdefault(row.axis, {"axis": row.axis, "candidates": 0, "total": 0, "squares": 0,
+                                           "histogram": {}})
+        stats["candidates"] += int(row.candidates)
+        stats["total"] += int(row.total)
+        stats["squares"] += int(row.squares)
+        stats["histogram"][row.bin] = int(row.candidates)
+
+    result = []
+    for key in sorted(groups, key=lambda k: (k[0] or "", k[1] or "")):
+        item = groups[key]
+        item["types"] = dict(sorted(item["types"].items(), key=lambda kv: (-kv[1], kv[0])))
+        axes = []
+        for axis in AXES:
+            stats = item["axes"].get(axis)
+            if stats is None or stats["candidates"] <= 0:
+                continue
+            n = stats["candidates"]
+            mean = stats.pop("total") / n
+            variance = stats.pop("squares") / n - mean * mean
+            stats.update(mean=round(mean, 2), std=round(math.sqrt(max(variance, 0.0)), 2),
+                         histogram=_histogram(stats["histogram"]))
+            axes.append(stats)
+        item["axes"] = axes
+        result.append(item)
+    return {"source": source, "since": since, "until": until, "groups": result}
@@ -0,0 +1,160 @@
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .. import models, database
+from . import analytics
+from .dashboard import STATIC_TEST_STEPS
+
+LETTERS = ("E", "I", "S", "N", "T", "F", "J", "P")
+EMPTY = "."    # вопрос без ответа
+UNKNOWN = "?"  # ответ с ключом не из LETTERS: хранится, но в баллы не идет
+
+
+def mbti_type(counts: Dict[str, int]) -> str:
+    return "".join([
+        "E" if counts["E"] >= counts["I"] else "I",
+        "S" if counts["S"] >= counts["N"] else "N",
+        "T" if counts["T"] >= counts["F"] else "F",
+        "J" if counts["J"] >= counts["P"] else "P"
+    ])
+
+
+def _letter(selected_key: Optional[str]) -> str:
+    return selected_key if selected_key in LETTERS else UNKNOWN
+
+
+def _counts(vector: models.UserAnswerVector) -> Dict[str, int]:
+    return {letter: getattr(vector, letter.lower()) or 0 for letter in LETTERS}
+
+
+def _apply(vector: models.UserAnswerVector, answers: Dict[int, str]):
+    """Вписывает ответы в вектор и поправляет счетчики только по изменившимся позициям."""
+    packed = list(vector.answers or "")
+    counts = _counts(vector)
+    for question_id, selected_key in answers.items():
+        pos = question_id - 1
+        # Вектор не длиннее каталога: чужой id не должен раздувать строку и шаг теста
+        if not 0 <= pos < STATIC_TEST_STEPS:
+            raise ValueError(f"question_id {question_id} вне каталога (1..{STATIC_TEST_STEPS})")
+        if pos >= len(packed):
+            packed.extend(EMPTY * (pos + 1 - len(packed)))
+        old, new = packed[pos], _letter(selected_key)
+        if old in counts:
+            counts[old] -= 1
+        if new in counts:
+            counts[new] += 1
+        packed[pos] = new
+
+    vector.answers = "".join(packed)
+    vector.answered = len(packed) - packed.count(EMPTY)
+    for letter, value in counts.items():
+        setattr(vector, letter.lower(), value)
+
+
+def _static_result(vector: models.UserAnswerVector, gender: Optional[str]) -> Optional[analytics.Contribution]:
+    """Вклад пройденного теста в сводку аналитики; None — тест еще не пройден."""
+    if vector.completed_at is None:
+        return None
+    counts = _counts(vector)
+    axes = [analytics.axis_share(counts[a.upper()], counts[b.upper()]) for a, b in ("ei", "sn", "tf", "jp")]
+    return analytics.contribution(analytics.STATIC, vector.completed_at, gender, mbti_type(counts), axes)
+
+
+def _answers_from_rows(db: Session, user_id: str) -> Dict[int, str]:
+    rows = db.execute(
+        select(models.UserAnswer.question_id, models.UserAnswer.selected_key)
+        .where(models.UserAnswer.user_id == user_id)
+        .order_by(models.UserAnswer.id)
+    ).all()
+    # При дублях по вопросу берется последний ответ; строки с id вне каталога (старые данные) не учитываются
+    return {row.question_id: row.selected_key for row in rows
+            if row.question_id is not None and 1 <= row.question_id <= STATIC_TEST_STEPS}
+
+
+def _upsert_rows(db: Session, user_id: str, answers: Dict[int, str]):
+    """Один INSERT ... ON CONFLICT (user_id, question_id) DO UPDATE на весь лист."""
+    stmt = database.dialect_insert(db, models.UserAnswer).values([
+        {"user_id": user_id, "question_id": question_id, "selected_key": key}
+        for question_id, key in answers.items()
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "question_id"],
+        set_={"selected_key": stmt.excluded.selected_key},
+    ))
+
+
+def build_vector(db: Session, user_id: str) -> models.UserAnswerVector:
+    """Новый (несохраненный) вектор, собранный из строк user_answers."""
+    vector = models.UserAnswerVector(user_id=user_id, answers="", answered=0,
+                                     **{letter.lower(): 0 for letter in LETTERS})
+    _apply(vector, _answers_from_rows(db, user_id))
+    return vector
+
+
+def _lock_vector(db: Session, user_id: str) -> Optional[models.UserAnswerVector]:
+    return db.execute(
+        select(models.UserAnswerVector)
+        .where(models.UserAnswerVector.user_id == user_id)
+        .with_for_update()
+    ).scalar_one_or_none()
+
+
+def save_answers(db: Session, user_id: str, answers: Dict[int, str]) -> int:
+    """Идемпотентно сохраняет ответы теста {question_id: selected_key}.
+
+    Прежние ответы на те же вопросы заменяются, вектор ответов и счетчики
+    букв обновляются инкрементально, шаг теста = число разных отвеченных
+    вопросов, поэтому повторная отправка того же листа ничего не меняет.
+    Сводка аналитики (services/analytics.py) меняется в той же транзакции.
+    Возвращает новый current_static_step; коммит за вызывающим.
+    """
+    vector = _lock_vector(db, user_id)
+    if vector is None:
+        # Первая отправка: пустой вектор вставляется ON CONFLICT DO NOTHING, чтобы две
+        # параллельные первые отправки не столкнулись на первичном ключе, и затем блокируется.
+        # Пользователь мог отвечать до появления векторов — старые ответы переносит тот, кто вставил
+        created = db.execute(
+            database.dialect_insert(db, models.UserAnswerVector)
+            .values(user_id=user_id, answers="", answered=0, **{letter.lower(): 0 for letter in LETTERS})
+            .on_conflict_do_nothing(index_elements=["user_id"])
+        ).rowcount
+        vector = _lock_vector(db, user_id)
+        if created:
+            _apply(vector, _answers_from_rows(db, user_id))
+
+    user = db.get(models.User, user_id)
+    before = _static_result(vector, user.gender)
+    if answers:
+        _apply(vector, answers)
+        _upsert_rows(db, user_id, answers)
+    if vector.completed_at is None and vector.answered >= STATIC_TEST_STEPS:
+        vector.completed_at = datetime.utcnow()
+    analytics.apply_change(db, before, _static_result(vector, user.gender))
+
+    user.current_static_step = vector.answered
+    return vector.answered
+
+
+def get_scores(db: Session, user_id: str) -> Optional[Dict[str, int]]:
+    """Баллы по восьми буквам из одной строки user_answer_vectors. None — ответов нет."""
+    vector = db.get(models.UserAnswerVector, user_id)
+    if vector is None:
+        # Еще не перенесен в векторы (см. backfill_answers) — считаем по строкам, не сохраняя
+        vector = build_vector(db, user_id)
+    if not vector.answered:
+        return None
+    return _counts(vector)
+
+
+def unknown_question_ids(db: Session, question_ids) -> set:
+    """id из списка, которых нет в static_questions."""
+    ids = set(question_ids)
+    if not ids:
+        return set()
+    known = db.execute(
+        select(models.StaticQuestion.id).where(models.StaticQuestion.id.in_(ids))
+    ).scalars()
+    return ids - set(known)
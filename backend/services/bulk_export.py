@@ -0,0 +1,121 @@
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+import zipfile
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional
+
+from . import pdf_service
+
+logger = logging.getLogger("HR_SYSTEM")
+
+# Верхняя граница кандидатов в одном архиве
+EXPORT_MAX_USERS = int(os.getenv("EXPORT_MAX_USERS", "500"))
+# Сколько отчетов готовится одновременно; готовые, но еще не отданные PDF держатся в памяти только в этом окне
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", str(pdf_service.PDF_WORKERS * 2)))
+
+
+class _ChunkSink:
+    """Файлоподобный приемник для ZipFile без seek/tell.
+
+    ZipFile в таком режиме пишет data descriptor после каждого файла,
+    поэтому архив можно отдавать кусками по мере записи.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _safe_filename(name: Optional[str]) -> str:
+    cleaned = re.sub(r'[\\/:*?"<>|\s]+', "_", (name or "").strip()).strip("_")
+    return cleaned[:60] or "Candidate"
+
+
+async def _render_one(user: dict, collect: Callable[[str], Awaitable[Optional[dict]]]) -> dict:
+    """Готовит PDF одного кандидата. Ошибки не бросаются — они попадают в манифест."""
+    started = time.perf_counter()
+    entry = {"user_id": user["id"], "name": user.get("name")}
+    try:
+        data = await collect(user["id"])
+        if data is None:
+            entry.update(status="not_found")
+            return entry
+        entry["name"] = data.get("name")
+        pdf = await pdf_service.render_pdf(data)
+        entry.update(status="ok", pdf=pdf)
+    except Exception as e:
+        logger.error(f"❌ Экспорт: ошибка PDF для {user['id']}: {e}")
+        entry.update(status="error", error=str(e))
+    finally:
+        entry["render_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return entry
+
+
+async def stream_zip(users: List[dict], collect: Callable[[str], Awaitable[Optional[dict]]],
+                     concurrency: int = EXPORT_CONCURRENCY):
+    """Асинхронный генератор ZIP-архива с PDF-отчетами кандидатов.
+
+    Рендер идет параллельно в пуле процессов pdf_service, файлы пишутся
+    в архив в порядке готовности и сразу отдаются клиенту. В конец архива
+    кладется manifest.json со статусом по каждому кандидату.
+    """
+    sink = _ChunkSink()
+    archive = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED)
+    manifest = []
+    queue = list(reversed(users))
+    running = set()
+    done_count = 0
+    started = time.perf_counter()
+
+    try:
+        while queue or running:
+            while queue and len(running) < max(concurrency, 1):
+                running.add(asyncio.ensure_future(_render_one(queue.pop(), collect)))
+            finished, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in finished:
+                entry = task.result()
+                done_count += 1
+                pdf = entry.pop("pdf", None)
+                if pdf is not None:
+                    entry["file"] = f"{done_count:04d}_{_safe_filename(entry['name'])}_{entry['user_id'][:8]}.pdf"
+                    entry["bytes"] = len(pdf)
+                    info = zipfile.ZipInfo(entry["file"], date_time=datetime.now().timetuple()[:6])
+                    # PDF уже сжат внутри, повторный deflate только тратит CPU
+                    archive.writestr(info, pdf, compress_type=zipfile.ZIP_STORED)
+                manifest.append(entry)
+                logger.info(f"📦 Экспорт: {done_count}/{len(users)} {entry['user_id']} — {entry['status']}")
+                chunk = sink.drain()
+                if chunk:
+                    yield chunk
+
+        summary = {
+            "total": len(users),
+            "ok": sum(1 for e in manifest if e["status"] == "ok"),
+            "failed": sum(1 for e in manifest if e["status"] != "ok"),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            "candidates": manifest,
+        }
+        archive.writestr("manifest.json", json.dumps(summary, ensure_ascii=False, indent=2))
+        archive.close()
+        yield sink.drain()
+        logger.info(f"✅ Экспорт: архив готов, {summary['ok']} из {summary['total']} отчетов")
+    finally:
+        # Клиент отключился — не рендерим остаток впустую
+        for task in running:
+            task.cancel()
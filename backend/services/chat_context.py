@@ -0,0 +1,102 @@
+import os
+from typing import List, Optional, Tuple
+
+from . import report_parser
+
+# Бюджет входных токенов на одну реплику: системный промпт + сводка + история
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "8000"))
+# Сколько последних реплик всегда уходит в модель дословно
+MIN_RECENT_MESSAGES = int(os.getenv("CHAT_CONTEXT_MIN_RECENT", "6"))
+# При переполнении история ужимается до этой доли бюджета, чтобы сводка
+# обновлялась редко, а префикс запроса оставался стабильным для кеша OpenAI
+COMPACT_TARGET_RATIO = float(os.getenv("CHAT_CONTEXT_COMPACT_RATIO", "0.6"))
+# Потолок сводки — доля того же бюджета: сверх него отбрасываются самые старые LOG-строки
+SUMMARY_MAX_RATIO = float(os.getenv("CHAT_CONTEXT_SUMMARY_RATIO", "0.25"))
+
+# Накладные токены на служебную разметку одного сообщения
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_HEADER = "СВОДКА РАННИХ РЕПЛИК (уже собранные LOG-доказательства, сами реплики сжаты):"
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка токенов без токенизатора: ~3 символа кириллицы на токен."""
+    return len(text or "") // 3 + MESSAGE_OVERHEAD_TOKENS
+
+
+def extract_log_evidence(content: str) -> List[str]:
+    return [log.raw for log in report_parser.parse(content).logs]
+
+
+def _append_to_summary(summary: str, old_messages: List[dict]) -> str:
+    lines = [f"- {log}" for msg in old_messages if msg["role"] == "assistant"
+             for log in extract_log_evidence(msg["content"])]
+    if not lines:
+        return summary
+    if summary:
+        return summary + "\n" + "\n".join(lines)
+    return "\n".join(lines)
+
+
+def _cap_summary(summary: str, max_tokens: int) -> str:
+    """Оставляет самые свежие строки сводки, укладывающиеся в max_tokens."""
+    if estimate_tokens(summary) <= max_tokens:
+        return summary
+    lines = summary.split("\n")
+    kept, tokens = [], MESSAGE_OVERHEAD_TOKENS
+    for line in reversed(lines):
+        tokens += len(line) // 3 + 1
+        if tokens > max_tokens:
+            break
+        kept.append(line)
+    return "\n".join(reversed(kept))
+
+
+def build_context(
+    system_prompt: str,
+    messages: List[dict],
+    summary: str = "",
+    summary_upto_id: int = 0,
+    budget: int = CONTEXT_TOKEN_BUDGET,
+) -> Tuple[List[dict], Optional[Tuple[str, int]]]:
+    """Собирает messages для OpenAI в пределах бюджета токенов.
+
+    messages — реплики одного типа чата ({"id", "role", "content"}) по порядку.
+    Всё, что уже вошло в сводку (id <= summary_upto_id), в модель дословно
+    не отправляется. Если остаток не помещается в бюджет, самые старые реплики
+    сжимаются: их LOG-доказательства дописываются в сводку инкрементально.
+    Сама сводка не растет дальше SUMMARY_MAX_RATIO бюджета — старые строки уходят.
+
+    Возвращает (openai_messages, (новая_сводка, новый_upto_id) или None,
+    если сводка не изменилась).
+    """
+    recent = [m for m in messages if m["id"] > summary_upto_id]
+
+    updated = None
+    summary_limit = int(budget * SUMMARY_MAX_RATIO)
+    capped = _cap_summary(summary, summary_limit)
+    if capped != summary:
+        # Сводка, накопленная до появления потолка, ужимается при первом обращении
+        summary = capped
+        updated = (summary, summary_upto_id)
+
+    fixed = estimate_tokens(system_prompt) + (estimate_tokens(summary) if summary else 0)
+    history_budget = max(budget - fixed, 0)
+    history_tokens = sum(estimate_tokens(m["content"]) for m in recent)
+
+    if history_tokens > history_budget and len(recent) > MIN_RECENT_MESSAGES:
+        target = int(history_budget * COMPACT_TARGET_RATIO)
+        cut = 0
+        while history_tokens > target and len(recent) - cut > MIN_RECENT_MESSAGES:
+            history_tokens -= estimate_tokens(recent[cut]["content"])
+            cut += 1
+        compacted, recent = recent[:cut], recent[cut:]
+        summary = _cap_summary(_append_to_summary(summary, compacted), summary_limit)
+        updated = (summary, compacted[-1]["id"])
+
+    openai_messages = [{"role": "system", "content": system_prompt}]
+    if summary:
+        openai_messages.append({"role": "system", "content": f"{SUMMARY_HEADER}\n{summary}"})
+    for msg in recent:
+        openai_messages.append({"role": msg["role"], "content": msg["content"]})
+    return openai_messages, updated
@@ -0,0 +1,30 @@
+import json
+
+import anyio
+from starlette.responses import StreamingResponse
+
+
+def sse_event(event: str, data) -> str:
+    """Одно событие Server-Sent Events с JSON в поле data."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse, который всегда вызывает on_close после ответа.
+
+    finally генератора и background срабатывают не всегда: если клиент ушел до
+    первого байта (ASGI 2.4+ бросает OSError уже на http.response.start), генератор
+    не стартует, а background не запускается. on_close вызывается на уровне ответа
+    при любом исходе и должен быть идемпотентным.
+    """
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.on_close()
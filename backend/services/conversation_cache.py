@@ -0,0 +1,166 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# Кеш живет в памяти одного процесса. При нескольких воркерах uvicorn реплику мог
+# сохранить другой воркер, поэтому попадание сверяется с базой (число и последний id
+# реплик — один запрос по индексу) и при расхождении история читается заново.
+# По умолчанию сверка включается только при WEB_CONCURRENCY > 1 (так uvicorn задает
+# число воркеров); Dockerfile запускает один воркер. Явно: CONV_CACHE_VERIFY=1/0.
+CACHE_ENABLED = os.getenv("CONV_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+CACHE_VERIFY = os.getenv(
+    "CONV_CACHE_VERIFY", "1" if int(os.getenv("WEB_CONCURRENCY") or "1") > 1 else "0"
+).lower() not in ("0", "false", "no")
+CACHE_MAX_USERS = int(os.getenv("CONV_CACHE_MAX_USERS", "1000"))
+CACHE_MAX_CHARS = int(os.getenv("CONV_CACHE_MAX_CHARS", str(32 * 1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.getenv("CONV_CACHE_TTL", "900"))
+
+
+@dataclass
+class ConversationState:
+    """Состояние диалога одного пользователя, нужное для очередной реплики."""
+    user_id: str
+    name: str
+    gender: str
+    system_prompt: str
+    # chat_type -> реплики по порядку ({"id", "role", "content"})
+    history: Dict[str, List[dict]] = field(default_factory=dict)
+    summary: str = ""
+    summary_upto_id: int = 0
+    touched_at: float = field(default_factory=time.monotonic)
+
+    def size(self) -> int:
+        """Примерный объем в символах — для ограничения памяти кеша."""
+        return len(self.system_prompt) + len(self.summary) + sum(
+            len(m["content"] or "") for msgs in self.history.values() for m in msgs
+        )
+
+
+class ConversationCache:
+    """LRU + TTL кеш состояний диалогов с записью сквозь кеш (write-through).
+
+    Ограничен и числом пользователей, и суммарным объемом текста.
+    """
+
+    def __init__(self, enabled=CACHE_ENABLED, max_users=CACHE_MAX_USERS,
+                 max_chars=CACHE_MAX_CHARS, ttl=CACHE_TTL_SECONDS, verify=CACHE_VERIFY):
+        self.enabled = enabled
+        self.verify = verify
+        self.max_users = max_users
+        self.max_chars = max_chars
+        self.ttl = ttl
+        self._items: "OrderedDict[str, ConversationState]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._total_chars = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {"lru": 0, "ttl": 0, "size": 0, "stale": 0}
+
+    def get(self, user_id: str) -> Optional[ConversationState]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            state = self._items.get(user_id)
+            if state is None:
+                self.misses += 1
+                return None
+            if time.monotonic() - state.touched_at > self.ttl:
+                self._drop(user_id)
+                self.evictions["ttl"] += 1
+                self.misses += 1
+                return None
+            self._items.move_to_end(user_id)
+            state.touched_at = time.monotonic()
+            self.hits += 1
+            return state
+
+    def put(self, state: ConversationState):
+        if not self.enabled:
+            return
+        with self._lock:
+            if state.user_id in self._items:
+                self._drop(state.user_id)
+            state.touched_at = time.monotonic()
+            self._items[state.user_id] = state
+            self._sizes[state.user_id] = state.size()
+            self._total_chars += self._sizes[state.user_id]
+            self._evict()
+
+    def append_message(self, user_id: str, chat_type: str, message: dict):
+        """Дописывает сохраненную в базу реплику, если диалог уже в кеше."""
+        if not self.enabled:
+            return
+        with self._lock:
+            state = self._items.get(user_id)
+            if state is None or chat_type not in state.history:
+                # Историю этого типа загрузим из базы при первом обращении
+                return
+            state.history[chat_type].append(message)
+            added = len(message["content"] or "")
+            self._sizes[user_id] += added
+            self._total_chars += added
+            self._evict()
+
+    def set_summary(self, user_id: str, summary: str, upto_id: int):
+        if not self.enabled:
+            return
+        with self._lock:
+            state = self._items.get(user_id)
+            if state is None:
+                return
+            delta = len(summary) - len(state.summary)
+            state.summary, state.summary_upto_id = summary, upto_id
+            self._sizes[user_id] += delta
+            self._total_chars += delta
+
+    def mark_stale(self, user_id: str):
+        """Состояние разошлось с базой (реплику записал другой воркер) — выбрасываем."""
+        with self._lock:
+            if user_id in self._items:
+                self._drop(user_id)
+                self.evictions["stale"] += 1
+                # get() уже засчитал попадание, которого на деле не было
+                self.hits -= 1
+                self.misses += 1
+
+    def invalidate(self, user_id: Optional[str] = None):
+        with self._lock:
+            if user_id is None:
+                self._items.clear()
+                self._sizes.clear()
+                self._total_chars = 0
+            elif user_id in self._items:
+                self._drop(user_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "verify": self.verify,
+                "entries": len(self._items),
+                "chars": self._total_chars,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "evictions": dict(self.evictions),
+            }
+
+    def _drop(self, user_id: str):
+        self._items.pop(user_id, None)
+        self._total_chars -= self._sizes.pop(user_id, 0)
+
+    def _evict(self):
+        while len(self._items) > self.max_users:
+            self._drop(next(iter(self._items)))
+            self.evictions["lru"] += 1
+        while self._total_chars > self.max_chars and len(self._items) > 1:
+            self._drop(next(iter(self._items)))
+            self.evictions["size"] += 1
+
+
+conversation_cache = ConversationCache()
@@ -0,0 +1,138 @@
+import base64
+import json
+from typing import Optional
+
+from sqlalchemy import and_, exists, func, literal_column, or_, select
+from sqlalchemy.orm import Session
+
+from .. import models
+
+# Шаг, начиная с которого психометрический тест считается пройденным
+STATIC_TEST_STEPS = 56
+
+# Допустимые значения фильтра ?status=...
+STATUSES = ("test_pending", "test_done", "chat", "no_chat", "profile_done", "profile_pending")
+
+
+def _status_columns():
+    """Флаги статуса кандидата в виде SQL-выражений (коррелированные EXISTS).
+
+    Считаются базой только для строк текущей страницы, поэтому стоимость
+    запроса не зависит от общего числа кандидатов и сообщений.
+    """
+    has_chat = exists().where(
+        models.ChatMessage.user_id == models.User.id,
+        models.ChatMessage.role == "assistant",
+    )
+    # Финальный флаг готовности AI-анализа: отчет <REPORT> уже сохранен в ai_reports
+    has_report = exists().where(
+        models.AIReport.user_id == models.User.id,
+        models.AIReport.source == "text",
+    )
+    return has_chat, has_report
+
+
+def _status_filter(status: str, has_chat, has_report):
+    step = func.coalesce(models.User.current_static_step, 0)
+    return {
+        "test_pending": step < STATIC_TEST_STEPS,
+        "test_done": step >= STATIC_TEST_STEPS,
+        "chat": has_chat,
+        "no_chat": ~has_chat,
+        "profile_done": has_report,
+        "profile_pending": ~has_report,
+    }[status]
+
+
+def encode_cursor(name: Optional[str], user_id: str) -> str:
+    raw = json.dumps([name or "", user_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str):
+    """Возвращает (name, id) последней строки предыдущей страницы или бросает ValueError."""
+    try:
+        name, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"Некорректный cursor: {e}")
+    return str(name), str(user_id)
+
+
+def users_statement(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+):
+    """Один SQL-запрос на всю страницу дашборда HR.
+
+    Сортировка по (name, id) — keyset-пагинация: следующая страница начинается
+    строго после пары из cursor, без OFFSET. Фильтры выполняются в базе.
+    Некорректный cursor — ValueError.
+    """
+    has_chat, has_report = _status_columns()
+    # Литерал, а не bind-параметр: иначе база не сопоставит выражение с индексом ix_users_sort_name
+    sort_name = func.coalesce(models.User.name, literal_column("''"))
+
+    stmt = select(
+        models.User.id,
+        models.User.name,
+        models.User.gender,
+        models.User.current_static_step,
+        has_chat.label("has_chat"),
+        has_report.label("has_report"),
+        sort_name.label("sort_name"),
+    )
+
+    if status:
+        stmt = stmt.where(_status_filter(status, has_chat, has_report))
+    if name_prefix:
+        stmt = stmt.where(models.User.name.startswith(name_prefix, autoescape=True))
+    if cursor:
+        last_name, last_id = decode_cursor(cursor)
+        # Первое условие дает базе поиск по диапазону индекса ix_users_sort_name,
+        # второе отсекает уже показанные строки с тем же именем
+        stmt = stmt.where(and_(
+            sort_name >= last_name,
+            or_(sort_name > last_name, models.User.id > last_id),
+        ))
+
+    stmt = stmt.order_by(sort_name, models.User.id)
+    if limit is not None:
+        # Берем на одну строку больше, чтобы узнать, есть ли следующая страница
+        stmt = stmt.limit(limit + 1)
+    return stmt
+
+
+def users_page(rows, limit: Optional[int] = None):
+    """Строки users_statement -> (items, next_cursor)."""
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].sort_name, rows[-1].id)
+
+    items = [
+        {
+            "id": row.id,
+            "name": row.name,
+            "gender": row.gender,
+            "current_static_step": row.current_static_step,
+            "is_test_done": (row.current_static_step or 0) >= STATIC_TEST_STEPS,
+            "has_chat": bool(row.has_chat),
+            "has_voice": bool(row.has_report),  # Финальный флаг готовности всего AI-анализа
+        }
+        for row in rows
+    ]
+    return items, next_cursor
+
+
+def query_users(
+    db: Session,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+):
+    """Страница дашборда через синхронную сессию. Возвращает (items, next_cursor)."""
+    rows = db.execute(users_statement(limit, cursor, status, name_prefix)).all()
+    return users_page(rows, limit)
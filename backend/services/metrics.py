@@ -0,0 +1,315 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("HR_SYSTEM")
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+# Период пробы задержки event loop
+LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.1"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        yield from super().render()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # key -> [счетчики по корзинам..., +Inf], сумма
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def render(self):
+        yield from super().render()
+        with self._lock:
+            items = sorted((key, (counts[:], total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+http_requests = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса (до последнего байта ответа)",
+    ("method", "route", "status")))
+http_in_progress = REGISTRY.register(Gauge(
+    "http_requests_in_progress", "HTTP-запросы в обработке", ("method",)))
+db_queries = REGISTRY.register(Histogram(
+    "db_query_duration_seconds", "Время одного SQL-запроса", ("operation",), DB_BUCKETS))
+db_queries_per_request = REGISTRY.register(Histogram(
+    "db_queries_per_request", "Число SQL-запросов за HTTP-запрос", ("route",), COUNT_BUCKETS))
+db_time_per_request = REGISTRY.register(Histogram(
+    "db_time_per_request_seconds", "Суммарное время SQL за HTTP-запрос", ("route",)))
+openai_requests = REGISTRY.register(Histogram(
+    "openai_request_duration_seconds", "Время вызова OpenAI (для потока — до последнего чанка)", ("api",)))
+openai_first_token = REGISTRY.register(Histogram(
+    "openai_first_token_seconds", "Время до первого чанка потокового ответа OpenAI", ("api",)))
+openai_errors = REGISTRY.register(Counter(
+    "openai_errors_total", "Ошибки вызовов OpenAI", ("api", "error")))
+openai_queue_wait = REGISTRY.register(Histogram(
+    "openai_queue_wait_seconds", "Ожидание слота в планировщике вызовов OpenAI", ("api",)))
+openai_in_flight = REGISTRY.register(Gauge(
+    "openai_in_flight", "Вызовы OpenAI, занявшие слот планировщика"))
+openai_queued = REGISTRY.register(Gauge(
+    "openai_queued", "Вызовы OpenAI в очереди планировщика"))
+openai_retries = REGISTRY.register(Counter(
+    "openai_retries_total", "Повторы вызовов OpenAI после 429/5xx/сетевых ошибок", ("api", "reason")))
+openai_shed = REGISTRY.register(Counter(
+    "openai_shed_total", "Вызовы, отклоненные планировщиком с Retry-After", ("api", "reason")))
+voice_sessions = REGISTRY.register(Gauge(
+    "voice_sessions_active", "Открытые голосовые сессии"))
+voice_frames = REGISTRY.register(Counter(
+    "voice_ws_frames_total", "Кадры голосового websocket по направлениям", ("direction",)))
+loop_lag = REGISTRY.register(Histogram(
+    "event_loop_lag_seconds", "Опоздание пробуждения event loop относительно расписания", (), LAG_BUCKETS))
+loop_lag_last = REGISTRY.register(Gauge(
+    "event_loop_lag_last_seconds", "Последнее измеренное опоздание event loop"))
+
+# Направления кадров голосового чата
+CLIENT_IN = "client_in"        # фронт -> сервер
+UPSTREAM_OUT = "upstream_out"  # сервер -> OpenAI (после склейки аудио)
+UPSTREAM_IN = "upstream_in"    # OpenAI -> сервер
+CLIENT_OUT = "client_out"      # сервер -> фронт
+
+
+class _RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# Статистика SQL текущего HTTP-запроса; контекст наследуют и threadpool, и run_sync
+_request_stats: ContextVar[Optional[_RequestStats]] = ContextVar("request_db_stats", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    db_queries.observe(elapsed, operation=statement.lstrip()[:16].split(" ", 1)[0].upper())
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: гистограммы HTTP по шаблону маршрута и SQL на запрос.
+
+    Маршрут берется из scope["route"] после роутинга (/users/{user_id}, а не
+    конкретный id), поэтому число рядов метрики не растет с числом кандидатов.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = {"code": 500}
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        http_in_progress.inc(method=method)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        route = "unmatched"
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            http_in_progress.dec(method=method)
+            matched = scope.get("route")
+            if matched is not None:
+                route = getattr(matched, "path", route)
+            http_requests.observe(time.perf_counter() - started, method=method, route=route, status=status["code"])
+            db_queries_per_request.observe(stats.queries, route=route)
+            if stats.queries:
+                db_time_per_request.observe(stats.db_seconds, route=route)
+
+
+async def _watch_loop_lag(interval: float):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - started - interval, 0.0)
+        loop_lag.observe(lag)
+        loop_lag_last.set(lag)
+
+
+_lag_task: Optional[asyncio.Task] = None
+
+
+def start_loop_monitor(interval: float = LOOP_LAG_INTERVAL):
+    """Фоновая проба event loop; вызывается на старте приложения."""
+    global _lag_task
+    if METRICS_ENABLED and _lag_task is None:
+        _lag_task = asyncio.get_running_loop().create_task(_watch_loop_lag(interval))
+        logger.info(f"📈 Метрики: проба event loop каждые {interval * 1000:.0f} мс, /metrics")
+
+
+async def stop_loop_monitor():
+    global _lag_task
+    if _lag_task is not None:
+        _lag_task.cancel()
+        await asyncio.gather(_lag_task, return_exceptions=True)
+        _lag_task = None
+
+
+class track_openai:
+    """Замер вызова OpenAI: with track_openai("chat"): ... ; ошибки считаются по типу."""
+
+    def __init__(self, api: str):
+        self.api = api
+        self.started = 0.0
+        self.elapsed_ms = 0.0
+        self.first_token_seen = False
+
+    def first_token(self):
+        if not self.first_token_seen:
+            self.first_token_seen = True
+            openai_first_token.observe(time.perf_counter() - self.started, api=self.api)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        self.elapsed_ms = elapsed * 1000
+        openai_requests.observe(elapsed, api=self.api)
+        if exc_type is not None and not issubclass(exc_type, asyncio.CancelledError):
+            openai_errors.inc(api=self.api, error=exc_type.__name__)
+        return False
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,54 @@
+import os
+import logging
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import parse_qs, urlparse
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger("HR_SYSTEM")
+
+# Лимиты общего пула HTTP-соединений к OpenAI (на один воркер uvicorn)
+MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "50"))
+MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+REQUEST_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+# Адреса API можно подменить (прокси, локальный стенд из benchmarks/mock_openai.py)
+BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+REALTIME_URL = os.getenv("OPENAI_REALTIME_URL", "wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview")
+REALTIME_MODEL = parse_qs(urlparse(REALTIME_URL).query).get("model", ["realtime"])[0]
+
+_async_client: Optional["AsyncOpenAI"] = None
+
+
+def get_async_client() -> "AsyncOpenAI":
+    """Единый асинхронный клиент OpenAI с ограниченным пулом соединений.
+
+    Создается при первом обращении и переиспользуется всеми запросами воркера,
+    поэтому keep-alive соединения не открываются заново на каждую реплику.
+    Пакет openai (сотни модулей типов) импортируется здесь же, а не при старте.
+    """
+    global _async_client
+    if _async_client is None:
+        import httpx
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE,
+            ),
+            timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=10.0),
+        )
+        # Повторы 429/5xx делает планировщик (services/upstream.py): с паузами по общей очереди,
+        # а не по три скрытых попытки внутри одного слота
+        _async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=BASE_URL, http_client=http_client,
+                                    max_retries=0)
+        logger.info(f"🔌 OpenAI: пул соединений создан (max={MAX_CONNECTIONS}, keep-alive={MAX_KEEPALIVE})")
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
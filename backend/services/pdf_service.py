@@ -0,0 +1,143 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+logger = logging.getLogger("HR_SYSTEM")
+
+# Рендер PDF грузит CPU, поэтому идет в отдельных процессах, а не в event loop
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(2, os.cpu_count() or 1))))
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+# fpdf/fontTools (~0.3 с импорта) нужны только процессам пула: API их не импортирует вовсе
+def _init_worker():
+    from .report_generator import preload_assets
+    preload_assets()
+
+
+def _render(data: dict) -> bytes:
+    from .report_generator import create_pdf_report
+    return create_pdf_report(data)
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn, а не fork: пул создается по первому отчету, когда в процессе уже есть потоки,
+            # и fork мог унести в дочерний процесс чужую захваченную блокировку (импорт, логи)
+            _executor = ProcessPoolExecutor(max_workers=PDF_WORKERS, initializer=_init_worker,
+                                            mp_context=multiprocessing.get_context("spawn"))
+            logger.info(f"🖨️ PDF: пул из {PDF_WORKERS} процессов запущен")
+    return _executor
+
+
+def prewarm():
+    """Поднимает процессы пула заранее: шрифты и логотип разбираются до первого отчета."""
+    executor = get_executor()
+    for future in [executor.submit(os.getpid) for _ in range(PDF_WORKERS)]:
+        future.result()
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _drop_broken_executor(broken: ProcessPoolExecutor):
+    """Убирает сломанный пул; следующий get_executor() поднимет новый."""
+    global _executor
+    with _executor_lock:
+        # Пул мог уже пересоздать параллельный запрос — тогда новый не трогаем
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def _render_in_pool(data: dict) -> bytes:
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    try:
+        return await loop.run_in_executor(executor, _render, data)
+    except BrokenProcessPool as e:
+        # Процесс пула убит (OOM killer, segfault в fontTools): без пересоздания пул сломан навсегда
+        logger.error(f"💥 PDF: пул процессов сломан, пересоздаем и повторяем: {e}")
+        _drop_broken_executor(executor)
+        return await loop.run_in_executor(get_executor(), _render, data)
+
+
+def report_key(data: dict) -> str:
+    """Адрес отчета в кеше — хеш всех входных данных рендера."""
+    raw = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class PdfCache:
+    """LRU-кеш готовых PDF, ограниченный суммарным размером в байтах."""
+
+    def __init__(self, max_bytes=PDF_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        pdf = self._items.get(key)
+        if pdf is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return pdf
+
+    def put(self, key: str, pdf: bytes):
+        if len(pdf) > self.max_bytes or key in self._items:
+            return
+        self._items[key] = pdf
+        self._bytes += len(pdf)
+        while self._bytes > self.max_bytes:
+            _, old = self._items.popitem(last=False)
+            self._bytes -= len(old)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._items), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+pdf_cache = PdfCache()
+# Рендеры в процессе: параллельные запросы одного и того же отчета ждут один результат
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+async def render_pdf(data: dict, key: Optional[str] = None) -> bytes:
+    key = key or report_key(data)
+    cached = pdf_cache.get(key)
+    if cached is not None:
+        return cached
+
+    inflight = _inflight.get(key)
+    if inflight is not None:
+        return await asyncio.shield(inflight)
+
+    future = asyncio.ensure_future(_render_in_pool(data))
+    _inflight[key] = future
+    try:
+        pdf = await asyncio.shield(future)
+    finally:
+        _inflight.pop(key, None)
+    pdf_cache.put(key, pdf)
+    return pdf
@@ -0,0 +1,114 @@
+import os
+import gzip
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from .. import models, schemas, database
+
+logger = logging.getLogger("HR_SYSTEM")
+
+# Ключ в app_meta: меняется при каждом пересеве вопросов
+VERSION_KEY = "questions_version"
+# Как часто сверять версию каталога с базой (сиды запускаются отдельным процессом)
+RECHECK_SECONDS = float(os.getenv("CATALOG_RECHECK_SECONDS", "30"))
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Готовый ответ GET /questions: тело, его gzip-версия и ETag."""
+    version: Optional[str]
+    body: bytes
+    gzip_body: bytes
+    etag: str
+    count: int
+
+    @property
+    def gzip_etag(self) -> str:
+        # Сжатое представление — другие байты, поэтому и сильный ETag у него свой
+        return self.etag + "-gz"
+
+
+def _read_version(db: Session) -> Optional[str]:
+    row = db.get(models.AppMeta, VERSION_KEY)
+    return row.value if row else None
+
+
+def _build(db: Session) -> CatalogSnapshot:
+    version = _read_version(db)
+    questions = db.query(models.StaticQuestion).order_by(models.StaticQuestion.id).all()
+    payload = [schemas.QuestionResponse.model_validate(q, from_attributes=True).model_dump() for q in questions]
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return CatalogSnapshot(
+        version=version,
+        body=body,
+        gzip_body=gzip.compress(body, compresslevel=9, mtime=0),
+        etag=hashlib.sha256(body).hexdigest()[:32],
+        count=len(payload),
+    )
+
+
+class QuestionCatalog:
+    """Каталог вопросов теста, сериализованный один раз и отдаваемый из памяти.
+
+    Снимок пересобирается, только если сменилась версия в app_meta
+    (ее меняет invalidate_catalog из seed.py / fix_db.py). Версия
+    сверяется с базой не чаще раза в RECHECK_SECONDS.
+    """
+
+    def __init__(self, recheck_seconds=RECHECK_SECONDS):
+        self.recheck_seconds = recheck_seconds
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def get(self, db: Session = None) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.recheck_seconds:
+            return snapshot
+
+        with self._lock:
+            own_session = db is None
+            db = db or database.SessionLocal()
+            try:
+                if self._snapshot is None or _read_version(db) != self._snapshot.version:
+                    self._snapshot = _build(db)
+                    self.builds += 1
+                    logger.info(f"📚 Каталог вопросов собран: {self._snapshot.count} шт., ETag {self._snapshot.etag[:8]}")
+                self._checked_at = time.monotonic()
+                return self._snapshot
+            finally:
+                if own_session:
+                    db.close()
+
+    def reset(self):
+        """Сбрасывает снимок в этом процессе; следующий запрос соберет его заново."""
+        with self._lock:
+            self._snapshot = None
+            self._checked_at = 0.0
+
+
+question_catalog = QuestionCatalog()
+
+
+def invalidate_catalog(db: Session):
+    """Хук для сидов: новая версия каталога в app_meta + сброс локального снимка.
+
+    Коммитит сам — вызывать после того, как вопросы уже сохранены.
+    """
+    row = db.get(models.AppMeta, VERSION_KEY)
+    if row is None:
+        row = models.AppMeta(key=VERSION_KEY)
+        db.add(row)
+    row.value = uuid.uuid4().hex
+    db.commit()
+    question_catalog.reset()
+    logger.info("📚 Каталог вопросов помечен устаревшим")
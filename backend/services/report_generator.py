@@ -1,19 +1,73 @@
 import os
 import re
-from fpdf import FPDF
+import copy
+import logging
+from fpdf import FPDF, FPDF_VERSION
+from fpdf.fonts import SubsetMap
+from fpdf.image_parsing import preload_image
+from fontTools import ttLib
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+LOGO_PATH = os.path.join(BASE_DIR, "logo.png")
+
+# Шрифты и логотип, разобранные один раз на процесс (см. preload_assets)
+_assets = None
+# _clone_font опирается на внутренние поля fpdf2; проверено на версии из requirements.txt.
+# На другой версии шрифты добавляются в каждый документ заново (медленнее, но без риска)
+CLONE_FPDF_VERSIONS = ("2.8.5",)
+
+def _add_report_fonts(pdf):
+    pdf.add_font("ArialRus", "", os.path.join(BASE_DIR, "arial.ttf"))
+    pdf.add_font("ArialRus", "B", os.path.join(BASE_DIR, "arialbd.ttf"))
+
+def preload_assets():
+    """Один раз разбирает arial.ttf/arialbd.ttf и сжимает logo.png.
+
+    Вызывается инициализатором воркера PDF. Каждый следующий отчет берет
+    готовые метрики шрифтов и данные картинки вместо повторного разбора.
+    """
+    global _assets
+    # Подробные INFO-логи сабсеттера fontTools на каждый отчет не нужны
+    logging.getLogger("fontTools").setLevel(logging.WARNING)
+    if FPDF_VERSION not in CLONE_FPDF_VERSIONS:
+        logging.getLogger("HR_SYSTEM").warning(
+            f"⚠️ PDF: fpdf2 {FPDF_VERSION} не проверен для общих шрифтов, шрифты грузятся на каждый отчет")
+        return
+    template = FPDF()
+    _add_report_fonts(template)
+    if os.path.exists(LOGO_PATH):
+        preload_image(template.image_cache, LOGO_PATH)
+    _assets = template
+
+def _clone_font(template_font, pdf):
+    # Метрики (cw, cmap, glyph_ids, desc) только читаются — их разделяем.
+    # Сабсеттер при выводе меняет ttfont, поэтому он и SubsetMap — свои у каждого документа.
+    font = copy.copy(template_font)
+    font.i = len(pdf.fonts) + 1
+    font.ttfont = ttLib.TTFont(font.ttffile, recalcTimestamp=False, fontNumber=0, lazy=True)
+    font.missing_glyphs = []
+    font.biggest_size_pt = 0
+    font._hbfont = None
+    font.subset = SubsetMap(font)
+    return font
 
 class NeuroHRReport(FPDF):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.add_font("ArialRus", "", os.path.join(BASE_DIR, "arial.ttf"), uni=True)
-        self.add_font("ArialRus", "B", os.path.join(BASE_DIR, "arialbd.ttf"), uni=True)
+        if _assets is None:
+            _add_report_fonts(self)
+            return
+        for fontkey, template_font in _assets.fonts.items():
+            self.fonts[fontkey] = _clone_font(template_font, self)
+        for name, info in _assets.image_cache.images.items():
+            info = copy.copy(info)
+            info["usages"] = 0
+            self.image_cache.images[name] = info
+        self.image_cache.icc_profiles = dict(_assets.image_cache.icc_profiles)
 
     def header(self):
-        logo_path = os.path.join(BASE_DIR, "logo.png")
-        if os.path.exists(logo_path):
-            self.image(logo_path, x=75, y=10, w=60)
+        if os.path.exists(LOGO_PATH):
+            self.image(LOGO_PATH, x=75, y=10, w=60)
             self.ln(45)
         self.set_font("ArialRus", "B", 12)
         self.cell(0, 6, "МБОО САГ «Братские сердца» | Дмитрий Кравченко", ln=True, align="C")
@@ -42,7 +96,8 @@ class NeuroHRReport(FPDF):
         if dominant_letter: display_text += f" ({dominant_letter})"
         self.cell(0, 8, display_text, ln=True)
 
-def create_pdf_report(data: dict, file_path: str):
+def create_pdf_report(data: dict, file_path: str = None):
+    """Рисует отчет. Без file_path возвращает PDF как bytes (без временных файлов)."""
     pdf = NeuroHRReport()
     pdf.set_auto_page_break(auto=True, margin=15)
     pdf.add_page()
@@ -105,4 +160,6 @@ def create_pdf_report(data: dict, file_path: str):
             pdf.set_font("ArialRus", "", 9)
             pdf.write(5, txt + "\n\n")
 
+    if file_path is None:
+        return bytes(pdf.output())
     pdf.output(file_path)
\ No newline at end of file
@@ -0,0 +1,339 @@
+import re
+import ast
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger("HR_SYSTEM")
+
+LOG_OPEN = "[[LOG:"
+LOG_CLOSE = "]]"
+REPORT_OPEN = "<REPORT>"
+REPORT_CLOSE = "</REPORT>"
+# Марина путает скобки: тег ищем по имени, "<", "</" и ">" вокруг него необязательны
+MARIN_TAG = "MARIN_REPORT"
+
+TEXT_REPORT = "REPORT"
+VOICE_REPORT = MARIN_TAG
+
+_TEXT, _LOG, _REPORT, _MARIN = range(4)
+_OPEN_TAGS = (LOG_OPEN, REPORT_OPEN, MARIN_TAG)
+# Что придерживать на границе чанка: "<" перед MARIN_REPORT тоже часть тега
+_HOLD_TAGS = _OPEN_TAGS + ("<" + MARIN_TAG,)
+_LONGEST_TAG = len("</" + MARIN_TAG)
+
+_FENCE = re.compile(r"```(?:json)?", re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_LOG_KEYS = {
+    "axis": "axis", "ось": "axis",
+    "value": "value", "значение": "value",
+    "conf": "confidence", "confidence": "confidence", "уверенность": "confidence",
+    "reasoning": "reasoning", "обоснование": "reasoning",
+}
+_LOG_FIELDS = ("axis", "value", "confidence", "reasoning")
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+@dataclass
+class LogRecord:
+    """[[LOG: Axis: ось | Value: значение | Conf: уверенность% | Reasoning: обоснование]]"""
+    axis: str = ""
+    value: str = ""
+    confidence: Optional[int] = None  # проценты; None, если модель не указала число
+    reasoning: str = ""
+    raw: str = ""                     # содержимое блока в одну строку
+
+
+@dataclass
+class Report:
+    tag: str                # TEXT_REPORT или VOICE_REPORT — каким тегом модель обернула блок
+    data: Optional[dict]    # None, если JSON не удалось восстановить
+    raw: str
+    repaired: bool = False  # JSON пришлось чинить (двойные скобки, хвостовые запятые, обрыв)
+
+
+class Chunk(NamedTuple):
+    visible: str
+    logs: List[LogRecord]
+    reports: List[Report]
+
+
+@dataclass
+class ParseResult:
+    visible: str  # текст для кандидата: без LOG-блоков и отчетов
+    prefix: str   # сырой текст до первого отчета (LOG-блоки на месте) — поле "text" ответа /chat
+    logs: List[LogRecord] = field(default_factory=list)
+    reports: List[Report] = field(default_factory=list)
+
+    @property
+    def report(self) -> Optional[dict]:
+        """Первый отчет, который удалось разобрать."""
+        for report in self.reports:
+            if report.data is not None:
+                return report.data
+        return None
+
+
+def parse_log(raw: str) -> LogRecord:
+    """Поля LOG-блока: по ключам "Axis:", "Value:"... или по позиции, если ключей нет."""
+    text = " ".join(raw.split())
+    fields, positional = {}, []
+    for part in text.split("|", len(_LOG_FIELDS) - 1):
+        key, sep, value = part.partition(":")
+        name = _LOG_KEYS.get(key.strip().lower()) if sep else None
+        if name and name not in fields:
+            fields[name] = value.strip()
+        else:
+            positional.append(part.strip())
+    for name in _LOG_FIELDS:
+        if name not in fields and positional:
+            fields[name] = positional.pop(0)
+    number = _NUMBER.search(fields.get("confidence", ""))
+    confidence = int(float(number.group().replace(",", "."))) if number else None
+    return LogRecord(fields.get("axis", ""), fields.get("value", ""), confidence, fields.get("reasoning", ""), text)
+
+
+def _balance(text: str) -> str:
+    """Обрезает текст после закрытия корневого объекта или дописывает недостающие скобки."""
+    closers = []
+    in_string = escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            closers.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if closers and closers[-1] == ch:
+                closers.pop()
+            if not closers:
+                return text[:i + 1]
+    if in_string:
+        text += '"'
+    return text.rstrip().rstrip(",") + "".join(reversed(closers))
+
+
+def repair_json(text: str) -> Tuple[Optional[dict], bool]:
+    """(объект, чинили ли) для JSON отчета; (None, ...) — восстановить не удалось."""
+    candidate = (text or "").strip()
+    try:
+        data = json.loads(candidate)
+        if isinstance(data, dict):
+            return data, False
+    except (ValueError, RecursionError):
+        pass
+
+    candidate = _FENCE.sub("", candidate).strip().strip('"').strip()
+    # Модель повторила экранирование из промпта: {{ ... }}
+    if candidate.startswith("{{"):
+        candidate = candidate.replace("{{", "{").replace("}}", "}")
+    start = candidate.find("{")
+    candidate = "{" + candidate if start == -1 else candidate[start:]
+    candidate = _balance(candidate)
+
+    for attempt in (candidate, _TRAILING_COMMA.sub(r"\1", candidate)):
+        try:
+            data = json.loads(attempt)
+        except (ValueError, RecursionError):
+            continue
+        if isinstance(data, dict):
+            return data, True
+    try:
+        # Python-литерал: одинарные кавычки, True/None
+        data = ast.literal_eval(candidate)
+        if isinstance(data, dict):
+            return data, True
+    except Exception:
+        # Испорченный вывод модели валит literal_eval не только ValueError/SyntaxError:
+        # { {...} } или "[" дают TypeError (unhashable). Разбор отчета не должен ронять запись реплики
+        pass
+    return None, True
+
+
+def _partial_tag_len(data: str, start: int, tags) -> int:
+    """Длина хвоста data[start:], который может оказаться началом одного из тегов."""
+    tail = data[max(start, len(data) - _LONGEST_TAG + 1):]
+    longest = 0
+    for tag in tags:
+        # Кандидаты — только позиции первого символа тега; обычный текст отсеивается одним find
+        i = tail.find(tag[0])
+        while i != -1 and len(tail) - i > longest:
+            if len(tail) - i < len(tag) and tag.startswith(tail[i:]):
+                longest = len(tail) - i
+                break
+            i = tail.find(tag[0], i + 1)
+    return longest
+
+
+class StreamParser:
+    """Однопроходный разбор ответа модели по мере поступления текста.
+
+    Вытаскивает LOG-блоки и отчеты (<REPORT>...</REPORT>, MARIN_REPORT в любых
+    скобках) и отдает видимый кандидату текст. Каждый символ просматривается
+    один раз: между чанками придерживается только возможное начало тега.
+    hide_after_report — скрывать всё после начала отчета (текстовый чат);
+    в голосе текст после отчета остается видимым.
+    """
+
+    def __init__(self, hide_after_report: bool = True):
+        self.hide_after_report = hide_after_report
+        self.logs: List[LogRecord] = []
+        self.reports: List[Report] = []
+        self._mode = _TEXT
+        self._held = ""
+        self._block: List[str] = []
+        self._prefix: List[str] = []
+        self._shown: List[str] = []
+        self._in_prefix = True
+        self._hidden = False
+        self._started = False
+        self._skip_gt = False
+
+    def feed(self, chunk: str) -> Chunk:
+        data = self._held + chunk
+        self._held = ""
+        visible: List[str] = []
+        logs: List[LogRecord] = []
+        reports: List[Report] = []
+        # Позиция следующего вхождения каждого тега в data — чтобы не искать повторно
+        found = {}
+        pos = 0
+        n = len(data)
+
+        while pos < n:
+            if self._skip_gt:
+                self._skip_gt = False
+                if data[pos] == ">":
+                    pos += 1
+                    continue
+
+            if self._mode == _TEXT:
+                at, tag = n, None
+                for candidate in _OPEN_TAGS:
+                    i = found.get(candidate)
+                    if i is None or i != -1 and i < pos:
+                        i = data.find(candidate, pos)
+                        found[candidate] = i
+                    if i != -1 and i < at:
+                        at, tag = i, candidate
+                if tag is None:
+                    keep = _partial_tag_len(data, pos, _HOLD_TAGS)
+                    self._text(data[pos:n - keep], visible)
+                    self._held = data[n - keep:]
+                    break
+                segment = data[pos:at]
+                if tag == MARIN_TAG and segment.endswith("<"):
+                    segment = segment[:-1]
+                self._text(segment, visible)
+                pos = at + len(tag)
+                if tag == LOG_OPEN:
+                    self._mode = _LOG
+                    if self._in_prefix:
+                        self._prefix.append(LOG_OPEN)
+                else:
+                    self._mode = _REPORT if tag == REPORT_OPEN else _MARIN
+                    self._skip_gt = tag == MARIN_TAG
+                    self._in_prefix = False
+                continue
+
+            close = LOG_CLOSE if self._mode == _LOG else REPORT_CLOSE if self._mode == _REPORT else MARIN_TAG
+            end = data.find(close, pos)
+            if end == -1:
+                keep = _partial_tag_len(data, pos, (close, "</" + close) if self._mode == _MARIN else (close,))
+                self._block.append(data[pos:n - keep])
+                if self._mode == _LOG and self._in_prefix:
+                    self._prefix.append(data[pos:n - keep])
+                self._held = data[n - keep:]
+                break
+            body = data[pos:end]
+            pos = end + len(close)
+            if self._mode == _LOG:
+                if self._in_prefix:
+                    self._prefix.append(body + LOG_CLOSE)
+                self._block.append(body)
+                logs.append(self._close_log())
+            else:
+                if self._mode == _MARIN:
+                    self._skip_gt = True
+                    body = body[:-2] if body.endswith("</") else body[:-1] if body.endswith("<") else body
+                self._block.append(body)
+                reports.append(self._close_report())
+
+        return self._chunk(visible, logs, reports)
+
+    def finish(self) -> Chunk:
+        """Конец ответа: отдает придержанный хвост и закрывает оборванный отчет."""
+        held, self._held = self._held, ""
+        visible, reports = [], []
+        if self._mode == _TEXT:
+            self._text(held, visible)
+        elif self._mode in (_REPORT, _MARIN):
+            # Отчет без закрывающего тега — разбираем то, что успело прийти
+            self._block.append(held)
+            reports.append(self._close_report())
+        else:
+            # Оборванный LOG-блок не доказательство: отбрасываем
+            self._block = []
+            self._mode = _TEXT
+        return self._chunk(visible, [], reports)
+
+    def result(self) -> ParseResult:
+        """Итог разбора (после finish())."""
+        return ParseResult("".join(self._shown).strip(), "".join(self._prefix).strip(), self.logs, self.reports)
+
+    def _chunk(self, visible: List[str], logs: List[LogRecord], reports: List[Report]) -> Chunk:
+        text = self._visible("".join(visible))
+        if text:
+            self._shown.append(text)
+        return Chunk(text, logs, reports)
+
+    def _text(self, segment: str, visible: List[str]):
+        if not segment:
+            return
+        if self._in_prefix:
+            self._prefix.append(segment)
+        if not self._hidden:
+            visible.append(segment)
+
+    def _close_log(self) -> LogRecord:
+        record = parse_log("".join(self._block))
+        self._block = []
+        self._mode = _TEXT
+        self.logs.append(record)
+        return record
+
+    def _close_report(self) -> Report:
+        raw = "".join(self._block).strip()
+        tag = TEXT_REPORT if self._mode == _REPORT else VOICE_REPORT
+        data, repaired = repair_json(raw)
+        if data is None:
+            logger.error(f"💀 Отчет {tag} не разобран: {raw[:200]}")
+        report = Report(tag, data, raw, repaired)
+        self._block = []
+        self._mode = _TEXT
+        self._hidden = self.hide_after_report
+        self.reports.append(report)
+        return report
+
+    def _visible(self, text: str) -> str:
+        # Ответ бота начинается с LOG-блока: убираем отступ перед первым словом
+        if not self._started:
+            text = text.lstrip()
+            if text:
+                self._started = True
+        return text
+
+
+def parse(text: str, hide_after_report: bool = True) -> ParseResult:
+    """Разбор целого ответа (непотоковый /chat, стенограмма Марины, старые реплики)."""
+    parser = StreamParser(hide_after_report)
+    parser.feed(text or "")
+    parser.finish()
+    return parser.result()
@@ -0,0 +1,100 @@
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .. import models, database
+from . import analytics, report_parser
+
+logger = logging.getLogger("HR_SYSTEM")
+
+TEXT = "text"    # Алекс, блок <REPORT> в текстовом чате
+VOICE = "voice"  # Марина, блок MARIN_REPORT в голосовом чате
+# Сами блоки разбирает services/report_parser.py
+
+
+def _metric(metrics: dict, key: str) -> Optional[int]:
+    try:
+        return int(float(metrics.get(key)))
+    except (TypeError, ValueError):
+        return None
+
+
+def upsert_report(db: Session, user_id: str, source: str, report: dict, created_at: Optional[datetime] = None):
+    """Записывает структурированный отчет; повторный отчет того же источника заменяет прежний.
+
+    Один INSERT ... ON CONFLICT (user_id, source): параллельные реплики одного
+    кандидата не упираются в уникальный ключ. Сводка аналитики переносится
+    со старого отчета на новый в той же транзакции. Коммит остается за вызывающим кодом.
+    created_at — время реплики с отчетом для перенесенных задним числом (по умолчанию — сейчас).
+    """
+    metrics = report.get("metrics") if isinstance(report.get("metrics"), dict) else {}
+    skill_gaps = report.get("skill_gaps")
+    values = {
+        "mbti_type": report.get("mbti_type"),
+        "e_i": _metric(metrics, "E_I"),
+        "s_n": _metric(metrics, "S_N"),
+        "t_f": _metric(metrics, "T_F"),
+        "j_p": _metric(metrics, "J_P"),
+        "skill_gaps": skill_gaps if isinstance(skill_gaps, list) else None,
+        "summary": report.get("summary"),
+        "raw": report,
+    }
+    R = models.AIReport
+    old = db.execute(
+        select(R.mbti_type, R.e_i, R.s_n, R.t_f, R.j_p, R.created_at)
+        .where(R.user_id == user_id, R.source == source)
+        .with_for_update()
+    ).one_or_none()
+    inserted = {"created_at": created_at} if created_at is not None else {}
+    stmt = database.dialect_insert(db, R).values(user_id=user_id, source=source, **values, **inserted)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "source"],
+        set_={**values, "updated_at": func.now()},
+    ))
+
+    gender = db.scalar(select(models.User.gender).where(models.User.id == user_id))
+    before = None
+    if old is not None:
+        before = analytics.contribution(source, old.created_at, gender, old.mbti_type,
+                                        (old.e_i, old.s_n, old.t_f, old.j_p))
+    # created_at при замене отчета не меняется; новый отчет — сегодняшний день
+    after = analytics.contribution(source, old.created_at if old is not None else created_at, gender,
+                                   values["mbti_type"], (values["e_i"], values["s_n"], values["t_f"], values["j_p"]))
+    analytics.apply_change(db, before, after)
+
+
+def get_reports(db: Session, user_id: str) -> dict:
+    """{источник: отчет} одним запросом по индексу (user_id, source)."""
+    rows = db.query(models.AIReport).filter(models.AIReport.user_id == user_id).all()
+    return {row.source: row.raw for row in rows}
+
+
+def backfill_from_messages(db: Session, only_missing: bool = False) -> int:
+    """Разбирает сохраненные реплики и заполняет ai_reports последним отчетом каждого источника.
+
+    Для данных, накопленных до записи отчетов в момент получения. Повторный запуск
+    безопасен; only_missing — не трогать отчеты, которые уже есть в ai_reports.
+    Возвращает число записанных отчетов; коммит за вызывающим.
+    """
+    messages = db.query(models.ChatMessage).filter(
+        models.ChatMessage.role == "assistant",
+        models.ChatMessage.content.contains("REPORT"),
+    ).order_by(models.ChatMessage.user_id, models.ChatMessage.timestamp, models.ChatMessage.id).yield_per(500)
+
+    latest = {}
+    for msg in messages:
+        # Источник — по чату, а не по тегу: Марина иногда пишет <REPORT> вместо MARIN_REPORT
+        report = report_parser.parse(msg.content or "").report
+        if report:
+            source = VOICE if msg.chat_type == "voice" else TEXT
+            latest[(msg.user_id, source)] = (report, msg.timestamp)
+
+    if only_missing and latest:
+        existing = set(db.execute(select(models.AIReport.user_id, models.AIReport.source)).tuples())
+        latest = {key: value for key, value in latest.items() if key not in existing}
+    for (user_id, source), (report, timestamp) in latest.items():
+        upsert_report(db, user_id, source, report, created_at=timestamp)
+    return len(latest)
@@ -0,0 +1,168 @@
+import io
+import os
+import csv
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import and_, func, select, union
+from sqlalchemy.orm import aliased
+
+from .. import models, database
+from .answers import LETTERS, get_scores, mbti_type
+from .reports import TEXT, VOICE
+
+logger = logging.getLogger("HR_SYSTEM")
+
+FORMATS = ("ndjson", "csv")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+# Строк за одну выборку курсора: в памяти одновременно не больше одной пачки
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "500"))
+
+V = models.UserAnswerVector
+_REPORTS = {TEXT: aliased(models.AIReport, name="text_report"), VOICE: aliased(models.AIReport, name="voice_report")}
+_AXES = ("E_I", "S_N", "T_F", "J_P")
+_REPORT_COLUMNS = ("mbti_type", "e_i", "s_n", "t_f", "j_p", "skill_gaps", "summary", "updated_at")
+
+CSV_COLUMNS = (
+    ["user_id", "name", "gender", "test_step", "updated_at", "static_type"]
+    + [f"static_{letter}" for letter in LETTERS]
+    + [f"{source}_{field}" for source in (TEXT, VOICE)
+       for field in ("mbti_type", *_AXES, "skill_gaps", "summary", "updated_at")]
+)
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    # В базе время UTC без пояса (CURRENT_TIMESTAMP / now()), так же и сравниваем
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _iso(value) -> Optional[str]:
+    if value is None:
+        return None
+    return value.isoformat(sep=" ") if isinstance(value, datetime) else str(value)
+
+
+def results_statement(updated_since: Optional[datetime] = None):
+    """Один запрос на всю выгрузку: кандидат + вектор ответов + отчеты Алекса и Марины.
+
+    updated_since отбирает кандидатов, у которых с этого момента менялись ответы
+    теста или отчеты: id собираются по индексам updated_at, а не перебором всех строк.
+    """
+    columns = [models.User.id, models.User.name, models.User.gender, models.User.current_static_step,
+               V.answered, V.updated_at.label("static_updated_at")]
+    # Метки с префиксом: у Row есть свои атрибуты (row.t — кортеж значений)
+    columns += [getattr(V, letter.lower()).label(f"static_{letter}") for letter in LETTERS]
+    for source, report in _REPORTS.items():
+        columns += [getattr(report, name).label(f"{source}_{name}") for name in _REPORT_COLUMNS]
+
+    stmt = select(*columns).outerjoin(V, V.user_id == models.User.id)
+    for source, report in _REPORTS.items():
+        stmt = stmt.outerjoin(report, and_(report.user_id == models.User.id, report.source == source))
+
+    since = _utc(updated_since)
+    if since is not None:
+        changed = union(
+            select(V.user_id).where(V.updated_at >= since),
+            select(models.AIReport.user_id).where(models.AIReport.updated_at >= since),
+        )
+        stmt = stmt.where(models.User.id.in_(changed))
+    return stmt.order_by(models.User.id)
+
+
+def _report(row, source: str) -> Optional[dict]:
+    prefix = f"{source}_"
+    if getattr(row, prefix + "updated_at") is None and getattr(row, prefix + "mbti_type") is None:
+        return None
+    return {
+        "mbti_type": getattr(row, prefix + "mbti_type"),
+        "metrics": {axis: getattr(row, prefix + axis.lower()) for axis in _AXES},
+        "skill_gaps": getattr(row, prefix + "skill_gaps") or [],
+        "summary": getattr(row, prefix + "summary"),
+        "updated_at": _iso(getattr(row, prefix + "updated_at")),
+    }
+
+
+def _record(row, legacy_scores: Optional[dict] = None) -> dict:
+    if row.answered:
+        counts = {letter: getattr(row, f"static_{letter}") or 0 for letter in LETTERS}
+    else:
+        counts = legacy_scores
+    stamps = [s for s in (row.static_updated_at, row.text_updated_at, row.voice_updated_at) if s is not None]
+    return {
+        "user_id": row.id,
+        "name": row.name,
+        "gender": row.gender,
+        "test_step": row.current_static_step or 0,
+        "updated_at": _iso(max(stamps)) if stamps else None,
+        "static": {**counts, "type": mbti_type(counts)} if counts else None,
+        TEXT: _report(row, TEXT),
+        VOICE: _report(row, VOICE),
+    }
+
+
+def _csv_row(record: dict) -> list:
+    static = record["static"] or {}
+    values = [record["user_id"], record["name"], record["gender"], record["test_step"], record["updated_at"],
+              static.get("type")]
+    values += [static.get(letter) for letter in LETTERS]
+    for source in (TEXT, VOICE):
+        report = record[source] or {}
+        metrics = report.get("metrics") or {}
+        values += [report.get("mbti_type"), *(metrics.get(axis) for axis in _AXES),
+                   "; ".join(str(gap) for gap in report.get("skill_gaps") or []),
+                   report.get("summary"), report.get("updated_at")]
+    return values
+
+
+async def _legacy_scores(user_id: str) -> Optional[dict]:
+    # Ответы еще не перенесены в user_answer_vectors (см. backfill_answers): считаем по строкам
+    async with database.AsyncSessionLocal() as db:
+        return await db.run_sync(get_scores, user_id)
+
+
+async def stream_results(fmt: str, updated_since: Optional[datetime] = None,
+                         yield_per: int = EXPORT_YIELD_PER) -> AsyncIterator[bytes]:
+    """NDJSON или CSV по всем кандидатам, пачками по yield_per строк.
+
+    Строки читаются серверным курсором (stream + yield_per): память не растет
+    с числом кандидатов, первая пачка уходит клиенту до конца выборки.
+    """
+    started = time.perf_counter()
+    total = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer:
+        writer.writerow(CSV_COLUMNS)
+
+    async with database.AsyncSessionLocal() as db:
+        result = await db.stream(results_statement(updated_since), execution_options={"yield_per": yield_per})
+        async for rows in result.partitions():
+            for row in rows:
+                legacy = None
+                if not row.answered and row.current_static_step:
+                    legacy = await _legacy_scores(row.id)
+                record = _record(row, legacy)
+                if writer:
+                    writer.writerow(_csv_row(record))
+                else:
+                    buffer.write(json.dumps(record, ensure_ascii=False))
+                    buffer.write("\n")
+            total += len(rows)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+    if writer and total == 0:
+        yield buffer.getvalue().encode("utf-8")
+    logger.info(f"📤 Выгрузка результатов ({fmt}): {total} кандидатов за {time.perf_counter() - started:.1f} с")
+
+
+async def watermark() -> str:
+    """Время базы на начало выгрузки — updated_since для следующей инкрементальной."""
+    async with database.AsyncSessionLocal() as db:
+        return _iso(await db.scalar(select(func.now())))
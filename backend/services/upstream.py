@@ -0,0 +1,335 @@
+import os
+import time
+import math
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+from . import metrics
+
+logger = logging.getLogger("HR_SYSTEM")
+
+# Одновременных вызовов OpenAI на воркер; остальные ждут в очереди
+MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+# Лимит токенов в минуту на воркер (0 — без лимита): запрос резервирует оценку, после ответа — факт
+TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TPM", "0"))
+# Оценка ответа модели в токенах: резервируется до того, как известен usage
+COMPLETION_ESTIMATE = int(os.getenv("OPENAI_COMPLETION_ESTIMATE", "600"))
+# Сколько запрос может ждать очереди и пауз между повторами, прежде чем получить "занято"
+DEADLINE = float(os.getenv("OPENAI_DEADLINE", "20"))
+MAX_ATTEMPTS = int(os.getenv("OPENAI_MAX_ATTEMPTS", "4"))
+BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "8"))
+
+
+class UpstreamBusy(Exception):
+    """OpenAI сейчас не успеет ответить до дедлайна: клиенту — 503 и Retry-After."""
+
+    def __init__(self, retry_after: float, reason: str):
+        super().__init__(f"OpenAI перегружен ({reason}), повторите через {math.ceil(retry_after)} с")
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.reason = reason
+
+
+def estimate_tokens(messages, completion: int = COMPLETION_ESTIMATE) -> int:
+    """Грубая оценка запроса до вызова: ~3 символа на токен (кириллица) плюс ответ."""
+    return sum(len(str(m.get("content") or "")) for m in messages) // 3 + completion
+
+
+def status_of(exc: BaseException) -> Optional[int]:
+    """HTTP-статус ответа OpenAI; 0 — сеть или таймаут; None — ошибка не от OpenAI."""
+    status = getattr(exc, "status_code", None)
+    if isinstance(status, int):
+        return status
+    from openai import APIConnectionError  # пакет уже загружен клиентом
+    return 0 if isinstance(exc, APIConnectionError) else None
+
+
+def _retryable(status: Optional[int]) -> bool:
+    return status is not None and (status in (0, 408, 409, 429) or status >= 500)
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """Пауза, которую просит сам OpenAI (retry-after-ms / retry-after), в секундах."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(headers.get(name)) * scale
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+class TokenBucket:
+    """Токены в минуту: емкость — минутный лимит, пополнение равномерное.
+
+    Уровень может уйти в минус, если ответ оказался длиннее оценки: следующие
+    запросы ждут, пока долг не погасится.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, tokens: int) -> float:
+        if not self.capacity:
+            return 0.0
+        self._refill()
+        need = min(tokens, self.capacity) - self.level
+        return need / self.rate if need > 0 else 0.0
+
+    def take(self, tokens: int):
+        if self.capacity:
+            self._refill()
+            self.level -= min(tokens, self.capacity)
+
+    def adjust(self, tokens: int):
+        if self.capacity:
+            self._refill()
+            self.level = min(self.capacity, self.level - tokens)
+
+
+class _Waiter:
+    __slots__ = ("user_id", "tokens", "future")
+
+    def __init__(self, user_id: str, tokens: int, future: asyncio.Future):
+        self.user_id = user_id
+        self.tokens = tokens
+        self.future = future
+
+
+class Lease:
+    """Занятый слот планировщика; освобождается на выходе из async with.
+
+    result — ответ OpenAI (для потока — объект стрима, который читают внутри with).
+    """
+
+    def __init__(self, scheduler: "UpstreamScheduler", tokens: int, result, started: float):
+        self.result = result
+        self._scheduler = scheduler
+        self._tokens = tokens
+        self._started = started
+        self._released = False
+
+    def settle(self, used_tokens: Optional[int]):
+        """Фактический расход по usage вместо оценки, зарезервированной при входе."""
+        if used_tokens is not None:
+            self._scheduler.bucket.adjust(used_tokens - self._tokens)
+            self._tokens = used_tokens
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._scheduler._release(time.monotonic() - self._started)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class UpstreamScheduler:
+    """Общий шлюз вызовов OpenAI для воркера.
+
+    - не больше max_concurrency вызовов одновременно и tokens_per_minute токенов в минуту;
+    - очередь честная: у каждого кандидата своя, слоты раздаются по кругу,
+      поэтому частые реплики одного кандидата не задерживают остальных;
+    - 429, 5xx и сетевые ошибки повторяются с экспоненциальной паузой и jitter
+      (или паузой из retry-after); 429 приостанавливает выдачу слотов всем;
+    - если ожидание очереди или повтора не укладывается в дедлайн, вызов сразу
+      получает UpstreamBusy с оценкой, через сколько повторить.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, tokens_per_minute=TOKENS_PER_MINUTE, deadline=DEADLINE,
+                 max_attempts=MAX_ATTEMPTS, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX):
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(tokens_per_minute)
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._queues: Dict[str, Deque[_Waiter]] = {}
+        self._ring: Deque[str] = deque()  # кандидаты с ожидающими вызовами, в порядке обслуживания
+        self._queued = 0
+        self._in_flight = 0
+        self._cooldown_until = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Среднее время удержания слота (EWMA): по нему оценивается ожидание в очереди
+        self._service_time = 1.0
+        self.calls = 0
+        self.retries = 0
+        self.shed = 0
+
+    async def open(self, api: str, user_id: str, call: Callable[[], Awaitable], tokens: int,
+                   deadline: Optional[float] = None) -> Lease:
+        """Ждет слот, вызывает call() с повторами и возвращает Lease с ответом.
+
+        Слот держится до выхода из async with — для потока это все чтение чанков.
+        Ошибку, которую нельзя или уже некогда повторять, пробрасывает как есть.
+        """
+        deadline = time.monotonic() + (self.deadline if deadline is None else deadline)
+        attempt = 0
+        while True:
+            attempt += 1
+            await self._acquire(api, user_id, tokens, deadline)
+            started = time.monotonic()
+            try:
+                result = await call()
+            except BaseException as e:
+                self._release(time.monotonic() - started)
+                # Неудачная попытка токенов не потратила — резерв возвращается
+                self.bucket.adjust(-tokens)
+                status = status_of(e) if isinstance(e, Exception) else None
+                if not _retryable(status) or attempt >= self.max_attempts:
+                    raise
+                delay = self._backoff(attempt, e)
+                if status == 429:
+                    self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+                if time.monotonic() + delay > deadline:
+                    self._shed(api, "retry_deadline")
+                    raise UpstreamBusy(delay, f"OpenAI ответил {status or 'ошибкой сети'}") from e
+                self.retries += 1
+                metrics.openai_retries.inc(api=api, reason=str(status or "network"))
+                logger.warning(f"🔁 OpenAI {api}: {status or type(e).__name__}, повтор {attempt} через {delay:.1f} с")
+                await asyncio.sleep(delay)
+                continue
+            self.calls += 1
+            return Lease(self, tokens, result, started)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self._in_flight,
+            "queued": self._queued,
+            "queued_users": len(self._ring),
+            "max_concurrency": self.max_concurrency,
+            "tokens_per_minute": self.bucket.capacity,
+            "token_level": round(self.bucket.level) if self.bucket.capacity else None,
+            "cooldown_s": round(max(0.0, self._cooldown_until - time.monotonic()), 2),
+            "avg_service_s": round(self._service_time, 3),
+            "calls": self.calls,
+            "retries": self.retries,
+            "shed": self.shed,
+        }
+
+    def _backoff(self, attempt: int, exc: BaseException) -> float:
+        # Full jitter: равномерно от 0 до экспоненты, чтобы повторы воркеров не совпадали
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+        hinted = _retry_after(exc)
+        return max(delay, min(hinted, self.backoff_max * 4)) if hinted is not None else delay
+
+    def _shed(self, api: str, reason: str):
+        self.shed += 1
+        metrics.openai_shed.inc(api=api, reason=reason)
+
+    def _expected_wait(self, user_id: str, tokens: int) -> float:
+        """Оценка ожидания нового вызова: очередь впереди, токены и пауза после 429.
+
+        Слоты идут по кругу, поэтому впереди не вся очередь, а не больше k вызовов
+        каждого кандидата, где k — место вызова в очереди своего кандидата.
+        """
+        k = len(self._queues.get(user_id, ())) + 1
+        ahead = sum(min(len(queue), k) for queue in self._queues.values())
+        ahead += self._in_flight - self.max_concurrency + 1
+        wait = max(0, ahead) * self._service_time / self.max_concurrency
+        wait = max(wait, self.bucket.wait_time(tokens))
+        return max(wait, self._cooldown_until - time.monotonic())
+
+    async def _acquire(self, api: str, user_id: str, tokens: int, deadline: float):
+        expected = self._expected_wait(user_id, tokens)
+        if time.monotonic() + expected > deadline:
+            self._shed(api, "queue")
+            raise UpstreamBusy(expected, "очередь")
+
+        started = time.monotonic()
+        waiter = _Waiter(user_id, tokens, asyncio.get_running_loop().create_future())
+        queue = self._queues.get(user_id)
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+            self._ring.append(user_id)
+        queue.append(waiter)
+        self._queued += 1
+        metrics.openai_queued.set(self._queued)
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(waiter.future, max(0.0, deadline - time.monotonic()))
+        except BaseException as e:
+            # Дедлайн или клиент ушел: слот, выданный в этот же момент, возвращаем вместе с токенами
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.bucket.adjust(-tokens)
+                self._release(0.0)
+            else:
+                self._forget(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self._shed(api, "deadline")
+                raise UpstreamBusy(self._expected_wait(user_id, tokens), "очередь") from None
+            raise
+        metrics.openai_queue_wait.observe(time.monotonic() - started, api=api)
+
+    def _forget(self, waiter: _Waiter):
+        queue = self._queues.get(waiter.user_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._queued -= 1
+            metrics.openai_queued.set(self._queued)
+            if not queue:
+                del self._queues[waiter.user_id]
+                self._ring.remove(waiter.user_id)
+        self._dispatch()
+
+    def _release(self, held: float):
+        self._in_flight -= 1
+        metrics.openai_in_flight.set(self._in_flight)
+        if held > 0:
+            self._service_time += (held - self._service_time) * 0.2
+        self._dispatch()
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _dispatch(self):
+        """Раздает свободные слоты по кругу кандидатов; первый в очереди кандидата — первым."""
+        while self._ring and self._in_flight < self.max_concurrency:
+            cooldown = self._cooldown_until - time.monotonic()
+            if cooldown > 0:
+                self._schedule(cooldown)
+                return
+            user_id = self._ring[0]
+            queue = self._queues[user_id]
+            waiter = queue[0]
+            if waiter.future.done():
+                # Отмененный и еще не убранный вызов
+                self._forget(waiter)
+                return
+            wait = self.bucket.wait_time(waiter.tokens)
+            if wait > 0:
+                self._schedule(wait)
+                return
+            self.bucket.take(waiter.tokens)
+            queue.popleft()
+            self._queued -= 1
+            self._ring.popleft()
+            if queue:
+                self._ring.append(user_id)
+            else:
+                del self._queues[user_id]
+            self._in_flight += 1
+            waiter.future.set_result(None)
+        metrics.openai_queued.set(self._queued)
+        metrics.openai_in_flight.set(self._in_flight)
+
+
+openai_scheduler = UpstreamScheduler()
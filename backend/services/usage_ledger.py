@@ -0,0 +1,174 @@
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .. import models
+from .write_behind import usage_writer
+
+BUCKETS = ("hour", "day")
+_SQLITE_FORMATS = {"hour": "%Y-%m-%d %H:00", "day": "%Y-%m-%d"}
+_PG_FORMATS = {"hour": "YYYY-MM-DD HH24:00", "day": "YYYY-MM-DD"}
+
+U = models.UsageRecord
+
+
+def record(user_id: str, channel: str, model: str, usage: dict, cost: float, latency_ms: Optional[float] = None):
+    """Ставит вызов OpenAI в журнал; запись идет пачками в фоне (write-behind).
+
+    usage — {"input", "output", "cached"} и, для голоса, {"audio_input", "audio_output"}.
+    """
+    usage_writer.enqueue_usage({
+        "user_id": user_id,
+        "channel": channel,
+        "model": model,
+        "input_tokens": usage.get("input", 0) or 0,
+        "cached_tokens": usage.get("cached", 0) or 0,
+        "output_tokens": usage.get("output", 0) or 0,
+        "audio_input_tokens": usage.get("audio_input", 0) or 0,
+        "audio_output_tokens": usage.get("audio_output", 0) or 0,
+        "cost": cost or 0.0,
+        "latency_ms": None if latency_ms is None else int(latency_ms),
+    })
+
+
+def _bucket(db: Session, column, bucket: str):
+    if db.get_bind().dialect.name == "sqlite":
+        return func.strftime(_SQLITE_FORMATS[bucket], column)
+    return func.to_char(func.date_trunc(bucket, column), _PG_FORMATS[bucket])
+
+
+def _window(query, column, since: Optional[datetime], until: Optional[datetime]):
+    if since is not None:
+        query = query.filter(column >= since)
+    if until is not None:
+        query = query.filter(column < until)
+    return query
+
+
+def _totals(row) -> dict:
+    turns = row.turns or 0
+    input_tokens = int(row.input_tokens or 0)
+    output_tokens = int(row.output_tokens or 0)
+    cached_tokens = int(row.cached_tokens or 0)
+    return {
+        "turns": turns,
+        "input_tokens": input_tokens,
+        "cached_tokens": cached_tokens,
+        "output_tokens": output_tokens,
+        "audio_input_tokens": int(row.audio_input_tokens or 0),
+        "audio_output_tokens": int(row.audio_output_tokens or 0),
+        "cost": round(row.cost or 0.0, 6),
+        # Доля входных токенов, пришедших из кеша промпта
+        "cache_hit_ratio": round(cached_tokens / input_tokens, 4) if input_tokens else 0.0,
+        "tokens_per_turn": round((input_tokens + output_tokens) / turns, 1) if turns else 0.0,
+        "avg_latency_ms": None if row.avg_latency_ms is None else round(row.avg_latency_ms, 1),
+    }
+
+
+class _EmptyRow:
+    turns = input_tokens = cached_tokens = output_tokens = 0
+    audio_input_tokens = audio_output_tokens = 0
+    cost = 0.0
+    avg_latency_ms = None
+
+
+def _aggregate(db: Session, since, until, channel, bucket=None, by_channel=False):
+    columns = [
+        func.count(U.id).label("turns"),
+        func.sum(U.input_tokens).label("input_tokens"),
+        func.sum(U.cached_tokens).label("cached_tokens"),
+        func.sum(U.output_tokens).label("output_tokens"),
+        func.sum(U.audio_input_tokens).label("audio_input_tokens"),
+        func.sum(U.audio_output_tokens).label("audio_output_tokens"),
+        func.sum(U.cost).label("cost"),
+        func.avg(U.latency_ms).label("avg_latency_ms"),
+    ]
+    group = []
+    if bucket is not None:
+        label = _bucket(db, U.created_at, bucket).label("bucket")
+        columns.append(label)
+        group.append(label)
+    if by_channel:
+        columns.append(U.channel)
+        group.append(U.channel)
+    query = _window(db.query(*columns), U.created_at, since, until)
+    if channel:
+        query = query.filter(U.channel == channel)
+    return query.group_by(*group).order_by(*group).all()
+
+
+def _profile_costs(db: Session, since, until, bucket) -> dict:
+    """bucket -> (завершенных профилей, их стоимость за все время).
+
+    Профиль завершен в момент первого отчета кандидата (Алекса или Марины);
+    в стоимость идут все вызовы кандидата, а не только попавшие в окно.
+    """
+    completed = db.query(
+        models.AIReport.user_id.label("user_id"),
+        func.min(models.AIReport.created_at).label("completed_at"),
+    ).group_by(models.AIReport.user_id).subquery()
+    spent = db.query(U.user_id.label("user_id"), func.sum(U.cost).label("cost")).group_by(U.user_id).subquery()
+
+    columns = [func.count(completed.c.user_id), func.sum(func.coalesce(spent.c.cost, 0.0))]
+    if bucket is not None:
+        label = _bucket(db, completed.c.completed_at, bucket).label("bucket")
+        columns.append(label)
+    query = db.query(*columns).select_from(completed).outerjoin(spent, spent.c.user_id == completed.c.user_id)
+    query = _window(query, completed.c.completed_at, since, until)
+    if bucket is None:
+        count, cost = query.one()
+        return {None: (count, cost or 0.0)}
+    return {row.bucket: (row[0], row[1] or 0.0) for row in query.group_by(label).all()}
+
+
+def _with_profiles(totals: dict, profiles) -> dict:
+    count, cost = profiles or (0, 0.0)
+    totals["completed_profiles"] = count
+    totals["cost_per_completed_profile"] = round(cost / count, 6) if count else None
+    return totals
+
+
+def summary(db: Session, since: Optional[datetime] = None, until: Optional[datetime] = None,
+            channel: Optional[str] = None) -> dict:
+    """Итоги за окно: в целом и по каналам, доля кеша, токены на реплику, цена профиля."""
+    total = _totals(_aggregate(db, since, until, channel)[0])
+    channels = [{"channel": row.channel, **_totals(row)}
+                for row in _aggregate(db, since, until, channel, by_channel=True)]
+    profiles = _profile_costs(db, since, until, None)[None]
+    return {"since": since, "until": until, "total": _with_profiles(total, profiles), "channels": channels}
+
+
+def timeseries(db: Session, bucket: str = "day", since: Optional[datetime] = None,
+               until: Optional[datetime] = None, channel: Optional[str] = None) -> List[dict]:
+    """Те же показатели по часам или дням (UTC, как created_at)."""
+    profiles = _profile_costs(db, since, until, bucket)
+    points = {row.bucket: _totals(row) for row in _aggregate(db, since, until, channel, bucket)}
+    result = []
+    for key in sorted(set(points) | set(profiles)):
+        totals = points.get(key) or _totals(_EmptyRow)
+        result.append({"bucket": key, **_with_profiles(totals, profiles.get(key))})
+    return result
+
+
+def top_users(db: Session, limit: int = 20, since: Optional[datetime] = None,
+              until: Optional[datetime] = None, channel: Optional[str] = None) -> List[dict]:
+    """Самые дорогие кандидаты за окно."""
+    query = db.query(
+        U.user_id,
+        models.User.name,
+        func.count(U.id).label("turns"),
+        func.sum(U.input_tokens).label("input_tokens"),
+        func.sum(U.cached_tokens).label("cached_tokens"),
+        func.sum(U.output_tokens).label("output_tokens"),
+        func.sum(U.audio_input_tokens).label("audio_input_tokens"),
+        func.sum(U.audio_output_tokens).label("audio_output_tokens"),
+        func.sum(U.cost).label("cost"),
+        func.avg(U.latency_ms).label("avg_latency_ms"),
+    ).outerjoin(models.User, models.User.id == U.user_id)
+    query = _window(query, U.created_at, since, until)
+    if channel:
+        query = query.filter(U.channel == channel)
+    rows = query.group_by(U.user_id, models.User.name).order_by(func.sum(U.cost).desc()).limit(limit).all()
+    return [{"user_id": row.user_id, "name": row.name, **_totals(row)} for row in rows]
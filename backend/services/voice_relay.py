@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import base64
+import asyncio
+import logging
+
+from starlette.websockets import WebSocketDisconnect
+
+from . import metrics
+
+logger = logging.getLogger("HR_SYSTEM")
+
+# PCM16 моно 24 кГц — формат input_audio_format "pcm16" в Realtime API
+PCM16_BYTES_PER_MS = 24000 * 2 // 1000
+
+# Мелкие чанки копим до CHUNK_MS аудио, но держим не дольше LATENCY_MS
+UPLINK_CHUNK_MS = int(os.getenv("VOICE_UPLINK_CHUNK_MS", "100"))
+UPLINK_LATENCY_MS = int(os.getenv("VOICE_UPLINK_LATENCY_MS", "40"))
+# Очередь клиент -> OpenAI; если OpenAI не успевает, перестаем читать клиента
+UPLINK_QUEUE_SIZE = int(os.getenv("VOICE_UPLINK_QUEUE", "64"))
+
+
+class UplinkStats:
+    def __init__(self):
+        self.frames_in = 0
+        self.frames_out = 0
+        self.audio_bytes = 0
+        # Когда клиент последний раз запросил ответ (commit) — для задержки в журнале расхода
+        self.response_requested_at = None
+
+    def response_latency_ms(self):
+        """Время от commit до response.done; None, если ответ начат сервером (VAD)."""
+        if self.response_requested_at is None:
+            return None
+        latency = (time.monotonic() - self.response_requested_at) * 1000
+        self.response_requested_at = None
+        return latency
+
+
+async def read_client(websocket, queue: asyncio.Queue, stats: UplinkStats):
+    """Читает сообщения фронта и кладет в ограниченную очередь.
+
+    await queue.put() при заполненной очереди приостанавливает чтение —
+    это и есть обратное давление на клиента. Завершается при отключении.
+    """
+    while True:
+        data = await websocket.receive_json()
+        stats.frames_in += 1
+        metrics.voice_frames.inc(direction=metrics.CLIENT_IN)
+        await queue.put(data)
+
+
+async def write_upstream(openai_ws, queue: asyncio.Queue, stats: UplinkStats,
+                         chunk_ms: int = UPLINK_CHUNK_MS, latency_ms: int = UPLINK_LATENCY_MS):
+    """Пересылает очередь в OpenAI, склеивая мелкие аудио-чанки в один append."""
+    target_bytes = chunk_ms * PCM16_BYTES_PER_MS
+    pending = bytearray()
+    held_since = 0.0
+
+    async def flush_audio():
+        if pending:
+            await openai_ws.send(json.dumps({
+                "type": "input_audio_buffer.append",
+                "audio": base64.b64encode(bytes(pending)).decode("ascii")
+            }))
+            stats.frames_out += 1
+            metrics.voice_frames.inc(direction=metrics.UPSTREAM_OUT)
+            stats.audio_bytes += len(pending)
+            pending.clear()
+
+    while True:
+        if pending:
+            timeout = latency_ms / 1000 - (time.monotonic() - held_since)
+            try:
+                data = await asyncio.wait_for(queue.get(), max(timeout, 0))
+            except asyncio.TimeoutError:
+                await flush_audio()
+                continue
+        else:
+            data = await queue.get()
+
+        msg_type = data.get("type")
+        if msg_type == "audio_data":
+            try:
+                chunk = base64.b64decode(data["audio"])
+            except Exception as e:
+                logger.warning(f"⚠️ Voice: битый аудио-чанк пропущен: {e}")
+                continue
+            if not pending:
+                held_since = time.monotonic()
+            pending.extend(chunk)
+            if len(pending) >= target_bytes:
+                await flush_audio()
+        elif msg_type == "commit":
+            # Сначала дописываем накопленное аудио, иначе commit отрежет хвост фразы
+            await flush_audio()
+            await openai_ws.send(json.dumps({"type": "input_audio_buffer.commit"}))
+            await openai_ws.send(json.dumps({"type": "response.create"}))
+            stats.response_requested_at = time.monotonic()
+            stats.frames_out += 2
+            metrics.voice_frames.inc(2, direction=metrics.UPSTREAM_OUT)
+
+
+async def run_session(tasks, deadline_seconds: float):
+    """Ждет завершения любой из задач сессии или истечения лимита времени.
+
+    Оставшиеся задачи отменяются; ошибки завершившихся логируются.
+    """
+    done, pending = await asyncio.wait(tasks, timeout=deadline_seconds, return_when=asyncio.FIRST_COMPLETED)
+    if not done:
+        logger.info(f"⏱️ Voice: сессия закрыта по лимиту {deadline_seconds:.0f} с")
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    for task in done:
+        exc = task.exception()
+        if exc and not isinstance(exc, WebSocketDisconnect):
+            logger.error(f"Ошибка в голосовом релее: {exc}")
@@ -0,0 +1,248 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import exc, insert
+
+from .. import models, database
+from . import reports
+from .conversation_cache import conversation_cache
+
+logger = logging.getLogger("HR_SYSTEM")
+
+BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH", "100"))
+FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "0.5"))
+# Предел очереди: пока база недоступна, строки копятся в памяти, но не бесконечно
+MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "50000"))
+# Пауза между повторами записи, пока база недоступна: 0.2, 0.4, ... до потолка
+BACKOFF_BASE = float(os.getenv("WRITE_BEHIND_BACKOFF_BASE", "0.2"))
+BACKOFF_MAX = float(os.getenv("WRITE_BEHIND_BACKOFF_MAX", "10"))
+# Сколько остановка воркера ждет записи очереди, если база так и не вернулась
+CLOSE_TIMEOUT = float(os.getenv("WRITE_BEHIND_CLOSE_TIMEOUT", "30"))
+
+
+class _FlushMarker:
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+
+
+class ChatWriteBehind:
+    """Очередь отложенной записи ChatMessage (write-behind) для голосовых сессий.
+
+    enqueue() не ждет базу: строка ставится в очередь, фоновая задача пишет
+    накопленное пачками через асинхронную сессию. flush() дожидается записи
+    всего, что было поставлено до вызова, — его зовут при завершении сессии.
+    Через эту же очередь сохраняются отчеты Марины (ai_reports)
+    и записи журнала расхода токенов (usage_ledger).
+
+    Пока база недоступна, пачка остается в работе и повторяется с паузой до
+    возвращения базы; отбрасываются только строки, которые база отвергает сами
+    по себе (IntegrityError и т.п.), и строки сверх max_queue.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, interval=FLUSH_INTERVAL, max_queue=MAX_QUEUE):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.rows_written = 0
+        self.batches = 0
+        self.errors = 0
+        self.retries = 0
+        self.rows_dropped = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def enqueue(self, user_id: str, role: str, content: str, chat_type: str = "voice"):
+        self._put({
+            "user_id": user_id,
+            "role": role,
+            "content": content,
+            "chat_type": chat_type,
+            # Время фиксируем при постановке в очередь, чтобы порядок реплик не зависел от задержки записи
+            "timestamp": datetime.now(timezone.utc).replace(tzinfo=None),
+        })
+
+    def enqueue_report(self, user_id: str, source: str, report: dict):
+        """Отчет пишется в ai_reports в той же пачке, после реплик, поставленных раньше."""
+        self._put({"kind": "report", "user_id": user_id, "source": source, "report": report})
+
+    def enqueue_usage(self, record: dict):
+        """Строка usage_ledger; время фиксируется в момент вызова OpenAI, а не записи."""
+        self._put({
+            "kind": "usage",
+            "created_at": datetime.now(timezone.utc).replace(tzinfo=None),
+            **record,
+        })
+
+    async def flush(self):
+        if self._queue is None:
+            return
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        # Маркер ждет места в полной очереди, а не отбрасывается
+        await self._queue.put(_FlushMarker(future))
+        await future
+
+    async def close(self, timeout: float = CLOSE_TIMEOUT):
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"💥 Write-behind: база не вернулась за {timeout:.0f} с, "
+                         f"при остановке потеряно строк: {self._queue.qsize()}")
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "rows_written": self.rows_written,
+            "batches": self.batches,
+            "errors": self.errors,
+            "retries": self.retries,
+            "rows_dropped": self.rows_dropped,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
+
+    def _put(self, item: dict):
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # База недоступна так долго, что очередь заполнилась: память дороже строки
+            self.rows_dropped += 1
+            logger.error(f"🗑️ Write-behind: очередь заполнена ({self.max_queue}), строка отброшена ({_describe(item)})")
+
+    def _ensure_worker(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            batch, markers = [], []
+            deadline = time.monotonic() + self.interval
+            while True:
+                if isinstance(item, _FlushMarker):
+                    markers.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+
+            if batch:
+                await self._write(batch)
+            for marker in markers:
+                if not marker.future.done():
+                    marker.future.set_result(None)
+
+    async def _write(self, batch: List[dict]):
+        started = time.perf_counter()
+        try:
+            await self._insert_until_db_is_back(batch)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"❌ Write-behind: база отвергла пачку ({len(batch)} строк): {e}")
+            # В пачке строки разных сессий: пишем по одной, теряем только сбойные
+            await self._write_each(batch)
+            return
+
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+        self.rows_written += len(batch)
+        self.batches += 1
+
+    async def _write_each(self, batch: List[dict]):
+        for item in batch:
+            try:
+                await self._insert_until_db_is_back([item])
+                self.rows_written += 1
+            except Exception as e:
+                self.rows_dropped += 1
+                logger.error(f"🗑️ Write-behind: строка отброшена ({_describe(item)}): {e}")
+
+    async def _insert_until_db_is_back(self, batch: List[dict]):
+        """Повторяет запись, пока база недоступна; ошибку самих строк отдает наверх."""
+        attempt = 0
+        while True:
+            try:
+                await _insert_batch(batch)
+                return
+            except Exception as e:
+                if not _is_transient(e):
+                    raise
+                attempt += 1
+                self.retries += 1
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+                logger.error(f"❌ Write-behind: база недоступна ({len(batch)} строк, попытка {attempt}), "
+                             f"повтор через {delay:.1f} с: {e}")
+                await asyncio.sleep(delay)
+
+
+def _is_transient(e: Exception) -> bool:
+    """Сбой базы или соединения, а не строк пачки: запись стоит повторить позже."""
+    if isinstance(e, exc.DBAPIError) and e.connection_invalidated:
+        return True
+    # OperationalError — в том числе "database is locked" SQLite и обрыв соединения Postgres
+    return isinstance(e, (exc.OperationalError, exc.InterfaceError, exc.TimeoutError,
+                          OSError, asyncio.TimeoutError))
+
+
+def _describe(item: dict) -> str:
+    kind = item.get("kind", "message")
+    detail = item.get("source") or item.get("role") or item.get("channel") or ""
+    return f"{kind} {detail}, user_id={item.get('user_id')}"
+
+
+def _write_rows(db, batch: List[dict]):
+    messages = [item for item in batch if "kind" not in item]
+    rows = [models.ChatMessage(**item) for item in messages]
+    db.add_all(rows)
+    db.flush()
+    written = [(item, row.id) for item, row in zip(messages, rows)]
+    for item in batch:
+        if item.get("kind") == "report":
+            reports.upsert_report(db, item["user_id"], item["source"], item["report"])
+    usage = [{k: v for k, v in item.items() if k != "kind"} for item in batch if item.get("kind") == "usage"]
+    if usage:
+        # Один executemany на пачку: журнал не тянет ORM-объекты
+        db.execute(insert(models.UsageRecord), usage)
+    db.commit()
+    return written
+
+
+async def _insert_batch(batch: List[dict]):
+    # Асинхронная сессия: запись пачки не занимает поток из общего пула
+    async with database.AsyncSessionLocal() as db:
+        written = await db.run_sync(_write_rows, batch)
+
+    for item, row_id in written:
+        conversation_cache.append_message(
+            item["user_id"], item["chat_type"],
+            {"id": row_id, "role": item["role"], "content": item["content"]}
+        )
+
+
+voice_writer = ChatWriteBehind()
+# Отдельная очередь журнала расхода: текстовый чат не ждет голосовые пачки и наоборот
+usage_writer = ChatWriteBehind()
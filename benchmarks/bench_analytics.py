@@ -0,0 +1,137 @@
+"""Аналитика по кандидатам: сводные таблицы против GROUP BY по исходным таблицам.
+
+Для каждого размера строится синтетическая база (векторы ответов теста и
+отчеты Алекса/Марины за ~полгода), сводка собирается analytics.rebuild, затем
+меряется GET /api/v1/analytics/population (analytics.population) и тот же
+разрез прямым GROUP BY по ai_reports. Время сводки не должно расти с числом кандидатов.
+В конце — сверка: инкрементальная сводка после случайных ответов и отчетов
+совпадает с пересборкой.
+
+    python -m benchmarks.bench_analytics --sizes 1000,10000,100000
+"""
+import time
+import random
+import argparse
+import tempfile
+import statistics
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from backend import models
+from backend.services import analytics, answers, reports
+
+TYPES = ["INTJ", "INTP", "ENTJ", "ENFP", "ISTJ", "ISFJ", "ESTP", "ESFP"]
+
+
+def build_dataset(engine, users, seed=42):
+    rnd = random.Random(seed)
+    models.Base.metadata.create_all(bind=engine)
+    started = datetime(2026, 4, 1)
+    user_rows, vectors, report_rows = [], [], []
+    for _ in range(users):
+        uid = str(uuid.UUID(int=rnd.getrandbits(128)))
+        user_rows.append({"id": uid, "name": "Кандидат", "gender": rnd.choice(("male", "female")),
+                          "current_static_step": 56})
+        counts = {letter: rnd.randint(0, 14) for letter in "eisntfjp"}
+        vectors.append({"user_id": uid, "answers": "E" * 56, "answered": 56, **counts,
+                        "completed_at": started + timedelta(minutes=rnd.randint(0, 260_000))})
+        for source in ("text", "voice"):
+            if rnd.random() < 0.6:
+                report_rows.append({
+                    "user_id": uid, "source": source, "mbti_type": rnd.choice(TYPES),
+                    "e_i": rnd.randint(0, 100), "s_n": rnd.randint(0, 100),
+                    "t_f": rnd.randint(0, 100), "j_p": rnd.randint(0, 100),
+                    "created_at": started + timedelta(minutes=rnd.randint(0, 260_000)),
+                })
+    with engine.begin() as conn:
+        for table, rows in ((models.User, user_rows), (models.UserAnswerVector, vectors),
+                            (models.AIReport, report_rows)):
+            for i in range(0, len(rows), 20_000):
+                conn.execute(table.__table__.insert(), rows[i:i + 20_000])
+
+
+def direct_query(db):
+    """Тот же разрез (месяц x пол x тип + среднее по осям) прямо по ai_reports."""
+    r, u = models.AIReport, models.User
+    month = func.strftime("%Y-%m", r.created_at)
+    types = db.execute(select(month, u.gender, r.mbti_type, func.count()).join(u, u.id == r.user_id)
+                       .where(r.source == "text").group_by(month, u.gender, r.mbti_type)).all()
+    axes = db.execute(select(month, u.gender, func.avg(r.e_i), func.avg(r.s_n), func.avg(r.t_f), func.avg(r.j_p))
+                      .join(u, u.id == r.user_id).where(r.source == "text").group_by(month, u.gender)).all()
+    return types, axes
+
+
+def timed(fn, rounds):
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def check_incremental(db, seed=7, steps=300):
+    """Случайные ответы и отчеты через save_answers / upsert_report, затем сверка с rebuild."""
+    rnd = random.Random(seed)
+    user_ids = list(db.scalars(select(models.User.id).limit(200)))
+
+    def snapshot():
+        return (sorted((r.source, r.day, r.gender, r.mbti_type, r.candidates)
+                       for r in db.query(models.ResultTypeCount) if r.candidates),
+                sorted((r.source, r.day, r.gender, r.axis, r.bin, r.candidates, r.total, r.squares)
+                       for r in db.query(models.ResultAxisBin) if r.candidates))
+
+    for _ in range(steps):
+        uid = rnd.choice(user_ids)
+        if rnd.random() < 0.5:
+            sheet = {q: rnd.choice("EISNTFJP") for q in rnd.sample(range(1, 57), rnd.randint(1, 56))}
+            answers.save_answers(db, uid, sheet)
+        else:
+            report = {"mbti_type": rnd.choice(TYPES),
+                      "metrics": {axis: rnd.randint(0, 100) for axis in analytics.AXES}}
+            reports.upsert_report(db, uid, rnd.choice(("text", "voice")), report)
+        db.commit()
+    incremental = snapshot()
+    analytics.rebuild(db)
+    db.flush()
+    rebuilt = snapshot()
+    db.rollback()
+    return incremental == rebuilt
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="число кандидатов через запятую")
+    parser.add_argument("--rounds", type=int, default=15)
+    args = parser.parse_args()
+
+    print(f"{'кандидатов':>11}{'rebuild, мс':>13}{'сводка, мс':>12}{'GROUP BY по отчетам, мс':>25}")
+    last = None
+    for size in (int(s) for s in args.sizes.split(",")):
+        engine = create_engine(f"sqlite:///{tempfile.mkdtemp()}/bench_analytics.db")
+        build_dataset(engine, size)
+        db = sessionmaker(bind=engine)()
+        started = time.perf_counter()
+        analytics.rebuild(db)
+        db.commit()
+        rebuild_ms = (time.perf_counter() - started) * 1000
+        summary_ms = timed(lambda: analytics.population(db, "text", "month", True), args.rounds)
+        direct_ms = timed(lambda: direct_query(db), args.rounds)
+        print(f"{size:>11}{rebuild_ms:>13.0f}{summary_ms:>12.2f}{direct_ms:>25.2f}", flush=True)
+        if last is not None:
+            last[1].close()
+            last[0].dispose()
+        last = (engine, db)
+
+    engine, db = last
+    ok = check_incremental(db)
+    print("\n✅ инкрементальная сводка совпадает с пересборкой" if ok else "\n❌ сводка разошлась с пересборкой")
+    db.close()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
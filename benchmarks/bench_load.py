@@ -0,0 +1,343 @@
+"""Нагрузочный прогон API: N кандидатов проходят тест, текстовый и голосовой чат и PDF.
+
+OpenAI заменен локальным стендом (benchmarks/mock_openai.py), поэтому
+прогон бесплатный и воспроизводимый. Стенд, API и драйвер — отдельные
+процессы на свободных портах; API работает на свежей базе (по умолчанию
+временный SQLite-файл), засеянной вопросами через backend.seed.
+
+Фазы идут по очереди, внутри фазы все кандидаты работают одновременно.
+По каждому эндпоинту — p50/p95/p99, пропускная способность и ошибки;
+по каждой фазе — задержка event loop API (проба внутри процесса сервера).
+
+    python -m benchmarks.bench_load --candidates 50 --chat-turns 6 --voice-turns 3
+    python -m benchmarks.bench_load --stream --save load.json
+    python -m benchmarks.bench_load --baseline load.json --tolerance 0.2
+"""
+import os
+import sys
+import json
+import time
+import base64
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import statistics
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+import httpx
+import websockets
+
+LAG_PATH = "/__bench__/loop-lag"
+LAG_INTERVAL = 0.01
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve_app(port: int):
+    """API в этом процессе + проба задержки event loop (только для прогона)."""
+    import uvicorn
+    from backend.main import app
+
+    lags = []
+
+    async def probe():
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(LAG_INTERVAL)
+            lags.append((time.perf_counter() - started - LAG_INTERVAL) * 1000)
+
+    app_lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # Проба стартует после lifespan приложения и живет до его остановки
+        async with app_lifespan(app):
+            task = asyncio.get_running_loop().create_task(probe())
+            yield
+            task.cancel()
+
+    def loop_lag():
+        samples = lags[:]
+        lags.clear()
+        return samples
+
+    app.router.lifespan_context = lifespan
+    app.add_api_route(LAG_PATH, loop_lag, methods=["POST"])
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _percentiles(values):
+    values = sorted(values)
+    if not values:
+        return None, None, None
+
+    def pick(q):
+        return values[min(len(values) - 1, int(len(values) * q))]
+
+    return statistics.median(values), pick(0.95), pick(0.99)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.phase_seconds = {}
+        self.endpoint_phase = {}
+        self.loop_lag = {}
+
+    def ok(self, name, started):
+        self.latencies[name].append((time.perf_counter() - started) * 1000)
+
+    def fail(self, name):
+        self.errors[name] += 1
+
+    def summary(self):
+        result = {}
+        for name in sorted(set(self.latencies) | set(self.errors), key=list(self.endpoint_phase).index):
+            p50, p95, p99 = _percentiles(self.latencies[name])
+            phase = self.endpoint_phase[name]
+            result[name] = {
+                "phase": phase,
+                "n": len(self.latencies[name]),
+                "errors": self.errors[name],
+                "rps": round(len(self.latencies[name]) / self.phase_seconds[phase], 1),
+                "p50": p50, "p95": p95, "p99": p99,
+            }
+        return result
+
+
+async def timed(rec: Recorder, phase: str, name: str, call):
+    rec.endpoint_phase.setdefault(name, phase)
+    started = time.perf_counter()
+    try:
+        response = await call()
+        response.raise_for_status()
+    except (httpx.HTTPError, OSError):
+        rec.fail(name)
+        return None
+    rec.ok(name, started)
+    return response
+
+
+async def candidate_answers(client, rec, user_id, question_ids, rnd):
+    await timed(rec, "answers", "GET /questions", lambda: client.get("/questions"))
+    for question_id in question_ids:
+        body = {"user_id": user_id, "question_id": question_id, "selected_key": rnd.choice("EISNTFJP")}
+        await timed(rec, "answers", "POST /answers", lambda: client.post("/answers", json=body))
+
+
+async def candidate_chat(client, rec, user_id, turns, stream):
+    for turn in range(turns):
+        body = {"message": "Начни интервью" if turn == 0 else f"Ответ кандидата номер {turn}. " * 5}
+        if not stream:
+            await timed(rec, "chat", "POST /chat", lambda: client.post("/chat", params={"user_id": user_id}, json=body))
+            continue
+        rec.endpoint_phase.setdefault("POST /chat/stream (первый токен)", "chat")
+        rec.endpoint_phase.setdefault("POST /chat/stream", "chat")
+        started = time.perf_counter()
+        first = None
+        try:
+            async with client.stream("POST", "/chat/stream", params={"user_id": user_id}, json=body) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if first is None and line.startswith("event: token"):
+                        first = time.perf_counter()
+                        rec.ok("POST /chat/stream (первый токен)", started)
+                    if line.startswith("event: error"):
+                        raise httpx.HTTPError("stream error event")
+        except httpx.HTTPError:
+            rec.fail("POST /chat/stream")
+            continue
+        rec.ok("POST /chat/stream", started)
+
+
+async def candidate_voice(ws_url, rec, user_id, turns, frames, pace_ms):
+    names = ("WS подключение", "WS первое аудио", "WS ответ")
+    for name in names:
+        rec.endpoint_phase.setdefault(name, "voice")
+    frame = base64.b64encode(bytes(24000 * 2 * 20 // 1000)).decode("ascii")  # 20 мс PCM16
+    started = time.perf_counter()
+    try:
+        async with websockets.connect(f"{ws_url}/ws/chat/{user_id}", max_size=None) as ws:
+            rec.ok("WS подключение", started)
+            for _ in range(turns):
+                for _ in range(frames):
+                    await ws.send(json.dumps({"type": "audio_data", "audio": frame}))
+                    await asyncio.sleep(pace_ms / 1000)
+                committed = time.perf_counter()
+                await ws.send(json.dumps({"type": "commit"}))
+                got_audio = False
+                while True:
+                    event = json.loads(await asyncio.wait_for(ws.recv(), 30))
+                    if event.get("type") == "audio_delta" and not got_audio:
+                        got_audio = True
+                        rec.ok("WS первое аудио", committed)
+                    elif event.get("type") == "transcript":
+                        rec.ok("WS ответ", committed)
+                        break
+    except (OSError, asyncio.TimeoutError, websockets.WebSocketException):
+        rec.fail("WS ответ")
+
+
+async def candidate_pdf(client, rec, user_id):
+    await timed(rec, "pdf", "GET /api/v1/user-report/{id}/pdf",
+                lambda: client.get(f"/api/v1/user-report/{user_id}/pdf"))
+
+
+async def run_phase(client, rec, phase, coros):
+    await client.post(LAG_PATH)
+    started = time.perf_counter()
+    await asyncio.gather(*coros)
+    rec.phase_seconds[phase] = time.perf_counter() - started
+    lags = (await client.post(LAG_PATH)).json()
+    p50, _, p99 = _percentiles(lags)
+    rec.loop_lag[phase] = {"p50": p50, "p99": p99, "max": max(lags) if lags else None}
+    print(f"  ✔️ {phase}: {rec.phase_seconds[phase]:.1f} с", flush=True)
+
+
+async def drive(args, base_url, ws_url):
+    rec = Recorder()
+    rnd = random.Random(3)
+    limits = httpx.Limits(max_connections=args.candidates * 2, max_keepalive_connections=args.candidates * 2)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        question_ids = [q["id"] for q in (await client.get("/questions")).json()]
+
+        async def create(i):
+            body = {"name": f"Кандидат {i:04d}", "gender": rnd.choice(["male", "female"])}
+            response = await timed(rec, "users", "POST /users", lambda: client.post("/users", json=body))
+            return response.json()["id"] if response else None
+
+        users = []
+
+        async def create_all():
+            users.extend(await asyncio.gather(*[create(i) for i in range(args.candidates)]))
+
+        await run_phase(client, rec, "users", [create_all()])
+        users = [u for u in users if u]
+        await run_phase(client, rec, "answers",
+                        [candidate_answers(client, rec, u, question_ids, random.Random(u)) for u in users])
+        await run_phase(client, rec, "chat", [candidate_chat(client, rec, u, args.chat_turns, args.stream) for u in users])
+        if args.voice_turns:
+            await run_phase(client, rec, "voice", [
+                candidate_voice(ws_url, rec, u, args.voice_turns, args.audio_frames, args.audio_pace_ms) for u in users
+            ])
+        await run_phase(client, rec, "pdf", [candidate_pdf(client, rec, u) for u in users])
+    return {"endpoints": rec.summary(), "loop_lag": rec.loop_lag}
+
+
+def _wait_port(port, proc, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"процесс на порту {port} завершился с кодом {proc.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"порт {port} не открылся за {timeout} с")
+
+
+def report(result, baseline, tolerance):
+    def ms(value):
+        return "—" if value is None else f"{value:.1f}"
+
+    print(f"\n{'эндпоинт':<38}{'n':>7}{'ошибки':>8}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in result["endpoints"].items():
+        print(f"{name:<38}{r['n']:>7}{r['errors']:>8}{r['rps']:>8}{ms(r['p50']):>10}{ms(r['p95']):>10}{ms(r['p99']):>10}")
+
+    print(f"\n{'фаза':<12}{'lag p50 ms':>12}{'lag p99 ms':>12}{'lag max ms':>12}")
+    for phase, lag in result["loop_lag"].items():
+        print(f"{phase:<12}{ms(lag['p50']):>12}{ms(lag['p99']):>12}{ms(lag['max']):>12}")
+
+    if not baseline:
+        return 0
+    regressions = []
+    for name, r in result["endpoints"].items():
+        base = baseline["endpoints"].get(name)
+        if base and base["p95"] and r["p95"] and r["p95"] > base["p95"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95']:.1f} -> {r['p95']:.1f} ms")
+        if base is not None and r["errors"] > base["errors"]:
+            regressions.append(f"{name}: ошибок {base['errors']} -> {r['errors']}")
+    for phase, lag in result["loop_lag"].items():
+        base = baseline["loop_lag"].get(phase)
+        if base and base["p99"] and lag["p99"] and lag["p99"] > base["p99"] * (1 + tolerance):
+            regressions.append(f"loop lag {phase}: p99 {base['p99']:.1f} -> {lag['p99']:.1f} ms")
+    if regressions:
+        print("\n❌ Регрессии относительно базового прогона:\n  " + "\n  ".join(regressions))
+        return 1
+    print(f"\n✅ Регрессий нет (допуск {tolerance:.0%})")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", type=int, default=50)
+    parser.add_argument("--chat-turns", type=int, default=6)
+    parser.add_argument("--stream", action="store_true", help="текстовый чат через /chat/stream")
+    parser.add_argument("--voice-turns", type=int, default=3, help="реплик в голосовой сессии (0 — без голоса)")
+    parser.add_argument("--audio-frames", type=int, default=10, help="кадров по 20 мс на реплику")
+    parser.add_argument("--audio-pace-ms", type=float, default=20, help="пауза между кадрами")
+    parser.add_argument("--latency-ms", type=int, default=300, help="задержка стенда OpenAI до первого токена")
+    parser.add_argument("--token-ms", type=int, default=15, help="пауза стенда между чанками")
+    parser.add_argument("--database-url", help="база API (по умолчанию временный SQLite-файл)")
+    parser.add_argument("--save", help="сохранить результат в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимый рост p95/p99, доля")
+    parser.add_argument("--serve-app", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_app:
+        serve_app(args.serve_app)
+        return
+
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_load.db')}"
+    mock_port, app_port = _free_port(), _free_port()
+    env = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "OPENAI_API_KEY": "sk-mock-benchmark",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{mock_port}/v1",
+        "OPENAI_REALTIME_URL": f"ws://127.0.0.1:{mock_port}/v1/realtime",
+    }
+    env.pop("ASYNC_DATABASE_URL", None)
+    subprocess.run([sys.executable, "-m", "backend.seed"], env=env, check=True, capture_output=True)
+
+    quiet = {"stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+    mock = subprocess.Popen([sys.executable, "-m", "benchmarks.mock_openai", "--port", str(mock_port),
+                             "--latency-ms", str(args.latency_ms), "--token-ms", str(args.token_ms)], env=env, **quiet)
+    api = subprocess.Popen([sys.executable, "-m", "benchmarks.bench_load", "--serve-app", str(app_port)], env=env, **quiet)
+    try:
+        _wait_port(mock_port, mock)
+        _wait_port(app_port, api)
+        print(f"🚀 {args.candidates} кандидатов, API :{app_port}, стенд OpenAI :{mock_port} ({database_url})", flush=True)
+        result = asyncio.run(drive(args, f"http://127.0.0.1:{app_port}", f"ws://127.0.0.1:{app_port}"))
+    finally:
+        for proc in (api, mock):
+            proc.terminate()
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    result["params"] = {k: v for k, v in vars(args).items() if k not in ("save", "baseline", "serve_app")}
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    sys.exit(report(result, baseline, args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""Разбор ответов модели: прежние регулярки и фильтр против report_parser.
+
+Корпус — реплики ассистента из chat_messages (DATABASE_URL или ./app.db);
+если базы нет, собирается синтетический. Меряется пропускная способность
+целого разбора и потокового (чанки по 1–12 символов, как дельты OpenAI),
+затем фаззинг: случайные разрезы потока, испорченный JSON отчета и сверка
+с прежним поведением (текст до отчета, LOG-блоки, сам отчет).
+
+    python -m benchmarks.bench_report_parser
+    python -m benchmarks.bench_report_parser --seeds 50 --rounds 20
+"""
+import os
+import re
+import ast
+import sys
+import json
+import time
+import random
+import argparse
+
+from backend.services import report_parser
+
+LEGACY_LOG = re.compile(r"\[\[LOG:(.*?)\]\]", re.DOTALL)
+REPORT = {
+    "mbti_type": "INTJ",
+    "metrics": {"E_I": 30, "S_N": 75, "T_F": 80, "J_P": 25},
+    "summary": "Кандидат системно планирует и \"держит\" сроки.",
+    "skill_gaps": ["Делегирование", "Обратная связь"],
+}
+
+
+# --- Прежняя реализация (до report_parser), для сравнения ---
+
+def legacy_text_report(raw_text):
+    match = re.search(r'<REPORT>(.*?)</REPORT>', raw_text or "", re.DOTALL)
+    if not match:
+        return None
+    content = match.group(1).strip().replace("{{", "{").replace("}}", "}")
+    content = content.replace("```json", "").replace("```", "").strip()
+    try:
+        data = json.loads(content)
+        return data if isinstance(data, dict) else None
+    except Exception:
+        try:
+            data = ast.literal_eval(content)
+            return data if isinstance(data, dict) else None
+        except Exception:
+            return None
+
+
+def legacy_voice_report(text):
+    if "MARIN_REPORT" not in (text or ""):
+        return None
+    match = re.search(r'MARIN_REPORT>?(.*?)(?:</?MARIN_REPORT|$)', text, re.DOTALL)
+    if not match:
+        return None
+    report_str = match.group(1).strip().strip('"').strip().replace("{{", "{").replace("}}", "}")
+    if not report_str.startswith("{"):
+        report_str = "{" + report_str
+    if not report_str.endswith("}"):
+        report_str = report_str + "}"
+    try:
+        data = json.loads(report_str)
+    except Exception:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+class LegacyFilter:
+    """Прежний VisibleTextFilter из chat_stream."""
+
+    def __init__(self):
+        self._buf = ""
+        self._mode = "text"
+        self._started = False
+
+    def feed(self, chunk):
+        self._buf += chunk
+        visible, logs = [], []
+        while self._buf:
+            if self._mode == "report":
+                self._buf = ""
+                break
+            if self._mode == "log":
+                end = self._buf.find("]]")
+                if end == -1:
+                    break
+                logs.append(self._buf[:end].strip())
+                self._buf = self._buf[end + 2:]
+                self._mode = "text"
+                continue
+            hits = [(i, tag) for i, tag in ((self._buf.find("[[LOG:"), "[[LOG:"), (self._buf.find("<REPORT>"), "<REPORT>"))
+                    if i != -1]
+            if hits:
+                at, tag = min(hits)
+                visible.append(self._buf[:at])
+                self._buf = self._buf[at + len(tag):]
+                self._mode = "log" if tag == "[[LOG:" else "report"
+                continue
+            keep = 0
+            for tag in ("[[LOG:", "<REPORT>"):
+                for size in range(min(len(tag) - 1, len(self._buf)), 0, -1):
+                    if self._buf.endswith(tag[:size]):
+                        keep = max(keep, size)
+                        break
+            visible.append(self._buf[:len(self._buf) - keep])
+            self._buf = self._buf[len(self._buf) - keep:]
+            break
+        return self._visible("".join(visible)), logs
+
+    def finish(self):
+        tail = self._buf if self._mode == "text" else ""
+        self._buf = ""
+        return self._visible(tail)
+
+    def _visible(self, text):
+        if not self._started:
+            text = text.lstrip()
+            if text:
+                self._started = True
+        return text
+
+
+def legacy_whole(text):
+    """Что делали /chat, chat_context и голосовой слушатель на одну реплику."""
+    prefix = text.split("<REPORT>")[0].strip()
+    logs = [" ".join(m.split()) for m in LEGACY_LOG.findall(text)]
+    return prefix, logs, legacy_text_report(text) or legacy_voice_report(text)
+
+
+def legacy_stream(chunks):
+    """Поток /chat/stream: фильтр по дельтам, затем регулярка по склеенному тексту."""
+    flt = LegacyFilter()
+    for chunk in chunks:
+        flt.feed(chunk)
+    flt.finish()
+    text = "".join(chunks)
+    return legacy_text_report(text), [" ".join(m.split()) for m in LEGACY_LOG.findall(text)]
+
+
+def new_stream(chunks):
+    parser = report_parser.StreamParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.finish()
+    return parser.result()
+
+
+# --- Корпус ---
+
+def load_corpus(url):
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.exc import SQLAlchemyError
+    try:
+        engine = create_engine(url)
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT content FROM chat_messages WHERE role = 'assistant'")).scalars().all()
+        engine.dispose()
+    except SQLAlchemyError:
+        return []
+    return [row for row in rows if row]
+
+
+def synthetic_corpus(rnd, size=300):
+    words = ("Понимаю", "вас.", "Расскажите,", "пожалуйста,", "как", "вы", "принимаете", "решения?")
+    corpus = []
+    for i in range(size):
+        parts = [f"[[LOG: Axis: {rnd.choice('EISN')} | Value: +{rnd.randint(1, 3)} | Conf: {rnd.randint(40, 95)}% | "
+                 f"Reasoning: ответ про {rnd.choice(words)}]]"]
+        parts += [rnd.choice(words) for _ in range(rnd.randint(10, 80))]
+        if i % 10 == 0:
+            parts.append("<REPORT>" + json.dumps(REPORT, ensure_ascii=False) + "</REPORT>")
+        elif i % 10 == 5:
+            parts.append("<MARIN_REPORT>" + json.dumps(REPORT, ensure_ascii=False) + "</MARIN_REPORT> Спасибо!")
+        corpus.append(" ".join(parts))
+    return corpus
+
+
+def split_random(text, rnd, low=1, high=12):
+    chunks, pos = [], 0
+    while pos < len(text):
+        size = rnd.randint(low, high)
+        chunks.append(text[pos:pos + size])
+        pos += size
+    return chunks
+
+
+# --- Замеры ---
+
+def throughput(fn, items, rounds, size_bytes):
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - started)
+    return size_bytes / best / 1e6
+
+
+def run_throughput(corpus, rounds, rnd):
+    size = sum(len(t.encode("utf-8")) for t in corpus)
+    chunked = [split_random(t, rnd) for t in corpus]
+    rows = [
+        ("целиком", throughput(legacy_whole, corpus, rounds, size),
+         throughput(report_parser.parse, corpus, rounds, size)),
+        ("поток 1–12 симв.", throughput(legacy_stream, chunked, rounds, size),
+         throughput(new_stream, chunked, rounds, size)),
+    ]
+    print(f"Корпус: {len(corpus)} реплик, {size / 1024:.0f} КБ; лучший из {rounds} прогонов, МБ/с")
+    print(f"{'режим':<20}{'прежний':>10}{'новый':>10}{'x':>8}")
+    for name, old, new in rows:
+        print(f"{name:<20}{old:>10.2f}{new:>10.2f}{new / old:>8.2f}")
+
+
+def mutations(text):
+    """Испорченные варианты отчета, которые модель реально присылает."""
+    body = json.dumps(REPORT, ensure_ascii=False, indent=1)
+    yield "двойные скобки", text + "<REPORT>" + body.replace("{", "{{").replace("}", "}}") + "</REPORT>"
+    yield "хвостовая запятая", text + "<REPORT>" + body[:-1].rstrip() + ",\n}</REPORT>"
+    yield "markdown", text + "<REPORT>```json\n" + body + "\n```</REPORT>"
+    yield "без закрывающего тега", text + "<REPORT>" + body
+    yield "марина без скобок", text + " MARIN_REPORT " + body + " MARIN_REPORT Спасибо!"
+    yield "python-литерал", text + "<REPORT>" + repr(REPORT) + "</REPORT>"
+    yield "оборван в массиве", text + "<REPORT>" + body[:body.index("Обратная связь") + 3]
+    # Не восстанавливаются, но и разбор не должен падать (literal_eval дает TypeError)
+    yield "лишние скобки", text + "<REPORT>{ " + body + " }</REPORT>"
+    yield "обрывок", text + "<REPORT>["
+
+
+# Порчи, после которых отчета нет: проверяется только, что разбор не падает
+UNRECOVERABLE = ("лишние скобки", "обрывок")
+
+
+def run_fuzz(corpus, seeds):
+    failures = []
+
+    def fail(kind, text, detail):
+        failures.append((kind, detail, text[:160]))
+
+    whole = {id(t): report_parser.parse(t) for t in corpus}
+    for text in corpus:
+        parsed = whole[id(text)]
+        # Сверка с прежним поведением там, где оно было корректным
+        if "MARIN_REPORT" not in text:
+            prefix, logs, report = legacy_whole(text)
+            if parsed.prefix != prefix:
+                fail("prefix", text, (parsed.prefix[:60], prefix[:60]))
+            if [log.raw for log in parsed.logs] != logs:
+                fail("logs", text, ([log.raw for log in parsed.logs], logs))
+            if report is not None and parsed.report != report:
+                fail("report", text, "прежний разбор нашел отчет, новый — другой")
+
+    for seed in range(seeds):
+        rnd = random.Random(seed)
+        for text in corpus:
+            expected = whole[id(text)]
+            result = new_stream(split_random(text, rnd, 1, rnd.choice((2, 5, 12, 40))))
+            if (result.visible, result.prefix, result.logs, result.reports) != \
+                    (expected.visible, expected.prefix, expected.logs, expected.reports):
+                fail("split", text, f"seed={seed}")
+
+    rnd = random.Random(0)
+    sample = rnd.sample(corpus, min(len(corpus), 50))
+    kinds = 0
+    for text in sample:
+        base = text.split("<REPORT>")[0].split("MARIN_REPORT")[0].rstrip("<")
+        for kinds, (name, mutated) in enumerate(mutations(base), 1):
+            try:
+                data = report_parser.parse(mutated).report
+                streamed = new_stream(split_random(mutated, rnd)).report
+            except Exception as exc:  # разбор не должен падать ни на чем
+                fail(name, mutated, repr(exc))
+                continue
+            if name in UNRECOVERABLE:
+                expected = None
+            elif name == "оборван в массиве":
+                # Оборванная строка закрывается как есть, остальное поле не теряется
+                expected = {**REPORT, "skill_gaps": ["Делегирование", "Обр"]}
+            else:
+                expected = REPORT
+            if data != expected or streamed != expected:
+                fail(name, mutated, data)
+
+    print(f"\nФаззинг: {len(corpus)} реплик × {seeds} разрезов, {len(sample)} × {kinds} порч отчета")
+    for kind, detail, text in failures[:20]:
+        print(f"  ❌ {kind}: {detail!r}\n     {text!r}")
+    print("  ✅ расхождений нет" if not failures else f"  всего расхождений: {len(failures)}")
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="база с chat_messages (по умолчанию DATABASE_URL или ./app.db)")
+    parser.add_argument("--synthetic", action="store_true", help="не читать базу, только синтетический корпус")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--seeds", type=int, default=20)
+    args = parser.parse_args()
+
+    url = args.url or os.getenv("DATABASE_URL") or "sqlite:///./app.db"
+    rnd = random.Random(42)
+    corpus = [] if args.synthetic else load_corpus(url)
+    if not corpus:
+        corpus = synthetic_corpus(rnd)
+
+    run_throughput(corpus, args.rounds, rnd)
+    if not run_fuzz(corpus, args.seeds):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
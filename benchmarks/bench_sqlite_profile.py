@@ -0,0 +1,175 @@
+"""Конкурентная нагрузка на SQLite: текущие настройки против профиля SQLITE_TUNED.
+
+Каждый профиль гоняется в отдельном процессе (движки создаются при импорте
+backend.database) на свежем файле базы. Асинхронные писатели имитируют
+реплики чата и голосовые стенограммы, читатели — дашборд HR и историю,
+синхронные потоки — обработчики и скрипты на обычной сессии.
+
+    python -m benchmarks.bench_sqlite_profile --seconds 10 --writers 16 --readers 16
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import uuid
+import tempfile
+import threading
+import subprocess
+import statistics
+
+
+def _percentiles(values):
+    if not values:
+        return {"n": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    values = sorted(values)
+
+    def pick(q):
+        return round(values[min(len(values) - 1, int(len(values) * q))], 2)
+
+    return {"n": len(values), "p50": round(statistics.median(values), 2),
+            "p95": pick(0.95), "p99": pick(0.99), "max": round(values[-1], 2)}
+
+
+def run_worker(args):
+    """Нагрузка внутри одного процесса; результат — JSON в stdout."""
+    from sqlalchemy import select
+    from sqlalchemy.exc import OperationalError
+
+    from backend import database, migrations, models
+    from backend.services import dashboard, reports
+
+    models.Base.metadata.create_all(bind=database.engine)
+    migrations.run_migrations(database.engine)
+
+    rnd = random.Random(1)
+    user_ids = [str(uuid.UUID(int=rnd.getrandbits(128))) for _ in range(args.users)]
+    with database.writer_engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"id": uid, "name": f"Кандидат {i:05d}", "gender": "male", "current_static_step": rnd.randint(0, 56)}
+            for i, uid in enumerate(user_ids)
+        ])
+
+    latencies = {"write": [], "read": [], "sync_write": []}
+    errors = {"locked": 0, "other": 0}
+    stop_at = time.monotonic() + args.seconds
+
+    def record_error(e):
+        errors["locked" if "locked" in str(e) or "busy" in str(e) else "other"] += 1
+
+    def write_message(session, user_id, n):
+        session.add(models.ChatMessage(user_id=user_id, role="user", content="Реплика кандидата " * 10, chat_type="voice"))
+        if n % 20 == 0:
+            reports.upsert_report(session, user_id, reports.VOICE, {"mbti_type": "INTJ", "summary": "s"})
+        session.commit()
+
+    async def writer(k):
+        n = 0
+        while time.monotonic() < stop_at:
+            n += 1
+            started = time.perf_counter()
+            try:
+                async with database.AsyncSessionLocal() as session:
+                    await session.run_sync(write_message, rnd.choice(user_ids), n)
+                latencies["write"].append((time.perf_counter() - started) * 1000)
+            except OperationalError as e:
+                record_error(e)
+
+    async def reader(k):
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                async with database.AsyncSessionLocal() as session:
+                    rows = (await session.execute(dashboard.users_statement(limit=50, status="chat"))).all()
+                    dashboard.users_page(rows, 50)
+                    await session.execute(
+                        select(models.ChatMessage.role, models.ChatMessage.content)
+                        .where(models.ChatMessage.user_id == rnd.choice(user_ids))
+                        .order_by(models.ChatMessage.timestamp)
+                    )
+                latencies["read"].append((time.perf_counter() - started) * 1000)
+            except OperationalError as e:
+                record_error(e)
+
+    def sync_writer():
+        n = 0
+        while time.monotonic() < stop_at:
+            n += 1
+            started = time.perf_counter()
+            session = database.SessionLocal()
+            try:
+                write_message(session, rnd.choice(user_ids), n)
+                latencies["sync_write"].append((time.perf_counter() - started) * 1000)
+            except OperationalError as e:
+                session.rollback()
+                record_error(e)
+            finally:
+                session.close()
+
+    async def main():
+        threads = [threading.Thread(target=sync_writer) for _ in range(args.threads)]
+        for t in threads:
+            t.start()
+        await asyncio.gather(
+            *[writer(k) for k in range(args.writers)],
+            *[reader(k) for k in range(args.readers)],
+        )
+        for t in threads:
+            t.join()
+        await database.dispose_async_engines()
+
+    asyncio.run(main())
+    database.engine.dispose()
+    if database.writer_engine is not database.engine:
+        database.writer_engine.dispose()
+
+    result = {name: _percentiles(values) for name, values in latencies.items()}
+    result["errors"] = errors
+    result["ops_per_s"] = round(sum(len(v) for v in latencies.values()) / args.seconds, 1)
+    print(json.dumps(result))
+
+
+def run_profile(name, tuned, args):
+    path = os.path.join(tempfile.mkdtemp(), f"bench_{name}.db")
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{path}", "SQLITE_TUNED": "1" if tuned else "0"}
+    cmd = [sys.executable, "-m", "benchmarks.bench_sqlite_profile", "--worker",
+           "--seconds", str(args.seconds), "--writers", str(args.writers),
+           "--readers", str(args.readers), "--threads", str(args.threads), "--users", str(args.users)]
+    out = subprocess.run(cmd, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--writers", type=int, default=16, help="асинхронных писателей")
+    parser.add_argument("--readers", type=int, default=16, help="асинхронных читателей")
+    parser.add_argument("--threads", type=int, default=4, help="синхронных писателей в потоках")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    results = {}
+    for name, tuned in (("default", False), ("tuned", True)):
+        print(f"⏱️ Профиль {name}: {args.seconds:.0f} с нагрузки...", flush=True)
+        results[name] = run_profile(name, tuned, args)
+
+    def fmt(value):
+        return "—" if value is None else f"{value:.1f}"
+
+    print(f"\n{'профиль':<10}{'операция':<12}{'n':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, result in results.items():
+        for op in ("write", "sync_write", "read"):
+            r = result[op]
+            print(f"{name:<10}{op:<12}{r['n']:>8}{fmt(r['p50']):>10}{fmt(r['p95']):>10}{fmt(r['p99']):>10}{fmt(r['max']):>10}")
+        print(f"{name:<10}{'итого':<12}{result['ops_per_s']:>8} оп/с, ошибок 'database is locked': {result['errors']['locked']}, прочих: {result['errors']['other']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Время старта API: импорт backend.main и время до готовности воркера.
+
+Каждый замер — новый процесс uvicorn на свободном порту и временной базе,
+засеянной вопросами и миграциями (повторный старт после деплоя). Готовность —
+первый ответ GET /health: uvicorn принимает запросы только после lifespan.
+Затем замеряется первый GET /questions — что осталось непрогретым.
+
+Сценарии: настройки по умолчанию (прогрев catalog,openai), SCHEMA_CHECK=0,
+без прогрева и полный прогрев (STARTUP_PREWARM=catalog,db,openai,pdf).
+
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --save startup.json
+    python -m benchmarks.bench_startup --baseline startup.json --tolerance 0.2
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+import httpx
+
+SCENARIOS = {
+    "по умолчанию": {},
+    "SCHEMA_CHECK=0": {"SCHEMA_CHECK": "0"},
+    "без прогрева": {"STARTUP_PREWARM": ""},
+    "полный прогрев": {"STARTUP_PREWARM": "catalog,db,openai,pdf"},
+}
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import backend.main; print((time.perf_counter() - t) * 1000)"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _stats(values):
+    values = sorted(values)
+    return {"n": len(values), "p50": round(statistics.median(values), 1),
+            "min": round(values[0], 1), "max": round(values[-1], 1)}
+
+
+def measure_import(env, runs):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], env=env, check=True,
+                             capture_output=True, text=True).stdout
+        samples.append(float(out.strip().splitlines()[-1]))
+    return _stats(samples)
+
+
+def measure_start(env, timeout=60):
+    """(мс до первого ответа /health, мс первого GET /questions) для одного старта."""
+    port = _free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port),
+                             "--log-level", "warning"], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30) as client:
+            while True:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"uvicorn завершился с кодом {proc.returncode}")
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError(f"API не ответил за {timeout} с")
+                try:
+                    if client.get("/health").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    time.sleep(0.005)
+            ready = (time.perf_counter() - started) * 1000
+            first = time.perf_counter()
+            client.get("/questions").raise_for_status()
+            return ready, (time.perf_counter() - first) * 1000
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def report(result, baseline, tolerance):
+    print(f"\nimport backend.main: p50 {result['import']['p50']} мс "
+          f"(min {result['import']['min']}, max {result['import']['max']})")
+    print(f"\n{'сценарий':<18}{'готов p50':>11}{'min':>9}{'max':>9}{'1-й /questions':>16}")
+    for name, r in result["scenarios"].items():
+        print(f"{name:<18}{r['ready']['p50']:>11}{r['ready']['min']:>9}{r['ready']['max']:>9}"
+              f"{r['first_request']['p50']:>16}")
+
+    if not baseline:
+        return 0
+    regressions = []
+    checks = [("import", result["import"], baseline.get("import"))]
+    checks += [(f"{name}: готовность", r["ready"], (baseline["scenarios"].get(name) or {}).get("ready"))
+               for name, r in result["scenarios"].items()]
+    for label, current, base in checks:
+        if base and current["p50"] > base["p50"] * (1 + tolerance):
+            regressions.append(f"{label}: p50 {base['p50']} -> {current['p50']} мс")
+    if regressions:
+        print("\n❌ Регрессии относительно базового прогона:\n  " + "\n  ".join(regressions))
+        return 1
+    print(f"\n✅ Регрессий нет (допуск {tolerance:.0%})")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="стартов на сценарий")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="только эти сценарии")
+    parser.add_argument("--save", help="сохранить результат в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимый рост p50, доля")
+    args = parser.parse_args()
+
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_startup.db')}"
+    env = {**os.environ, "DATABASE_URL": database_url, "OPENAI_API_KEY": "sk-mock-benchmark",
+           "METRICS_ENABLED": "1"}
+    env.pop("ASYNC_DATABASE_URL", None)
+    subprocess.run([sys.executable, "-m", "backend.seed"], env=env, check=True, capture_output=True)
+    subprocess.run([sys.executable, "-m", "backend.migrations"], env=env, check=True, capture_output=True)
+
+    print(f"🚀 {args.runs} стартов на сценарий ({database_url})", flush=True)
+    result = {"import": measure_import(env, args.runs), "scenarios": {}}
+    for name in args.scenario or SCENARIOS:
+        scenario_env = {**env, **SCENARIOS[name]}
+        ready, first = zip(*(measure_start(scenario_env) for _ in range(args.runs)))
+        result["scenarios"][name] = {"ready": _stats(ready), "first_request": _stats(first)}
+        print(f"  ✔️ {name}", flush=True)
+
+    result["params"] = {"runs": args.runs}
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    sys.exit(report(result, baseline, args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
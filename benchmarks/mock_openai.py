@@ -0,0 +1,167 @@
+"""Локальная замена OpenAI для нагрузочных прогонов: ни одного реального токена.
+
+POST /v1/chat/completions — обычный ответ или SSE-поток чанков; каждая
+REPORT_EVERY-я реплика кандидата получает в конце блок <REPORT>.
+WS /v1/realtime — Realtime API: на response.create отдает распознанную
+реплику кандидата, аудио-дельты (тишина PCM16), стенограмму Марины и
+response.done с usage; каждый REPORT_EVERY-й ответ — с <MARIN_REPORT>.
+
+    python -m benchmarks.mock_openai --port 9100 --latency-ms 300 --token-ms 15
+    OPENAI_BASE_URL=http://127.0.0.1:9100/v1 OPENAI_REALTIME_URL=ws://127.0.0.1:9100/v1/realtime uvicorn backend.main:app
+"""
+import json
+import time
+import base64
+import asyncio
+import argparse
+
+import uvicorn
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class MockConfig:
+    latency_ms = 300        # до первого токена / первого аудио
+    token_ms = 15           # между чанками потока
+    tokens = 40             # чанков в ответе
+    report_every = 6        # каждая N-я реплика кандидата завершает интервью
+    audio_chunks = 10       # аудио-дельт в голосовом ответе
+    audio_chunk_ms = 100    # длительность одной дельты
+
+
+config = MockConfig()
+app = FastAPI()
+
+WORDS = ("Понимаю", "вас.", "[[LOG: E+1, N+1]]", "Расскажите,", "пожалуйста,", "как", "вы", "обычно",
+         "принимаете", "решения,", "когда", "сроки", "горят?")
+TEXT_REPORT = {
+    "mbti_type": "ENTP",
+    "metrics": {"E_I": 70, "S_N": 30, "T_F": 80, "J_P": 20},
+    "summary": "Кандидат быстро генерирует идеи и уверенно спорит.",
+    "skill_gaps": ["Доводить начатое до конца", "Планировать ресурсы"],
+}
+
+
+def _answer_parts(turn: int):
+    parts = [WORDS[i % len(WORDS)] + " " for i in range(config.tokens)]
+    if config.report_every and turn % config.report_every == 0:
+        parts.append("<REPORT>" + json.dumps(TEXT_REPORT, ensure_ascii=False) + "</REPORT>")
+    return parts
+
+
+def _usage(messages, completion_tokens):
+    prompt_tokens = sum(len(str(m.get("content", ""))) // 4 for m in messages)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": prompt_tokens // 2},
+    }
+
+
+def _chunk(model, delta=None, finish_reason=None, usage=None):
+    choices = [] if delta is None and finish_reason is None else [
+        {"index": 0, "delta": delta or {}, "finish_reason": finish_reason}
+    ]
+    payload = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+               "model": model, "choices": choices, "usage": usage}
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    model = body.get("model", "mock")
+    turn = sum(1 for m in messages if m.get("role") == "user")
+    parts = _answer_parts(turn)
+    usage = _usage(messages, len(parts))
+
+    if not body.get("stream"):
+        await asyncio.sleep((config.latency_ms + config.token_ms * len(parts)) / 1000)
+        return JSONResponse({
+            "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(parts)},
+                         "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    async def stream():
+        await asyncio.sleep(config.latency_ms / 1000)
+        yield _chunk(model, {"role": "assistant", "content": ""})
+        for part in parts:
+            await asyncio.sleep(config.token_ms / 1000)
+            yield _chunk(model, {"content": part})
+        yield _chunk(model, finish_reason="stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield _chunk(model, usage=usage)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.websocket("/v1/realtime")
+async def realtime(websocket: WebSocket):
+    await websocket.accept()
+    silence = base64.b64encode(bytes(24000 * 2 * config.audio_chunk_ms // 1000)).decode("ascii")
+    responses = 0
+    audio_bytes = 0
+    try:
+        while True:
+            event = json.loads(await websocket.receive_text())
+            kind = event.get("type")
+            if kind == "input_audio_buffer.append":
+                audio_bytes += len(event.get("audio", "")) * 3 // 4
+            elif kind == "input_audio_buffer.commit":
+                await websocket.send_text(json.dumps({
+                    "type": "conversation.item.input_audio_transcription.completed",
+                    "transcript": f"Реплика кандидата, {audio_bytes // 48} мс аудио",
+                }, ensure_ascii=False))
+                audio_bytes = 0
+            elif kind == "response.create":
+                responses += 1
+                await asyncio.sleep(config.latency_ms / 1000)
+                for _ in range(config.audio_chunks):
+                    await websocket.send_text(json.dumps({"type": "response.audio.delta", "delta": silence}))
+                    await asyncio.sleep(config.audio_chunk_ms / 1000 / 4)
+                transcript = "Интересно. Расскажите, что вас вдохновляет в работе?"
+                if config.report_every and responses % config.report_every == 0:
+                    transcript = ("Формирую технический отчет. <MARIN_REPORT>"
+                                  + json.dumps(TEXT_REPORT, ensure_ascii=False) + "</MARIN_REPORT> Спасибо!")
+                await websocket.send_text(json.dumps(
+                    {"type": "response.audio_transcript.done", "transcript": transcript}, ensure_ascii=False
+                ))
+                await websocket.send_text(json.dumps({"type": "response.done", "response": {
+                    "output": [],
+                    "usage": {
+                        "input_tokens": 900, "output_tokens": 300,
+                        "input_token_details": {"cached_tokens": 400, "audio_tokens": 200},
+                        "output_token_details": {"audio_tokens": 250},
+                    },
+                }}))
+    except WebSocketDisconnect:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=int, default=MockConfig.latency_ms, help="задержка до первого токена")
+    parser.add_argument("--token-ms", type=int, default=MockConfig.token_ms, help="пауза между чанками потока")
+    parser.add_argument("--tokens", type=int, default=MockConfig.tokens, help="чанков в ответе")
+    parser.add_argument("--report-every", type=int, default=MockConfig.report_every,
+                        help="каждая N-я реплика с отчетом (0 — никогда)")
+    parser.add_argument("--audio-chunks", type=int, default=MockConfig.audio_chunks)
+    args = parser.parse_args()
+
+    config.latency_ms = args.latency_ms
+    config.token_ms = args.token_ms
+    config.tokens = args.tokens
+    config.report_every = args.report_every
+    config.audio_chunks = args.audio_chunks
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
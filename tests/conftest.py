@@ -0,0 +1,39 @@
+import os
+import tempfile
+
+# backend.database читает DATABASE_URL при импорте — тесты не должны трогать ./app.db
+_TMP = tempfile.mkdtemp(prefix="hr_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP}/app.db"
+os.environ.setdefault("METRICS_ENABLED", "0")
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend import models
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """Чистая база SQLite в файле на каждый тест, схема — из models.py."""
+    engine = create_engine(f"sqlite:///{tmp_path}/test.db")
+    models.Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(bind=engine, autoflush=False)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def make_user(db):
+    def make(name="Кандидат", gender="female", **fields):
+        user = models.User(name=name, gender=gender, **fields)
+        db.add(user)
+        db.commit()
+        return user.id
+    return make
@@ -0,0 +1,72 @@
+import itertools
+
+from backend import models
+from backend.services import analytics, answers, reports
+from backend.services.dashboard import STATIC_TEST_STEPS
+
+
+def _snapshot(db):
+    """Ненулевые строки обеих сводных таблиц; apply_change может оставлять ключи с нулем."""
+    T, A = models.ResultTypeCount, models.ResultAxisBin
+    types = sorted((r.source, r.day, r.gender, r.mbti_type, r.candidates)
+                   for r in db.query(T) if r.candidates)
+    axes = sorted((r.source, r.day, r.gender, r.axis, r.bin, r.candidates, r.total, r.squares)
+                  for r in db.query(A) if r.candidates)
+    return types, axes
+
+
+def _sheet(pattern):
+    """Полный лист теста: буквы берутся по кругу из pattern."""
+    letters = itertools.cycle(pattern)
+    return {question_id: next(letters) for question_id in range(1, STATIC_TEST_STEPS + 1)}
+
+
+def _report(mbti, e_i, s_n=50, t_f=50, j_p=50):
+    return {"mbti_type": mbti, "metrics": {"E_I": e_i, "S_N": s_n, "T_F": t_f, "J_P": j_p}}
+
+
+def test_incremental_summary_matches_rebuild(db, make_user):
+    users = [make_user(f"Кандидат {i}", gender) for i, gender in enumerate(["male", "female", None, "female"])]
+
+    # Тест: пройден целиком, пройден и затем исправлен, брошен на середине
+    answers.save_answers(db, users[0], _sheet("ESTJ"))
+    answers.save_answers(db, users[1], _sheet("INFP"))
+    answers.save_answers(db, users[1], {1: "E", 2: "S", 5: "E"})
+    answers.save_answers(db, users[2], {1: "E", 2: "N"})
+    answers.save_answers(db, users[3], _sheet("ISNFTJP"))
+
+    # Отчеты: новый, замененный с другим типом, с осью вне 0-100 и без метрик
+    reports.upsert_report(db, users[0], reports.TEXT, _report("ENTJ", 20))
+    reports.upsert_report(db, users[0], reports.TEXT, _report("INTJ", 80, 100, 0, 55))
+    reports.upsert_report(db, users[1], reports.VOICE, _report("ENFP", 150, 35))
+    reports.upsert_report(db, users[2], reports.TEXT, {"mbti_type": "ISFJ"})
+    reports.upsert_report(db, users[3], reports.VOICE, _report("ESTP", "42.7", 10))
+    db.commit()
+
+    incremental = _snapshot(db)
+    assert {row[0] for row in incremental[0]} == set(analytics.SOURCES)
+    assert {row[0] for row in incremental[1]} == set(analytics.SOURCES)
+
+    analytics.rebuild(db)
+    db.commit()
+    assert _snapshot(db) == incremental
+
+
+def test_population_reads_summary_per_source(db, make_user):
+    first, second = make_user("Первый", "male"), make_user("Второй", "female")
+    answers.save_answers(db, first, _sheet("ESTJ"))
+    answers.save_answers(db, second, _sheet("ESTJ"))
+    reports.upsert_report(db, first, reports.TEXT, _report("INTJ", 20))
+    reports.upsert_report(db, second, reports.TEXT, _report("INTJ", 60))
+    db.commit()
+
+    static = analytics.population(db, analytics.STATIC)["groups"]
+    assert len(static) == 1 and static[0]["types"] == {"ESTJ": 2}
+
+    text = analytics.population(db, reports.TEXT, by_gender=True)["groups"]
+    assert [(g["gender"], g["types"]) for g in text] == [("female", {"INTJ": 1}), ("male", {"INTJ": 1})]
+
+    overall = analytics.population(db, reports.TEXT)["groups"][0]
+    e_i = next(axis for axis in overall["axes"] if axis["axis"] == "E_I")
+    assert (e_i["candidates"], e_i["mean"], e_i["std"]) == (2, 40.0, 20.0)
+    assert [b["candidates"] for b in e_i["histogram"] if b["candidates"]] == [1, 1]
@@ -0,0 +1,105 @@
+import pytest
+
+from backend import models
+from backend.services import analytics, answers
+
+
+def _vector(db, user_id):
+    db.expire_all()
+    return db.get(models.UserAnswerVector, user_id)
+
+
+def _summary(db):
+    return sorted((r.source, r.mbti_type, r.candidates) for r in db.query(models.ResultTypeCount) if r.candidates)
+
+
+def test_same_sheet_twice_changes_nothing(db, make_user):
+    user_id = make_user()
+    sheet = {1: "E", 2: "I", 3: "N"}
+    assert answers.save_answers(db, user_id, sheet) == 3
+    db.commit()
+    first = _vector(db, user_id)
+    state = (first.answers, first.answered, first.e, first.i, first.n)
+
+    assert answers.save_answers(db, user_id, sheet) == 3
+    db.commit()
+    again = _vector(db, user_id)
+    assert (again.answers, again.answered, again.e, again.i, again.n) == state == ("EIN", 3, 1, 1, 1)
+    assert db.query(models.UserAnswer).filter_by(user_id=user_id).count() == 3
+
+
+def test_changed_answer_moves_the_tally(db, make_user):
+    user_id = make_user()
+    answers.save_answers(db, user_id, {1: "E", 2: "E"})
+    answers.save_answers(db, user_id, {2: "I"})
+    db.commit()
+    vector = _vector(db, user_id)
+    assert (vector.answers, vector.e, vector.i, vector.answered) == ("EI", 1, 1, 2)
+    assert db.get(models.User, user_id).current_static_step == 2
+
+
+def test_completion_counted_in_summary_once(db, make_user):
+    user_id = make_user()
+    full = {q: "E" for q in range(1, 57)}
+    answers.save_answers(db, user_id, full)
+    db.commit()
+    completed_at = _vector(db, user_id).completed_at
+    assert completed_at is not None
+
+    answers.save_answers(db, user_id, full)
+    db.commit()
+    assert _vector(db, user_id).completed_at == completed_at
+    assert _summary(db) == [(analytics.STATIC, "ESTJ", 1)]
+
+
+def test_first_save_carries_over_legacy_rows(db, make_user):
+    # Ответы, сохраненные до появления user_answer_vectors
+    user_id = make_user()
+    db.add_all([models.UserAnswer(user_id=user_id, question_id=q, selected_key="P") for q in (1, 2)])
+    db.commit()
+
+    assert answers.save_answers(db, user_id, {3: "J"}) == 3
+    db.commit()
+    vector = _vector(db, user_id)
+    assert (vector.answers, vector.p, vector.j) == ("PPJ", 2, 1)
+
+
+@pytest.mark.parametrize("question_id", [0, -1, 57, 10 ** 9])
+def test_question_outside_catalogue_is_rejected(db, make_user, question_id):
+    user_id = make_user()
+    answers.save_answers(db, user_id, {1: "E"})
+    db.commit()
+
+    with pytest.raises(ValueError):
+        answers.save_answers(db, user_id, {question_id: "E"})
+    db.rollback()
+    vector = _vector(db, user_id)
+    assert (vector.answers, vector.answered) == ("E", 1)
+    assert db.query(models.UserAnswer).filter_by(user_id=user_id).count() == 1
+
+
+def test_legacy_rows_outside_catalogue_are_ignored(db, make_user):
+    user_id = make_user()
+    db.add_all([models.UserAnswer(user_id=user_id, question_id=q, selected_key="E") for q in (1, 500)])
+    db.commit()
+    vector = answers.build_vector(db, user_id)
+    assert (vector.answers, vector.answered) == ("E", 1)
+
+
+def test_single_answer_endpoint_validates_question_id(monkeypatch):
+    from fastapi.testclient import TestClient
+    from backend import database, main
+    from backend.seed import seed_questions
+
+    monkeypatch.setattr(main, "STARTUP_PREWARM", set())
+    with TestClient(main.app) as client:
+        # Старт приложения создал схему в базе из DATABASE_URL; вопросы — из questions.json
+        with database.SessionLocal() as session:
+            seed_questions(session)
+        user_id = client.post("/users", json={"name": "Кандидат", "gender": "male"}).json()["id"]
+
+        bad = client.post("/answers", json={"user_id": user_id, "question_id": 10 ** 9, "selected_key": "E"})
+        assert bad.status_code == 422
+        ok = client.post("/answers", json={"user_id": user_id, "question_id": 3, "selected_key": "E"})
+        assert ok.status_code == 200
+        assert client.get(f"/users/{user_id}").json()["current_static_step"] == 1
@@ -0,0 +1,15 @@
+from fastapi.testclient import TestClient
+
+from backend import main
+
+
+def test_empty_selection_is_rejected_and_does_not_export_everyone(monkeypatch):
+    monkeypatch.setattr(main, "STARTUP_PREWARM", set())
+    with TestClient(main.app) as client:
+        client.post("/users", json={"name": "Кандидат", "gender": "female"})
+
+        empty = client.post("/api/v1/user-report/export", json={"user_ids": []})
+        assert empty.status_code == 422
+
+        unknown = client.post("/api/v1/user-report/export", json={"user_ids": ["нет-такого"]})
+        assert unknown.headers["X-Export-Total"] == "1"
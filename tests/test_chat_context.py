@@ -0,0 +1,90 @@
+from backend.services import chat_context
+from backend.services.chat_context import SUMMARY_HEADER, build_context, estimate_tokens
+
+PROMPT = "Системный промпт интервью."
+
+
+def _dialog(n, words=60):
+    """Реплики по очереди; в каждом ответе — своя LOG-строка."""
+    messages = []
+    for i in range(1, n + 1):
+        if i % 2:
+            content = f"Ответ кандидата {i}: " + "слово " * words
+            messages.append({"id": i, "role": "user", "content": content})
+        else:
+            content = f"Вопрос {i}. [[LOG: Axis: E/I | Value: E | Conf: 70% | Reasoning: реплика {i}]]"
+            messages.append({"id": i, "role": "assistant", "content": content})
+    return messages
+
+
+def _tokens(openai_messages):
+    return sum(estimate_tokens(m["content"]) for m in openai_messages)
+
+
+def test_short_dialog_is_sent_verbatim():
+    messages = _dialog(4)
+    openai_messages, updated = build_context(PROMPT, messages, budget=8000)
+
+    assert updated is None
+    assert openai_messages[0] == {"role": "system", "content": PROMPT}
+    assert [m["content"] for m in openai_messages[1:]] == [m["content"] for m in messages]
+
+
+def test_overflow_compacts_oldest_messages_into_summary():
+    messages = _dialog(40)
+    budget = 1000
+    openai_messages, updated = build_context(PROMPT, messages, budget=budget)
+
+    summary, upto_id = updated
+    sent_ids = [m["id"] for m in messages if m["id"] > upto_id]
+    assert [m["content"] for m in openai_messages[2:]] == [m["content"] for m in messages if m["id"] in sent_ids]
+    assert len(sent_ids) >= chat_context.MIN_RECENT_MESSAGES
+    assert _tokens(openai_messages) <= budget
+    # В сводку ушли LOG-доказательства сжатых ответов, а не сами реплики
+    assert openai_messages[1]["content"].startswith(SUMMARY_HEADER)
+    newest_compacted = max(m["id"] for m in messages if m["role"] == "assistant" and m["id"] <= upto_id)
+    assert summary.endswith(f"Reasoning: реплика {newest_compacted}")
+    assert "Ответ кандидата" not in summary
+
+
+def test_messages_already_in_summary_are_not_resent():
+    messages = _dialog(10)
+    openai_messages, updated = build_context(PROMPT, messages, summary="- старый LOG", summary_upto_id=6)
+
+    assert updated is None
+    assert openai_messages[1]["content"] == f"{SUMMARY_HEADER}\n- старый LOG"
+    assert [m["content"] for m in openai_messages[2:]] == [m["content"] for m in messages[6:]]
+
+
+def test_recent_messages_are_kept_even_over_budget():
+    messages = _dialog(chat_context.MIN_RECENT_MESSAGES, words=500)
+    openai_messages, updated = build_context(PROMPT, messages, budget=200)
+
+    assert updated is None
+    assert len(openai_messages) == 1 + chat_context.MIN_RECENT_MESSAGES
+
+
+def test_oversized_summary_keeps_only_newest_lines():
+    budget = 400
+    summary = "\n".join(f"- LOG номер {i} " + "x" * 30 for i in range(100))
+    openai_messages, updated = build_context(PROMPT, _dialog(2), summary=summary, summary_upto_id=0, budget=budget)
+
+    capped, upto_id = updated
+    assert upto_id == 0
+    assert estimate_tokens(capped) <= int(budget * chat_context.SUMMARY_MAX_RATIO)
+    assert capped.endswith("- LOG номер 99 " + "x" * 30)
+    assert "- LOG номер 0 " not in capped
+    assert openai_messages[1]["content"] == f"{SUMMARY_HEADER}\n{capped}"
+
+
+def test_summary_stays_capped_across_many_compactions():
+    budget = 1000
+    summary, upto_id = "", 0
+    messages = []
+    for turn in range(30):
+        messages += [{**m, "id": m["id"] + turn * 40} for m in _dialog(40)]
+        _, updated = build_context(PROMPT, messages, summary=summary, summary_upto_id=upto_id, budget=budget)
+        if updated:
+            summary, upto_id = updated
+    assert estimate_tokens(summary) <= int(budget * chat_context.SUMMARY_MAX_RATIO)
+    assert upto_id > 0
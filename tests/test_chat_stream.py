@@ -0,0 +1,140 @@
+import asyncio
+from types import SimpleNamespace
+
+import anyio
+import pytest
+
+from backend import database, main, models
+from backend.services.upstream import UpstreamScheduler
+
+
+class FakeStream:
+    """Поток chat.completions: отдает чанки и запоминает закрытие."""
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.closed = 0
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        for part in self.parts:
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=part))])
+
+    async def close(self):
+        self.closed += 1
+
+
+@pytest.fixture
+def stream_env(monkeypatch):
+    models.Base.metadata.create_all(bind=database.engine)
+    with database.SessionLocal() as session:
+        user = models.User(name="Кандидат", gender="female")
+        session.add(user)
+        session.commit()
+        user_id = user.id
+
+    scheduler = UpstreamScheduler(max_concurrency=2, deadline=30)
+    stream = FakeStream(["Привет", ", как дела?"])
+
+    async def create():
+        return stream
+
+    monkeypatch.setattr(main, "_open_chat_completion",
+                        lambda api, uid, messages, **params: scheduler.open(api, uid, create, 10))
+    return SimpleNamespace(user_id=user_id, scheduler=scheduler, stream=stream)
+
+
+def _scope():
+    return {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"},
+            "method": "POST", "path": "/chat/stream", "headers": []}
+
+
+async def _receive():
+    await asyncio.sleep(3600)
+
+
+def _run(coro):
+    async def run():
+        try:
+            return await coro
+        finally:
+            await main.voice_writer.flush()
+            await database.dispose_async_engines()
+    return asyncio.run(run())
+
+
+def test_lease_is_released_when_client_leaves_before_first_byte(stream_env):
+    async def scenario():
+        response = await main.chat_with_akmeolog_stream(stream_env.user_id, {"message": "Здравствуйте"})
+        assert stream_env.scheduler.stats()["in_flight"] == 1
+
+        async def send(message):
+            # ASGI 2.4: сервер сообщает об ушедшем клиенте ошибкой на первой же отправке
+            raise OSError("client disconnected")
+
+        with pytest.raises(Exception):
+            await response(_scope(), _receive, send)
+
+    _run(scenario())
+    assert stream_env.scheduler.stats()["in_flight"] == 0
+    assert stream_env.stream.closed >= 1
+
+
+def test_completed_stream_releases_lease_once(stream_env):
+    async def scenario():
+        response = await main.chat_with_akmeolog_stream(stream_env.user_id, {"message": "Здравствуйте"})
+        body = []
+
+        async def send(message):
+            if message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+
+        await response(_scope(), _receive, send)
+        return b"".join(body).decode()
+
+    body = _run(scenario())
+    assert "event: done" in body and "Привет, как дела?" in body
+    stats = stream_env.scheduler.stats()
+    assert stats["in_flight"] == 0
+
+
+def test_final_reply_is_saved_when_stream_is_cancelled_during_save(stream_env, monkeypatch):
+    run_db = main._run_db
+    saving = None
+    partial = []
+
+    async def slow_run_db(fn, *args):
+        if fn is main._save_chat_message:
+            saving.set()
+            await asyncio.sleep(0.1)
+        return await run_db(fn, *args)
+
+    async def save_partial_reply(*args):
+        partial.append(args)
+
+    monkeypatch.setattr(main, "_run_db", slow_run_db)
+    monkeypatch.setattr(main, "_save_partial_reply", save_partial_reply)
+
+    async def scenario():
+        nonlocal saving
+        saving = asyncio.Event()
+        response = await main.chat_with_akmeolog_stream(stream_env.user_id, {"message": "Здравствуйте"})
+
+        async def send(message):
+            pass
+
+        # Как Starlette при уходе клиента: отмена через cancel scope anyio, пока реплика пишется в базу
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(response, _scope(), _receive, send)
+            await saving.wait()
+            tg.cancel_scope.cancel()
+
+    _run(scenario())
+    with database.SessionLocal() as session:
+        replies = session.query(models.ChatMessage).filter_by(user_id=stream_env.user_id, role="assistant").all()
+    assert [reply.content for reply in replies] == ["Привет, как дела?"]
+    # Реплика сохранена целиком основным путем, а не как оборванная
+    assert partial == []
+    assert stream_env.scheduler.stats()["in_flight"] == 0
@@ -0,0 +1,122 @@
+import pytest
+
+from backend import main, models
+from backend.services.conversation_cache import ConversationCache, ConversationState
+
+
+def _state(user_id, text="", prompt="промпт"):
+    history = [{"id": 1, "role": "user", "content": text}] if text else []
+    return ConversationState(user_id=user_id, name="Кандидат", gender="female",
+                             system_prompt=prompt, history={"text": history})
+
+
+def test_hits_misses_and_write_through():
+    cache = ConversationCache(enabled=True)
+    assert cache.get("u1") is None
+    cache.put(_state("u1"))
+    cache.append_message("u1", "text", {"id": 7, "role": "user", "content": "привет"})
+    # Голосовой истории в состоянии нет — ее дописывать некуда
+    cache.append_message("u1", "voice", {"id": 8, "role": "user", "content": "алло"})
+
+    state = cache.get("u1")
+    assert [m["id"] for m in state.history["text"]] == [7]
+    assert "voice" not in state.history
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["chars"] == len("промпт") + len("привет")
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ConversationCache(enabled=True, max_users=2)
+    cache.put(_state("u1"))
+    cache.put(_state("u2"))
+    cache.get("u1")
+    cache.put(_state("u3"))
+
+    assert cache.get("u2") is None
+    assert cache.get("u1") is not None and cache.get("u3") is not None
+    assert cache.stats()["evictions"]["lru"] == 1
+
+
+def test_size_limit_evicts_oldest_but_keeps_the_last_entry():
+    cache = ConversationCache(enabled=True, max_chars=25)
+    cache.put(_state("u1", "а" * 10))
+    cache.put(_state("u2", "б" * 10))
+    assert cache.get("u1") is None
+    assert cache.stats()["evictions"]["size"] == 1
+
+    cache.append_message("u2", "text", {"id": 2, "role": "assistant", "content": "в" * 100})
+    # Единственную запись не выбрасываем, даже если она больше лимита
+    assert cache.get("u2") is not None
+
+
+def test_ttl_expires_idle_entries():
+    cache = ConversationCache(enabled=True, ttl=60)
+    cache.put(_state("u1"))
+    cache.get("u1").touched_at -= 61
+
+    assert cache.get("u1") is None
+    stats = cache.stats()
+    assert stats["evictions"]["ttl"] == 1 and stats["entries"] == 0 and stats["chars"] == 0
+
+
+def test_mark_stale_drops_entry_and_turns_hit_into_miss():
+    cache = ConversationCache(enabled=True)
+    cache.put(_state("u1", "привет"))
+    assert cache.get("u1") is not None
+    cache.mark_stale("u1")
+
+    stats = cache.stats()
+    assert cache.get("u1") is None
+    assert stats["hits"] == 0 and stats["misses"] == 1
+    assert stats["evictions"]["stale"] == 1 and stats["chars"] == 0
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ConversationCache(enabled=False)
+    cache.put(_state("u1"))
+    assert cache.get("u1") is None and cache.stats()["entries"] == 0
+
+
+@pytest.mark.parametrize("cache", [
+    ConversationCache(enabled=False),
+    # Состояние вытесняется сразу после put — append_message его уже не найдет
+    ConversationCache(enabled=True, max_users=0),
+], ids=["disabled", "evicted"])
+def test_prepare_chat_turn_appends_message_itself_when_cache_misses(db, make_user, monkeypatch, cache):
+    monkeypatch.setattr(main, "conversation_cache", cache)
+    user_id = make_user()
+
+    first = main._prepare_chat_turn(db, user_id, "Здравствуйте")
+    second = main._prepare_chat_turn(db, user_id, "Как дела?")
+
+    assert [m["content"] for m in first if m["role"] == "user"] == ["Здравствуйте"]
+    # Ровно по одной копии каждой реплики: без дублей из кеша и без пропусков
+    assert [m["content"] for m in second if m["role"] == "user"] == ["Здравствуйте", "Как дела?"]
+
+
+def test_prepare_chat_turn_uses_cache_without_rereading_history(db, make_user, monkeypatch):
+    cache = ConversationCache(enabled=True, verify=False)
+    monkeypatch.setattr(main, "conversation_cache", cache)
+    user_id = make_user()
+
+    main._prepare_chat_turn(db, user_id, "Здравствуйте")
+    second = main._prepare_chat_turn(db, user_id, "Как дела?")
+
+    assert [m["content"] for m in second if m["role"] == "user"] == ["Здравствуйте", "Как дела?"]
+    assert cache.stats()["hits"] == 1
+
+
+def test_verify_reloads_history_written_by_another_worker(db, make_user, monkeypatch):
+    cache = ConversationCache(enabled=True, verify=True)
+    monkeypatch.setattr(main, "conversation_cache", cache)
+    user_id = make_user()
+    main._prepare_chat_turn(db, user_id, "Здравствуйте")
+
+    # Ответ сохранил другой воркер: в этом процессе кеш о нем не знает
+    db.add(models.ChatMessage(user_id=user_id, role="assistant", content="Добрый день", chat_type="text"))
+    db.commit()
+    messages = main._prepare_chat_turn(db, user_id, "Как дела?")
+
+    assert [m["content"] for m in messages if m["role"] != "system"] == ["Здравствуйте", "Добрый день", "Как дела?"]
+    assert cache.stats()["evictions"]["stale"] == 1
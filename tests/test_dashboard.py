@@ -0,0 +1,59 @@
+import base64
+
+import pytest
+
+from backend import models
+from backend.services import dashboard
+
+
+def _all_pages(db, limit, **filters):
+    pages, cursor = [], None
+    while True:
+        items, cursor = dashboard.query_users(db, limit=limit, cursor=cursor, **filters)
+        pages.append(items)
+        if cursor is None:
+            return pages
+
+
+def test_keyset_pages_cover_every_user_once(db, make_user):
+    # Одинаковые имена и пустое имя: порядок решает id
+    for name in ["Анна", "Анна", "Анна", "Борис", None, "Вера", "Анна", "Глеб"]:
+        make_user(name=name)
+
+    pages = _all_pages(db, limit=3)
+    ids = [item["id"] for page in pages for item in page]
+
+    assert [len(page) for page in pages] == [3, 3, 2]
+    assert len(ids) == len(set(ids)) == 8
+    expected = db.query(models.User).all()
+    expected.sort(key=lambda u: (u.name or "", u.id))
+    assert ids == [u.id for u in expected]
+
+
+def test_last_full_page_has_no_cursor(db, make_user):
+    for i in range(4):
+        make_user(name=f"Кандидат {i}")
+    items, cursor = dashboard.query_users(db, limit=4)
+    assert len(items) == 4 and cursor is None
+
+
+def test_cursor_with_filters(db, make_user):
+    for i in range(5):
+        make_user(name=f"Ан {i}", current_static_step=56 if i % 2 else 10)
+    make_user(name="Борис", current_static_step=56)
+
+    pages = _all_pages(db, limit=1, status="test_done", name_prefix="Ан")
+    names = [item["name"] for page in pages for item in page]
+    assert names == ["Ан 1", "Ан 3"]
+    assert all(item["is_test_done"] for page in pages for item in page)
+
+
+def test_cursor_round_trip_keeps_unicode():
+    cursor = dashboard.encode_cursor("Ёлкина", "id-1")
+    assert dashboard.decode_cursor(cursor) == ("Ёлкина", "id-1")
+
+
+@pytest.mark.parametrize("cursor", ["не base64", base64.urlsafe_b64encode(b"{}").decode(), "W10="])
+def test_bad_cursor_is_value_error(cursor):
+    with pytest.raises(ValueError):
+        dashboard.users_statement(limit=10, cursor=cursor)
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+
+from backend import migrations, models
+from backend.services import analytics
+
+# Схема базы до миграций (как в исходном app.db): ai_reports — один отчет на кандидата, без source
+BASELINE_SCHEMA = """
+CREATE TABLE users (id VARCHAR NOT NULL, name VARCHAR, gender VARCHAR, current_static_step INTEGER, PRIMARY KEY (id));
+CREATE TABLE static_questions (id INTEGER NOT NULL, situation VARCHAR, text VARCHAR, option_a VARCHAR, key_a VARCHAR,
+    option_b VARCHAR, key_b VARCHAR, axis VARCHAR, PRIMARY KEY (id));
+CREATE TABLE user_answers (id INTEGER NOT NULL, user_id VARCHAR, question_id INTEGER, selected_key VARCHAR,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id),
+    FOREIGN KEY(question_id) REFERENCES static_questions (id));
+CREATE TABLE chat_messages (id INTEGER NOT NULL, user_id VARCHAR, role VARCHAR, content TEXT, chat_type VARCHAR,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id));
+CREATE TABLE ai_reports (id INTEGER NOT NULL, user_id VARCHAR, mbti_type VARCHAR, e_i INTEGER, s_n INTEGER,
+    t_f INTEGER, j_p INTEGER, skill_gaps JSON, summary TEXT, PRIMARY KEY (id), UNIQUE (user_id),
+    FOREIGN KEY(user_id) REFERENCES users (id));
+"""
+
+REPORT = {"mbti_type": "INTJ", "metrics": {"E_I": 70, "S_N": 80, "T_F": 20, "J_P": 30}, "summary": "Аналитик"}
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/baseline.db")
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA.split(";"):
+            if statement.strip():
+                conn.exec_driver_sql(statement)
+        conn.execute(text("INSERT INTO users VALUES ('u1', 'Анна', 'female', 56)"))
+        # Старый POST /answers писал дубли: после миграции остается последний ответ
+        conn.execute(text("INSERT INTO user_answers (user_id, question_id, selected_key) "
+                          "VALUES ('u1', 1, 'E'), ('u1', 1, 'I'), ('u1', 2, 'S')"))
+        conn.execute(text("INSERT INTO chat_messages (user_id, role, content, chat_type, timestamp) VALUES "
+                          "('u1', 'assistant', :text_reply, 'text', '2026-01-10 10:00:00'), "
+                          "('u1', 'assistant', :voice_reply, 'voice', '2026-01-11 12:00:00')"),
+                     {"text_reply": f"Спасибо! <REPORT>{json.dumps(REPORT)}</REPORT>",
+                      "voice_reply": f"Готово. <MARIN_REPORT>{json.dumps({**REPORT, 'mbti_type': 'ENTJ'})}</MARIN_REPORT>"})
+    yield engine
+    engine.dispose()
+
+
+def _migrate(engine):
+    # Так же, как при старте приложения: сначала create_all, затем шаги схемы
+    models.Base.metadata.create_all(bind=engine)
+    return migrations.run_migrations(engine)
+
+
+def test_baseline_database_is_migrated(baseline):
+    assert _migrate(baseline) == len(migrations.MIGRATIONS)
+    assert migrations.applied_versions(baseline) == {m.version for m in migrations.MIGRATIONS}
+
+    inspector = inspect(baseline)
+    assert "source" in {c["name"] for c in inspector.get_columns("ai_reports")}
+    assert "uq_user_answers_user_question" in {i["name"] for i in inspector.get_indexes("user_answers")}
+
+    with baseline.connect() as conn:
+        answers = conn.execute(text("SELECT question_id, selected_key FROM user_answers ORDER BY question_id")).all()
+        reports = conn.execute(text("SELECT source, mbti_type, created_at FROM ai_reports ORDER BY source")).all()
+    assert [tuple(row) for row in answers] == [(1, "I"), (2, "S")]
+    # Отчеты из истории чатов, датированные репликой, а не днем миграции
+    assert [(r.source, r.mbti_type, str(r.created_at)[:10]) for r in reports] == [
+        ("text", "INTJ", "2026-01-10"), ("voice", "ENTJ", "2026-01-11")]
+
+
+def test_migrations_are_idempotent_and_summary_matches_rebuild(baseline):
+    _migrate(baseline)
+    assert _migrate(baseline) == 0
+
+    with Session(bind=baseline) as db:
+        def snapshot():
+            return (sorted((r.source, r.day, r.gender, r.mbti_type, r.candidates)
+                           for r in db.query(models.ResultTypeCount) if r.candidates),
+                    sorted((r.source, r.day, r.axis, r.bin, r.candidates, r.total, r.squares)
+                           for r in db.query(models.ResultAxisBin) if r.candidates))
+        migrated = snapshot()
+        analytics.rebuild(db)
+        db.flush()
+        assert snapshot() == migrated
+        assert ("text", "2026-01-10", "female", "INTJ", 1) in migrated[0]
+        db.rollback()
+
+
+def test_failed_step_is_rolled_back_and_stops_the_run(baseline):
+    # Старая ai_reports с данными нельзя пересоздать молча — шаг 1 падает, остальные ждут
+    with baseline.begin() as conn:
+        conn.execute(text("INSERT INTO ai_reports (user_id, mbti_type) VALUES ('u1', 'INTJ')"))
+
+    assert _migrate(baseline) == 0
+    assert migrations.applied_versions(baseline) == set()
+    assert "source" not in {c["name"] for c in inspect(baseline).get_columns("ai_reports")}
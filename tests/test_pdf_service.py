@@ -0,0 +1,59 @@
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from backend.services import pdf_service
+
+
+class BrokenExecutor:
+    """Пул, у которого убили процесс: каждая задача падает с BrokenProcessPool."""
+
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_exception(BrokenProcessPool("процесс пула завершился"))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    # Вместо процессов — потоки: новый пул должен подниматься так же, как настоящий
+    created = []
+
+    def make_pool(**kwargs):
+        created.append(ThreadPoolExecutor(max_workers=1))
+        return created[-1]
+
+    monkeypatch.setattr(pdf_service, "ProcessPoolExecutor", make_pool)
+    monkeypatch.setattr(pdf_service, "_render", lambda data: f"pdf {data['mbti_type']}".encode())
+    monkeypatch.setattr(pdf_service, "pdf_cache", pdf_service.PdfCache())
+    yield created
+    pdf_service.shutdown_executor()
+
+
+def test_broken_pool_is_recreated_and_render_retried(pool, monkeypatch):
+    broken = BrokenExecutor()
+    monkeypatch.setattr(pdf_service, "_executor", broken)
+
+    pdf = asyncio.run(pdf_service.render_pdf({"mbti_type": "INTJ"}))
+
+    assert pdf == b"pdf INTJ"
+    assert broken.shut_down
+    assert len(pool) == 1 and pdf_service._executor is pool[0]
+
+
+def test_render_uses_cache_after_first_call(pool):
+    async def scenario():
+        first = await pdf_service.render_pdf({"mbti_type": "ENFP"})
+        second = await pdf_service.render_pdf({"mbti_type": "ENFP"})
+        return first, second
+
+    assert asyncio.run(scenario()) == (b"pdf ENFP", b"pdf ENFP")
+    assert pdf_service.pdf_cache.stats()["hits"] == 1
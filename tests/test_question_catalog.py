@@ -0,0 +1,66 @@
+import gzip
+import json
+
+from backend import models
+from backend.services.question_catalog import QuestionCatalog, invalidate_catalog
+
+
+def _add_question(db, question_id, text):
+    db.add(models.StaticQuestion(id=question_id, situation="1. На совещании", text=text, option_a="А",
+                                 key_a="E", option_b="Б", key_b="I", axis="EI"))
+    db.commit()
+
+
+def test_snapshot_is_rebuilt_only_when_version_changes(db):
+    _add_question(db, 1, "Первый?")
+    invalidate_catalog(db)
+    catalog = QuestionCatalog(recheck_seconds=0)
+
+    first = catalog.get(db)
+    assert catalog.get(db) is first and catalog.builds == 1
+    assert [q["text"] for q in json.loads(first.body)] == ["Первый?"]
+    assert gzip.decompress(first.gzip_body) == first.body
+    assert first.gzip_etag != first.etag
+
+    # Вопрос добавлен без смены версии — снимок прежний, пока сид не объявит новую
+    _add_question(db, 2, "Второй?")
+    assert catalog.get(db) is first
+    invalidate_catalog(db)
+    second = catalog.get(db)
+    assert catalog.builds == 2 and second.count == 2 and second.etag != first.etag
+
+
+def test_version_is_not_rechecked_within_interval(db):
+    _add_question(db, 1, "Первый?")
+    catalog = QuestionCatalog(recheck_seconds=3600)
+    first = catalog.get(db)
+    invalidate_catalog(db)
+    assert catalog.get(db) is first
+
+
+def test_questions_endpoint_etag_and_304(monkeypatch):
+    from fastapi.testclient import TestClient
+    from backend import database, main
+    from backend.seed import seed_questions
+
+    monkeypatch.setattr(main, "STARTUP_PREWARM", set())
+    with TestClient(main.app) as client:
+        with database.SessionLocal() as session:
+            seed_questions(session)
+
+        plain = client.get("/questions", headers={"Accept-Encoding": "identity"})
+        assert plain.status_code == 200 and "Content-Encoding" not in plain.headers
+        assert len(plain.json()) == main.question_catalog.get().count
+        etag = plain.headers["ETag"]
+
+        packed = client.get("/questions", headers={"Accept-Encoding": "gzip"})
+        assert packed.headers["Content-Encoding"] == "gzip"
+        assert packed.headers["ETag"] != etag and packed.json() == plain.json()
+        assert packed.headers["Vary"] == "Accept-Encoding"
+
+        for sent, accept in ((etag, "identity"), (packed.headers["ETag"], "gzip"), (f"W/{etag}", "gzip")):
+            cached = client.get("/questions", headers={"If-None-Match": sent, "Accept-Encoding": accept})
+            assert cached.status_code == 304 and cached.content == b""
+
+        stale = client.get("/questions", headers={"If-None-Match": '"stale"', "Accept-Encoding": "identity"})
+        assert stale.status_code == 200
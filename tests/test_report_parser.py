@@ -0,0 +1,94 @@
+import json
+import random
+
+import pytest
+
+from backend.services import report_parser
+
+REPORT = {"mbti_type": "INTJ", "metrics": {"E_I": 30, "S_N": 75, "T_F": 80, "J_P": 25},
+          "summary": "Системно планирует.", "skill_gaps": ["Делегирование"]}
+LOG = "[[LOG: Axis: E_I | Value: I | Conf: 80% | Reasoning: предпочитает работать один]]"
+
+SAMPLES = [
+    "Понимаю вас. Расскажите, как вы принимаете решения?",
+    f"Хорошо. {LOG} А как вы планируете неделю?",
+    f"{LOG}{LOG} Спасибо за ответы! <REPORT>{json.dumps(REPORT, ensure_ascii=False)}</REPORT>",
+    # Отчет с двойными скобками и хвостовой запятой — JSON чинится
+    'Итог: <REPORT>{{"mbti_type": "ENFP", "metrics": {"E_I": 10,},}}</REPORT> хвост',
+    # Марина путает скобки вокруг тега
+    f"Спасибо! MARIN_REPORT>{json.dumps(REPORT)}</MARIN_REPORT",
+    "Текст с < и [[ но без тегов, [[LO и <REP в конце",
+]
+
+
+def _stream(text, cuts, hide_after_report=True):
+    parser = report_parser.StreamParser(hide_after_report=hide_after_report)
+    visible, logs, reports = [], [], []
+    for start, end in zip([0] + cuts, cuts + [len(text)]):
+        part = parser.feed(text[start:end])
+        visible.append(part.visible)
+        logs += part.logs
+        reports += part.reports
+    tail = parser.finish()
+    visible.append(tail.visible)
+    logs += tail.logs
+    reports += tail.reports
+    return "".join(visible), logs, reports, parser.result()
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+@pytest.mark.parametrize("hide_after_report", [True, False])
+def test_stream_matches_whole_parse_for_any_chunking(text, hide_after_report):
+    whole = report_parser.parse(text, hide_after_report=hide_after_report)
+    rnd = random.Random(text)
+    chunkings = [[], list(range(1, len(text)))]  # целиком и по одному символу
+    chunkings += [sorted(rnd.sample(range(1, len(text)), rnd.randint(1, len(text) // 3))) for _ in range(30)]
+    for cuts in chunkings:
+        visible, logs, reports, result = _stream(text, cuts, hide_after_report)
+        # Пробел перед отчетом поток уже отдал — итог (result) обрезает края, чанки нет
+        assert visible.strip() == whole.visible
+        assert result.visible == whole.visible
+        assert [log.raw for log in logs] == [log.raw for log in whole.logs]
+        assert [r.data for r in reports] == [r.data for r in whole.reports]
+        assert result.prefix == whole.prefix
+        assert result.report == whole.report
+
+
+def test_log_fields_and_hidden_blocks():
+    result = report_parser.parse(SAMPLES[1])
+    assert "[[LOG" not in result.visible
+    assert result.visible.startswith("Хорошо.")
+    (log,) = result.logs
+    assert (log.axis, log.value, log.confidence) == ("E_I", "I", 80)
+
+
+def test_text_report_is_hidden_and_parsed():
+    result = report_parser.parse(SAMPLES[2])
+    assert result.report == REPORT
+    assert "REPORT" not in result.visible
+    assert result.prefix == f"{LOG}{LOG} Спасибо за ответы!"
+
+
+def test_broken_report_json_is_repaired():
+    (report,) = report_parser.parse(SAMPLES[3]).reports
+    assert report.repaired
+    assert report.data["mbti_type"] == "ENFP"
+
+
+def test_marin_report_with_odd_brackets():
+    (report,) = report_parser.parse(SAMPLES[4], hide_after_report=False).reports
+    assert report.tag == report_parser.VOICE_REPORT
+    assert report.data == REPORT
+
+
+@pytest.mark.parametrize("text", [
+    '<REPORT>{ {"mbti_type": "INTJ"} }</REPORT>',
+    "<REPORT>[",
+    "MARIN_REPORT { {1: 2} } MARIN_REPORT",
+    "<REPORT>" + "[" * 100_000,
+])
+def test_unrecoverable_report_does_not_raise(text):
+    # literal_eval на таком выводе бросает TypeError/RecursionError — реплика все равно сохраняется
+    result = report_parser.parse(text)
+    assert result.report is None
+    assert len(result.reports) == 1 and result.reports[0].data is None
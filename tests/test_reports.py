@@ -0,0 +1,74 @@
+from datetime import datetime
+
+from backend import models
+from backend.services import reports
+
+
+def _report_row(db, user_id, source):
+    db.expire_all()
+    return db.query(models.AIReport).filter_by(user_id=user_id, source=source).one()
+
+
+def test_upsert_report_stores_columns_and_raw(db, make_user):
+    user_id = make_user()
+    report = {"mbti_type": "INTJ", "metrics": {"E_I": "72.6", "S_N": 40, "T_F": None, "J_P": "нет"},
+              "skill_gaps": ["делегирование"], "summary": "Итог"}
+    reports.upsert_report(db, user_id, reports.TEXT, report)
+    db.commit()
+
+    row = _report_row(db, user_id, reports.TEXT)
+    assert (row.mbti_type, row.e_i, row.s_n, row.t_f, row.j_p) == ("INTJ", 72, 40, None, None)
+    assert row.skill_gaps == ["делегирование"] and row.summary == "Итог"
+    assert row.raw == report
+
+
+def test_repeated_report_replaces_previous_one_of_the_same_source(db, make_user):
+    user_id = make_user()
+    reports.upsert_report(db, user_id, reports.TEXT, {"mbti_type": "ENTJ", "metrics": {"E_I": 20}})
+    reports.upsert_report(db, user_id, reports.VOICE, {"mbti_type": "ESTP"})
+    db.commit()
+    created_at = _report_row(db, user_id, reports.TEXT).created_at
+
+    # Кривые поля заменяются пустыми, а не ломают запись
+    reports.upsert_report(db, user_id, reports.TEXT, {"mbti_type": "INTJ", "metrics": "нет", "skill_gaps": "нет"})
+    db.commit()
+
+    row = _report_row(db, user_id, reports.TEXT)
+    assert (row.mbti_type, row.e_i, row.skill_gaps) == ("INTJ", None, None)
+    assert row.created_at == created_at
+    assert db.query(models.AIReport).filter_by(user_id=user_id).count() == 2
+    assert reports.get_reports(db, user_id) == {
+        reports.TEXT: {"mbti_type": "INTJ", "metrics": "нет", "skill_gaps": "нет"},
+        reports.VOICE: {"mbti_type": "ESTP"},
+    }
+
+
+def test_backfilled_report_keeps_the_time_of_its_message(db, make_user):
+    user_id = make_user()
+    said_at = datetime(2024, 3, 1, 12, 30)
+    reports.upsert_report(db, user_id, reports.VOICE, {"mbti_type": "ISFP"}, created_at=said_at)
+    db.commit()
+
+    assert _report_row(db, user_id, reports.VOICE).created_at == said_at
+    day = db.query(models.ResultTypeCount).filter_by(source=reports.VOICE, mbti_type="ISFP").one().day
+    assert day == "2024-03-01"
+
+
+def test_backfill_from_messages_takes_the_latest_report_per_source(db, make_user):
+    user_id = make_user()
+    db.add_all([
+        models.ChatMessage(user_id=user_id, role="assistant", chat_type="text",
+                           content='Итог <REPORT>{"mbti_type": "ENTJ"}</REPORT>', timestamp=datetime(2024, 1, 1)),
+        models.ChatMessage(user_id=user_id, role="assistant", chat_type="text",
+                           content='Итог <REPORT>{"mbti_type": "INTJ"}</REPORT>', timestamp=datetime(2024, 1, 2)),
+        # Марина иногда пишет <REPORT> — источник определяется по чату
+        models.ChatMessage(user_id=user_id, role="assistant", chat_type="voice",
+                           content='<REPORT>{"mbti_type": "ESFP"}</REPORT>', timestamp=datetime(2024, 1, 3)),
+    ])
+    db.commit()
+
+    assert reports.backfill_from_messages(db) == 2
+    db.commit()
+    assert reports.get_reports(db, user_id) == {reports.TEXT: {"mbti_type": "INTJ"},
+                                                reports.VOICE: {"mbti_type": "ESFP"}}
+    assert reports.backfill_from_messages(db, only_missing=True) == 0
@@ -0,0 +1,90 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import update
+
+from backend import database, models
+from backend.services import answers, reports, results_export
+
+SINCE = datetime(2024, 6, 1, 12, 0)
+
+
+def _stamp(db, model, user_id, updated_at):
+    db.execute(update(model).where(model.user_id == user_id).values(updated_at=updated_at))
+    db.commit()
+
+
+def _changed_candidates(db, make_user):
+    """Кандидаты с изменениями до и после SINCE: в тесте, в отчете, нигде."""
+    users = {key: make_user(key) for key in ("old", "test", "report", "untouched", "mixed")}
+    for key in ("old", "test", "mixed"):
+        answers.save_answers(db, users[key], {1: "E", 2: "N"})
+    for key in ("old", "report", "mixed"):
+        reports.upsert_report(db, users[key], reports.TEXT, {"mbti_type": "INTJ"})
+    db.commit()
+
+    before, after = SINCE - timedelta(days=1), SINCE + timedelta(minutes=1)
+    _stamp(db, models.UserAnswerVector, users["old"], before)
+    _stamp(db, models.AIReport, users["old"], before)
+    _stamp(db, models.UserAnswerVector, users["test"], after)
+    _stamp(db, models.AIReport, users["report"], SINCE)  # граница включается
+    _stamp(db, models.UserAnswerVector, users["mixed"], before)
+    _stamp(db, models.AIReport, users["mixed"], after)
+    return users
+
+
+def test_updated_since_selects_only_changed_candidates(db, make_user):
+    users = _changed_candidates(db, make_user)
+
+    everyone = db.execute(results_export.results_statement()).all()
+    assert {row.id for row in everyone} == set(users.values())
+
+    changed = db.execute(results_export.results_statement(SINCE)).all()
+    assert sorted(row.id for row in changed) == sorted(users[k] for k in ("test", "report", "mixed"))
+
+    # Время с поясом приводится к UTC базы: 15:00 MSK — это 12:00 UTC
+    msk = SINCE.replace(tzinfo=timezone.utc).astimezone(timezone(timedelta(hours=3)))
+    assert {row.id for row in db.execute(results_export.results_statement(msk))} == {row.id for row in changed}
+
+
+def test_record_takes_the_latest_change_across_sources(db, make_user):
+    users = _changed_candidates(db, make_user)
+    row = next(r for r in db.execute(results_export.results_statement(SINCE)) if r.id == users["mixed"])
+
+    record = results_export._record(row)
+    assert record["updated_at"] == str(SINCE + timedelta(minutes=1))
+    assert record["static"]["type"] == "ENTJ" and record["text"]["mbti_type"] == "INTJ"
+    assert record["voice"] is None
+
+
+def test_stream_results_filters_ndjson_and_csv():
+    models.Base.metadata.create_all(bind=database.engine)
+    with database.SessionLocal() as db:
+        users = _changed_candidates(db, _app_user_factory(db))
+
+    async def collect(fmt):
+        try:
+            return b"".join([chunk async for chunk in results_export.stream_results(fmt, SINCE, yield_per=2)])
+        finally:
+            await database.dispose_async_engines()
+
+    records = [json.loads(line) for line in asyncio.run(collect("ndjson")).decode().splitlines()]
+    expected = {users[k] for k in ("test", "report", "mixed")}
+    assert expected <= {r["user_id"] for r in records}
+    assert not {users["old"], users["untouched"]} & {r["user_id"] for r in records}
+
+    rows = list(csv.reader(io.StringIO(asyncio.run(collect("csv")).decode())))
+    assert rows[0] == results_export.CSV_COLUMNS
+    assert {r[0] for r in rows[1:]} == {r["user_id"] for r in records}
+
+
+def _app_user_factory(db):
+    def make(name="Кандидат", gender="female"):
+        user = models.User(name=name, gender=gender)
+        db.add(user)
+        db.commit()
+        return user.id
+    return make
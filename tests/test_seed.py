@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from backend import models
+from backend.seed import CHECKSUM_KEY, seed_questions
+from backend.services.question_catalog import VERSION_KEY
+
+
+def _question(text, axis="EI"):
+    return {"axis": axis, "q": text, "a": "Вариант А", "ka": axis[0], "b": "Вариант Б", "kb": axis[1]}
+
+
+def _write(path, questions, situation="1. На совещании"):
+    path.write_text(json.dumps([{"situation": situation, "questions": questions}], ensure_ascii=False),
+                    encoding="utf-8")
+    return str(path)
+
+
+def _version(db):
+    return db.get(models.AppMeta, VERSION_KEY).value
+
+
+def test_same_file_is_skipped_by_checksum(db, tmp_path):
+    path = _write(tmp_path / "questions.json", [_question("Первый?"), _question("Второй?", "SN")])
+
+    assert seed_questions(db, path) == 2
+    version = _version(db)
+    assert seed_questions(db, path) is None
+    assert _version(db) == version
+
+    # Каталог в базе неполный — та же контрольная сумма не спасает от перезаливки
+    db.delete(db.get(models.StaticQuestion, 2))
+    db.commit()
+    assert seed_questions(db, path) == 2
+    assert db.query(models.StaticQuestion).count() == 2
+    assert _version(db) != version
+
+
+def test_changed_file_updates_in_place_and_keeps_answered_questions(db, make_user, tmp_path):
+    path = tmp_path / "questions.json"
+    seed_questions(db, _write(path, [_question("Первый?"), _question("Второй?"), _question("Третий?")]))
+    db.add(models.UserAnswer(user_id=make_user(), question_id=3, selected_key="E"))
+    db.commit()
+
+    assert seed_questions(db, _write(path, [_question("Первый, исправленный?")])) == 1
+    db.expire_all()
+    assert db.get(models.StaticQuestion, 1).text == "Первый, исправленный?"
+    # Второй удален, третий остался: на него уже ответили
+    assert [q.id for q in db.query(models.StaticQuestion).order_by(models.StaticQuestion.id)] == [1, 3]
+
+
+def test_questions_stored_under_other_ids_are_refused(db, tmp_path):
+    questions = [_question("Первый?"), _question("Второй?")]
+    path = _write(tmp_path / "questions.json", questions)
+    # Как после старого fix_db.py на Postgres: те же вопросы, но id продолжили счетчик
+    for offset, q in enumerate(questions):
+        db.add(models.StaticQuestion(id=57 + offset, situation="1. На совещании", text=q["q"],
+                                     option_a=q["a"], key_a=q["ka"], option_b=q["b"], key_b=q["kb"], axis=q["axis"]))
+    db.commit()
+
+    with pytest.raises(RuntimeError, match="1 -> id 57"):
+        seed_questions(db, path)
+    # Отказ — до записи: каталог и контрольная сумма не тронуты
+    assert [q.id for q in db.query(models.StaticQuestion).order_by(models.StaticQuestion.id)] == [57, 58]
+    assert db.get(models.AppMeta, CHECKSUM_KEY) is None
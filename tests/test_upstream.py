@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from backend.services.upstream import UpstreamBusy, UpstreamScheduler
+
+
+class FakeStatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def test_concurrency_cap_and_round_robin_between_users():
+    async def scenario():
+        scheduler = UpstreamScheduler(max_concurrency=2, deadline=30)
+        order, running, peak = [], [0], [0]
+
+        async def turn(user_id):
+            async def call():
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+                await asyncio.sleep(0.01)
+                running[0] -= 1
+                return user_id
+            async with await scheduler.open("chat", user_id, call, 10) as lease:
+                order.append(lease.result)
+
+        tasks = [asyncio.create_task(turn("chatty")) for _ in range(8)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(turn(f"user{i}")) for i in range(3)]
+        await asyncio.gather(*tasks)
+        return order, peak[0], scheduler.stats()
+
+    order, peak, stats = asyncio.run(scenario())
+    assert peak == 2
+    # Остальные кандидаты не ждут все восемь реплик болтливого
+    assert max(order.index(f"user{i}") for i in range(3)) < 6
+    assert stats["in_flight"] == 0 and stats["queued"] == 0
+
+
+def test_retryable_errors_are_retried_and_client_errors_are_not():
+    async def scenario():
+        scheduler = UpstreamScheduler(max_concurrency=2, deadline=30, backoff_base=0.001)
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise FakeStatusError(500)
+            if len(attempts) == 2:
+                raise FakeStatusError(429)
+            return "ok"
+
+        lease = await scheduler.open("chat", "u1", flaky, 10)
+        lease.release()
+
+        async def bad_request():
+            raise FakeStatusError(400)
+
+        with pytest.raises(FakeStatusError):
+            await scheduler.open("chat", "u1", bad_request, 10)
+        return lease.result, len(attempts), scheduler.stats()
+
+    result, attempts, stats = asyncio.run(scenario())
+    assert (result, attempts, stats["retries"]) == ("ok", 3, 2)
+    assert stats["in_flight"] == 0
+
+
+def test_call_that_cannot_meet_the_deadline_is_shed_at_once():
+    async def scenario():
+        scheduler = UpstreamScheduler(max_concurrency=1, deadline=0.2)
+
+        async def slow():
+            await asyncio.sleep(0.5)
+
+        holder = asyncio.create_task(scheduler.open("chat", "u1", slow, 10))
+        await asyncio.sleep(0.01)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        with pytest.raises(UpstreamBusy) as busy:
+            await scheduler.open("chat", "u2", slow, 10)
+        waited = loop.time() - started
+        (await holder).release()
+        return busy.value, waited, scheduler.stats()
+
+    busy, waited, stats = asyncio.run(scenario())
+    assert busy.retry_after >= 1
+    assert waited < 0.1
+    assert stats["shed"] == 1 and stats["in_flight"] == 0
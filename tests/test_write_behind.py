@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+from sqlalchemy import exc, select
+
+from backend import database, models
+from backend.services import write_behind
+
+
+@pytest.fixture
+def app_db():
+    """Очередь пишет через database.AsyncSessionLocal — в базу из DATABASE_URL (conftest)."""
+    models.Base.metadata.create_all(bind=database.engine)
+    with database.engine.begin() as conn:
+        for table in (models.ChatMessage, models.UsageRecord):
+            conn.execute(table.__table__.delete())
+    yield database.SessionLocal()
+
+
+def _run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            # aiosqlite держит поток соединения — без dispose процесс не завершится
+            await database.dispose_async_engines()
+    return asyncio.run(main())
+
+
+def _usage(user_id, **extra):
+    return {"user_id": user_id, "channel": "text", "model": "gpt-4.1", "input_tokens": 10,
+            "cached_tokens": 0, "output_tokens": 5, "audio_input_tokens": 0,
+            "audio_output_tokens": 0, "cost": 0.001, "latency_ms": 100, **extra}
+
+
+def test_flush_writes_everything_enqueued_before_it(app_db):
+    async def scenario():
+        writer = write_behind.ChatWriteBehind(interval=0.05)
+        for i in range(5):
+            writer.enqueue("u1", "user", f"реплика {i}")
+        writer.enqueue_usage(_usage("u1"))
+        await writer.flush()
+        await writer.close()
+        return writer.stats()
+
+    stats = _run(scenario())
+    contents = app_db.scalars(select(models.ChatMessage.content).order_by(models.ChatMessage.id)).all()
+    assert contents == [f"реплика {i}" for i in range(5)]
+    assert app_db.query(models.UsageRecord).count() == 1
+    assert stats["rows_written"] == 6 and stats["errors"] == 0 and stats["rows_dropped"] == 0
+
+
+def test_bad_row_does_not_drop_the_rest_of_the_batch(app_db):
+    async def scenario():
+        writer = write_behind.ChatWriteBehind(interval=0.05)
+        writer.enqueue("u1", "user", "до сбойной строки")
+        # Значение, которое драйвер не может передать в базу, — строка падает на любой попытке
+        writer.enqueue("u2", "user", object())
+        writer.enqueue_usage(_usage("u3"))
+        writer.enqueue("u4", "assistant", "после сбойной строки")
+        await writer.flush()
+        await writer.close()
+        return writer.stats()
+
+    stats = _run(scenario())
+    contents = app_db.scalars(select(models.ChatMessage.content).order_by(models.ChatMessage.id)).all()
+    assert contents == ["до сбойной строки", "после сбойной строки"]
+    assert app_db.scalars(select(models.UsageRecord.user_id)).all() == ["u3"]
+    assert app_db.query(models.ChatMessage).filter_by(user_id="u2").count() == 0
+    assert stats["errors"] == 1
+    assert stats["rows_dropped"] == 1
+    assert stats["rows_written"] == 3
+
+
+def test_rows_survive_a_database_outage(app_db, monkeypatch):
+    monkeypatch.setattr(write_behind, "BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(write_behind, "BACKOFF_MAX", 0.02)
+    insert_batch = write_behind._insert_batch
+    failures = [0]
+
+    async def flaky_insert(batch):
+        # Первые 12 попыток база недоступна — дольше, чем прежние три повтора
+        if failures[0] < 12:
+            failures[0] += 1
+            raise exc.OperationalError("INSERT", {}, Exception("database is locked"))
+        await insert_batch(batch)
+
+    monkeypatch.setattr(write_behind, "_insert_batch", flaky_insert)
+
+    async def scenario():
+        writer = write_behind.ChatWriteBehind(interval=0.05)
+        for i in range(3):
+            writer.enqueue("u1", "user", f"реплика {i}")
+        writer.enqueue_usage(_usage("u1"))
+        await writer.flush()
+        await writer.close()
+        return writer.stats()
+
+    stats = _run(scenario())
+    contents = app_db.scalars(select(models.ChatMessage.content).order_by(models.ChatMessage.id)).all()
+    assert contents == [f"реплика {i}" for i in range(3)]
+    assert app_db.query(models.UsageRecord).count() == 1
+    assert stats["retries"] == 12
+    assert stats["rows_dropped"] == 0 and stats["errors"] == 0 and stats["rows_written"] == 4
+
+
+def test_full_queue_drops_new_rows_instead_of_growing(app_db):
+    async def scenario():
+        writer = write_behind.ChatWriteBehind(interval=0.05, max_queue=2)
+        for i in range(5):
+            writer.enqueue("u1", "user", f"реплика {i}")
+        await writer.flush()
+        await writer.close()
+        return writer.stats()
+
+    stats = _run(scenario())
+    contents = app_db.scalars(select(models.ChatMessage.content).order_by(models.ChatMessage.id)).all()
+    assert contents == ["реплика 0", "реплика 1"]
+    assert stats["rows_dropped"] == 3